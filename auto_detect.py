@@ -1,113 +1,285 @@
 # pylint: disable=redefined-outer-name,invalid-name
 
-import subprocess
+import os
 import re
+import json
+import glob
 import logging
 import math
+import tempfile
 
-def get_cpu_info(logger):
+# Everything is read from procfs and sysfs directly instead of forking lscpu and cat. All paths are
+# relative to `root`, so the detection can run against a fixture tree (see tests/fixtures/auto-detect).
 
-    data = {
-        'freq' : None,
-        'threads': None,
-        'cores': None,
-        'tdp': None,
-        'mem': None,
-        'make': None,
-        'chips': None
-    }
+CACHE_VERSION = 2 # bump when the detection changes, so cached results are detected again
 
+def host_path(root, path):
+    return os.path.join(root, path.lstrip('/'))
+
+def read_sysfs(path):
+    with open(path, 'r', encoding='UTF-8', errors='replace') as file:
+        return file.read().strip()
+
+def read_file(root, path):
+    return read_sysfs(host_path(root, path))
+
+def parse_cpu_list(cpu_list):
+    # kernel cpu list format, e.g. 0-3,8-11
+    cpus = []
+    for part in cpu_list.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def read_cpuinfo(root):
+    # one dict per processor block
+    processors = [{}]
+    with open(host_path(root, '/proc/cpuinfo'), 'r', encoding='UTF-8', errors='replace') as file:
+        for line in file:
+            if not line.strip():
+                if processors[-1]:
+                    processors.append({})
+                continue
+            key, _, value = line.partition(':')
+            processors[-1][key.strip()] = value.strip()
+    return [processor for processor in processors if processor]
+
+def read_cpu_topology(root, logger):
+    # online cpu => (physical package, core). Empty if nothing could be read
     try:
-        file_path = '/sys/class/powercap/intel-rapl/intel-rapl:0/name'
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            domain_name = file.read().strip()
-            if domain_name != 'package-0':
-                raise RuntimeError(f"Domain /sys/class/powercap/intel-rapl/intel-rapl:0/name was not package-0, but {domain_name}")
-
-        file_path = '/sys/class/powercap/intel-rapl/intel-rapl:0/constraint_0_name'
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            constraint_name = file.read().strip()
-            if constraint_name != 'long_term':
-                raise RuntimeError(f"Constraint /sys/class/powercap/intel-rapl/intel-rapl:0/constraint_0_name was not long_term, but {constraint_name}")
-
-        file_path = '/sys/class/powercap/intel-rapl/intel-rapl:0/constraint_0_max_power_uw'
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            tdp = file.read()
-            data['tdp'] = int(tdp) / 1_000_000
-
-        logger.info('Found TDP: %d W', data['tdp'])
+        cpus = {}
+        for cpu in parse_cpu_list(read_file(root, '/sys/devices/system/cpu/online')):
+            topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+            cpus[cpu] = (int(read_file(root, f"{topology}/physical_package_id")), int(read_file(root, f"{topology}/core_id")))
+        return cpus
     #pylint: disable=broad-except
     except Exception as err:
         logger.info('Exception: %s', err)
-        logger.info('Could not read RAPL powercapping info from /sys/class/powercap/intel-rapl')
+        logger.info('Could not read CPU topology from /sys/devices/system/cpu. Trying /proc/cpuinfo ...')
 
     try:
-        file_paths = {
-            1: '/sys/class/powercap/intel-rapl/intel-rapl:0/name',
-            2: '/sys/class/powercap/intel-rapl/intel-rapl:1/name',
-            3: '/sys/class/powercap/intel-rapl/intel-rapl:2/name',
-            4: '/sys/class/powercap/intel-rapl/intel-rapl:3/name',
-            5: '/sys/class/powercap/intel-rapl/intel-rapl:4/name',
-            6: '/sys/class/powercap/intel-rapl/intel-rapl:5/name',
+        return {
+            int(processor['processor']): (int(processor.get('physical id', 0)), int(processor.get('core id', processor['processor'])))
+            for processor in read_cpuinfo(root) if 'processor' in processor
         }
-        for chips, file_path in file_paths.items():
-            with open(file_path, 'r', encoding='UTF-8') as file:
-                domain_name = file.read().strip()
-                if domain_name != f"package-{chips-1}":
-                    raise RuntimeError(f"Domain {file_path} was not package-{chips-1}, but {domain_name}")
-                logger.info('Found Sockets: %d', chips)
-                data['chips'] = chips
     #pylint: disable=broad-except
     except Exception as err:
         logger.info('Exception: %s', err)
-        logger.info('Could not find (additional) chips info under file path. Most likely reached final chip. continuing ...')
+        logger.info('/proc/cpuinfo not accesible on system. Could not check for CPU topology.')
+        return {}
+
+class PowercapZone:
+
+    def __init__(self, path, control_type):
+        self.path = path
+        self.control_type = control_type
+        self.name = read_sysfs(os.path.join(path, 'name'))
+        self.subzones = []
+
+        # constraint name (long_term, short_term, peak_power) => max power in W, None if not exposed
+        self.constraints = {}
+        for name_file in sorted(glob.glob(os.path.join(path, 'constraint_*_name'))):
+            max_power_file = name_file[:-len('name')] + 'max_power_uw'
+            max_power = int(read_sysfs(max_power_file)) / 1_000_000 if os.path.exists(max_power_file) else None
+            self.constraints[read_sysfs(name_file)] = max_power
+
+        range_file = os.path.join(path, 'max_energy_range_uj')
+        self.max_energy_range_uj = int(read_sysfs(range_file)) if os.path.exists(range_file) else None
+
+    @property
+    def kind(self):
+        # package, dram, core, uncore or psys
+        return self.name.split('-')[0]
+
+    @property
+    def energy_file(self):
+        return os.path.join(self.path, 'energy_uj')
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'constraints': self.constraints,
+            'max_energy_range_uj': self.max_energy_range_uj,
+            'subzones': [subzone.as_dict() for subzone in self.subzones],
+        }
+
+class PowercapTopology:
+
+    # MSR RAPL (also used by AMD) first. intel-rapl-mmio repeats the package zones of intel-rapl
+    PREFERRED_CONTROL_TYPES = ['intel-rapl', 'intel-rapl-mmio']
+
+    def __init__(self, zones):
+        self.zones = zones
+
+    def find(self, kind):
+        return [zone for top in self.zones for zone in [top] + top.subzones if zone.kind == kind]
+
+    @property
+    def packages(self):
+        packages = self.find('package')
+        for control_type in self.PREFERRED_CONTROL_TYPES:
+            preferred = [zone for zone in packages if zone.control_type == control_type]
+            if preferred:
+                return preferred
+        return packages
+
+    def energy_zones(self):
+        # the zones whose counters add up to the measured energy, without double counting subzones
+        return self.packages + [subzone for zone in self.packages for subzone in zone.subzones if subzone.kind == 'dram']
+
+    @property
+    def chips(self):
+        return len(self.packages)
+
+    @property
+    def package_tdp(self):
+        limits = [zone.constraints.get('long_term') for zone in self.packages]
+        return max(limits) if limits and all(limits) else None
+
+    @property
+    def tdp(self):
+        limits = [zone.constraints.get('long_term') for zone in self.packages]
+        return sum(limits) if limits and all(limits) else None
+
+    def as_dict(self):
+        return {
+            'chips': self.chips,
+            'package_tdp': self.package_tdp,
+            'tdp': self.tdp,
+            'zones': [zone.as_dict() for zone in self.zones],
+        }
+
+def zone_index(path):
+    return [int(number) for number in os.path.basename(path).split(':')[1:]]
+
+def read_powercap_topology(root='/', logger=None):
+    # /sys/class/powercap holds control types (intel-rapl, intel-rapl-mmio, ...) with zones
+    # <type>:<n> and their subzones <type>:<n>:<m>. The zones are also linked flat into
+    # /sys/class/powercap, which we skip so nothing is counted twice.
+    zones = []
+    for control_path in sorted(glob.glob(host_path(root, '/sys/class/powercap/*'))):
+        control_type = os.path.basename(control_path)
+        if ':' in control_type:
+            continue
+
+        for zone_path in sorted(glob.glob(os.path.join(control_path, f"{control_type}:*")), key=zone_index):
+            try:
+                zone = PowercapZone(zone_path, control_type)
+                zone.subzones = [PowercapZone(path, control_type)
+                    for path in sorted(glob.glob(os.path.join(zone_path, f"{os.path.basename(zone_path)}:*")), key=zone_index)]
+            #pylint: disable=broad-except
+            except Exception as err:
+                if logger:
+                    logger.info('Could not read powercap zone %s: %s', zone_path, err)
+                continue
+            zones.append(zone)
 
+    return PowercapTopology(zones)
 
+def get_cpu_info(logger, root='/', cache_dir=None, refresh=False):
+    # With a cache_dir the result is stored per host and reused until the next boot (or refresh=True),
+    # so hundreds of containers starting at once do not all scan procfs and sysfs.
     try:
-        cpuinfo = subprocess.check_output('lscpu', encoding='UTF-8', errors='replace')
-        match = re.search(r'On-line CPU\(s\) list:\s*(0-)?(\d+)', cpuinfo)
-        if match:
-            data['threads'] = int(match.group(2))+1 # +1 because 0 indexed
-            logger.info('Found Threads: %d', data['threads'])
+        boot_id = read_file(root, '/proc/sys/kernel/random/boot_id')
+    #pylint: disable=broad-except
+    except Exception:
+        boot_id = None
+
+    cache_file = os.path.join(cache_dir, 'auto_detect.json') if cache_dir and boot_id else None
+
+    if cache_file and not refresh:
+        try:
+            with open(cache_file, 'r', encoding='UTF-8') as file:
+                cached = json.load(file)
+            if cached['version'] == CACHE_VERSION and cached['boot_id'] == boot_id and cached['root'] == os.path.abspath(root):
+                logger.info('Using auto detected data from %s', cache_file)
+                return cached['data']
+        #pylint: disable=broad-except
+        except Exception as err:
+            logger.info('Could not use auto detect cache %s: %s', cache_file, err)
+
+    data = detect_cpu_info(logger, root)
+
+    if cache_file:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # write to a temp file and rename, so concurrent starts never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='UTF-8') as file:
+                json.dump({'version': CACHE_VERSION, 'boot_id': boot_id, 'root': os.path.abspath(root), 'data': data}, file)
+            os.replace(tmp_path, cache_file)
+        #pylint: disable=broad-except
+        except Exception as err:
+            logger.info('Could not write auto detect cache %s: %s', cache_file, err)
+
+    return data
+
+def detect_cpu_info(logger, root='/'):
+
+    data = {
+        'freq' : None,
+        'threads': None,
+        'cores': None,
+        'tdp': None,
+        'mem': None,
+        'make': None,
+        'chips': None
+    }
+
+    topology = read_powercap_topology(root, logger)
+
+    if topology.packages:
+        data['chips'] = topology.chips
+        logger.info('Found Sockets: %d', data['chips'])
+
+        # The TDP of the training data is per chip, so the model gets the one of a package.
+        # The summed TDP of all packages is topology.tdp
+        data['tdp'] = topology.package_tdp
+        if data['tdp']:
+            logger.info('Found TDP: %d W (%d W for all packages)', data['tdp'], topology.tdp)
         else:
-            logger.info('Could not find Threads. Using default None')
+            logger.info('Could not find a long_term power limit for the packages')
+    else:
+        logger.info('Could not read RAPL powercapping info from /sys/class/powercap')
+
+    cpus = read_cpu_topology(root, logger)
+
+    if cpus:
+        data['threads'] = len(cpus)
+        logger.info('Found Threads: %d', data['threads'])
 
         # this will overwrite info we have from RAPL socket discovery, as we
-        # deem lscpu more relieable
-        match = re.search(r'Socket\(s\):\s*(\d+)', cpuinfo)
-        if match:
-            data['chips'] = int(match.group(1))
-            logger.info('Found Sockets: %d (will take precedence if not 0)', data['chips'])
-        else:
-            logger.info('Could not find Chips/Sockets via lscpu')
-
-        if data['chips']:
-            match = re.search(r'Core\(s\) per socket:\s*(\d+)', cpuinfo)
-            if match:
-                cores_per_socket = int(match.group(1))
-                data['cores'] = cores_per_socket * data['chips']
-                logger.info('Found cores: %d ', data['cores'])
-            else:
-                logger.info('Could not find Cores. Using default None')
-
-        match = re.search(r'Model name:.*@\s*([\d.]+)\s*GHz', cpuinfo)
+        # deem the CPU topology more relieable
+        data['chips'] = len({package for package, _ in cpus.values()})
+        logger.info('Found Sockets: %d (will take precedence if not 0)', data['chips'])
+
+        data['cores'] = len(set(cpus.values()))
+        logger.info('Found cores: %d ', data['cores'])
+    else:
+        logger.info('Could not find Threads, Sockets and Cores. Using default None')
+
+    try:
+        model_name = read_cpuinfo(root)[0].get('model name', '')
+
+        match = re.search(r'@\s*([\d.]+)\s*GHz', model_name)
         if match:
             data['freq'] = int(float(match.group(1))*1000)
             logger.info('Found Frequency: %s', data['freq'])
         else:
             logger.info('Could not find Frequency. Using default None')
 
-        match = re.search(r'Model name:.*Intel\(R\)', cpuinfo)
-        if match:
+        if 'Intel(R)' in model_name:
             data['make'] = 'intel'
             logger.info('Found Make: %s', data['make'])
 
-        match = re.search(r'Model name:.*AMD ', cpuinfo)
-        if match:
+        if 'AMD ' in model_name:
             data['make'] = 'amd'
             logger.info('Found Make: %s', data['make'])
 
-
         # we currently do not match for architecture, as this info is provided nowhere
 
         # we also currently do not matc for make, as this info can result in ARM which is currently not supported and
@@ -125,10 +297,9 @@ def get_cpu_info(logger):
 
     # if not data['freq']:
     #     try:
-    #         cpuinfo_proc = subprocess.check_output(['cat', '/proc/cpuinfo'], encoding='UTF-8', errors='replace', stderr=subprocess.DEVNULL)
-    #         match = re.findall(r'cpu MHz\s*:\s*([\d.]+)', cpuinfo_proc)
+    #         match = [float(cpu['cpu MHz']) for cpu in read_cpuinfo(root) if 'cpu MHz' in cpu]
     #         if match:
-    #             data['freq'] = round(max(map(float, match)))
+    #             data['freq'] = round(max(match))
     #             logger.info('Found assumend Frequency: %d', data['freq'])
     #         else:
     #             logger.info('Could not find Frequency. Using default None')
@@ -140,8 +311,8 @@ def get_cpu_info(logger):
 
 
     try:
-        meminfo = subprocess.check_output(['cat', '/proc/meminfo'], encoding='UTF-8', errors='replace', stderr=subprocess.DEVNULL)
-        match = re.search(r'MemTotal:\s*(\d+) kB', meminfo)
+        with open(host_path(root, '/proc/meminfo'), 'r', encoding='UTF-8', errors='replace') as file:
+            match = re.search(r'MemTotal:\s*(\d+) kB', file.read())
         if match:
             data['mem'] = math.ceil(int(match.group(1)) / 1024 / 1024)
             logger.info('Found Memory: %d GB', data['mem'])
@@ -155,8 +326,21 @@ def get_cpu_info(logger):
     return data
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print the auto detected machine parameters.')
+    parser.add_argument('--root', type=str, default='/', help='Read procfs and sysfs below this directory. Used for fixture trees.')
+    parser.add_argument('--cache-dir', type=str, help='Directory of the per boot cache. No caching if not given.')
+    parser.add_argument('--refresh', action='store_true', help='Ignore a cached result and detect again.')
+    parser.add_argument('--topology', action='store_true', help='Print the RAPL powercap topology as JSON instead.')
+
+    args = parser.parse_args()
+
     logger = logging.getLogger(__name__)
     logger.addHandler(logging.StreamHandler())
     logger.setLevel(logging.INFO)
 
-    print(get_cpu_info(logger))
+    if args.topology:
+        print(json.dumps(read_powercap_topology(args.root, logger).as_dict(), indent=2))
+    else:
+        print(get_cpu_info(logger, args.root, args.cache_dir, args.refresh))
@@ -0,0 +1,106 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+
+import numpy as np
+
+from power_curve import PowerCurve, POINTS, RESOLUTION
+
+# Calibrates a power curve against measured RAPL energy. For every utilization band a linear
+# correction measured = offset + scale * model is fitted online from running sums, so memory
+# does not grow with the number of samples.
+#
+# RAPL only measures the CPU packages (and DRAM), while the model predicts the whole server.
+# A calibrated curve therefore estimates the power of the measured zones.
+
+class RaplCounters:
+    # Sums the energy_uj counters of powercap zone directories and handles their wraparound
+
+    def __init__(self, zone_paths):
+        if not zone_paths:
+            raise RuntimeError('No RAPL zones to read energy from')
+
+        self.files = []
+        self.ranges = []
+        for path in zone_paths:
+            self.files.append(open(os.path.join(path, 'energy_uj'), 'rb')) # pylint: disable=consider-using-with
+            range_file = os.path.join(path, 'max_energy_range_uj')
+            with open(range_file, 'r', encoding='UTF-8') as file:
+                self.ranges.append(int(file.read()))
+
+        self.last = self.read_raw()
+
+    def read_raw(self):
+        values = []
+        for file in self.files:
+            file.seek(0) # sysfs files must be re-read from the start, reopening them is not needed
+            values.append(int(file.read()))
+        return values
+
+    def read(self):
+        # Joules since the previous read
+        current = self.read_raw()
+        microjoules = 0
+        for last, value, max_range in zip(self.last, current, self.ranges):
+            delta = value - last
+            if delta < 0: # the counter wrapped
+                delta += max_range
+            microjoules += delta
+        self.last = current
+        return microjoules / 1_000_000
+
+    def close(self):
+        for file in self.files:
+            file.close()
+
+class BandCalibration:
+
+    def __init__(self, band_width=10.0):
+        self.band_width = band_width
+        self.bands = int(np.ceil(100 / band_width))
+        # per band: n, sum x, sum y, sum xx, sum xy with x = model Watts, y = measured Watts
+        self.sums = np.zeros((self.bands, 5), dtype=np.float64)
+
+    def band(self, utilization):
+        return min(int(utilization // self.band_width), self.bands - 1)
+
+    def add(self, utilization, model_watts, measured_watts):
+        self.sums[self.band(utilization)] += (1, model_watts, measured_watts, model_watts * model_watts, model_watts * measured_watts)
+
+    def corrections(self):
+        # (offset, scale) per band. A band with a single model value (or none) can only be shifted
+        n, sum_x, sum_y, sum_xx, sum_xy = self.sums.T
+        offset = np.zeros(self.bands)
+        scale = np.ones(self.bands)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = n * sum_xx - sum_x * sum_x
+            fitted_scale = (n * sum_xy - sum_x * sum_y) / variance
+            fit = (n > 1) & (variance > 1e-9 * n * n) & (fitted_scale > 0)
+            shift = (n > 0) & ~fit
+
+            scale[fit] = fitted_scale[fit]
+            offset[fit] = (sum_y[fit] - scale[fit] * sum_x[fit]) / n[fit]
+            offset[shift] = (sum_y[shift] - sum_x[shift]) / n[shift]
+
+        return offset, scale
+
+    def apply(self, utilization, model_watts):
+        offset, scale = self.corrections()
+        band = self.band(utilization)
+        return offset[band] + scale[band] * model_watts
+
+    def calibrate(self, curve):
+        offset, scale = self.corrections()
+        utilizations = np.arange(POINTS) / RESOLUTION
+        bands = np.minimum((utilizations // self.band_width).astype(np.intp), self.bands - 1)
+        return PowerCurve(offset[bands] + scale[bands] * np.asarray(curve.values, dtype=np.float64))
+
+    def as_dict(self):
+        offset, scale = self.corrections()
+        return {
+            'band_width': self.band_width,
+            'samples': self.sums[:, 0].astype(int).tolist(),
+            'offset': offset.tolist(),
+            'scale': scale.tolist(),
+        }
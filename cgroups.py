@@ -0,0 +1,187 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+from power_curve import load_curve
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# Energy per cgroup (v2). Every tick the host utilization comes from /proc/stat and the host
+# power from the curve. The power above idle is apportioned to the cgroups by their share of the
+# busy CPU time (usage_usec in cpu.stat), the idle power is reported on its own.
+#
+# A cgroup's usage includes its children, so parents get the sum of their children (plus their own
+# processes) and only the leaves add up to the host.
+#
+# Output per tick: one ts_ns,/path/of/cgroup,joules line per cgroup that used CPU time,
+# then ts_ns,idle,joules and ts_ns,host,joules as the last line.
+
+BUFFER_SIZE = 4096
+
+def read_fd(fd):
+    # sysfs / procfs files are regenerated on every read from offset 0, no need to reopen or seek
+    return os.pread(fd, BUFFER_SIZE, 0).decode('ascii', errors='replace')
+
+def parse_usage_usec(cpu_stat):
+    for line in cpu_stat.splitlines():
+        if line.startswith('usage_usec '):
+            return int(line[len('usage_usec '):])
+    raise ValueError('cpu.stat has no usage_usec')
+
+def parse_proc_stat(proc_stat, user_hz):
+    # busy and total CPU time of all CPUs in usec
+    fields = [int(value) for value in proc_stat.split('\n', 1)[0].split()[1:]]
+    user, nice, system, idle, iowait, irq, softirq, steal = (fields + [0] * 8)[:8]
+    busy = user + nice + system + irq + softirq + steal
+    return busy * 1_000_000 // user_hz, (busy + idle + iowait) * 1_000_000 // user_hz
+
+class CgroupCollector:
+
+    def __init__(self, cgroup_root='/sys/fs/cgroup', proc_root='/', rescan_seconds=30.0):
+        self.cgroup_root = cgroup_root
+        self.rescan_seconds = rescan_seconds
+        self.user_hz = os.sysconf('SC_CLK_TCK')
+
+        self.proc_stat_fd = os.open(os.path.join(proc_root, 'proc/stat'), os.O_RDONLY)
+        self.last_busy, self.last_total = parse_proc_stat(read_fd(self.proc_stat_fd), self.user_hz)
+
+        self.names = []
+        self.fds = []
+        self.last_usage = np.empty(0, dtype=np.int64)
+        self.last_scan = None
+        self.scan()
+
+    def scan(self):
+        # Only opens cgroups that appeared since the last scan, existing descriptors are kept
+        known = set(self.names)
+        names, fds, usages = [], [], []
+        for directory, _, files in os.walk(self.cgroup_root):
+            if 'cpu.stat' not in files:
+                continue
+            relative = os.path.relpath(directory, self.cgroup_root)
+            name = '/' if relative == '.' else '/' + relative.replace(os.sep, '/')
+            if name in known:
+                continue
+            try:
+                fd = os.open(os.path.join(directory, 'cpu.stat'), os.O_RDONLY)
+                usages.append(parse_usage_usec(read_fd(fd)))
+            except (OSError, ValueError): # removed while we were walking
+                continue
+            names.append(name)
+            fds.append(fd)
+
+        if names:
+            logger.info('Found %d new cgroups', len(names))
+        self.names.extend(names)
+        self.fds.extend(fds)
+        self.last_usage = np.concatenate([self.last_usage, np.asarray(usages, dtype=np.int64)])
+        self.last_scan = time.monotonic()
+
+    def close(self, removed):
+        for index in sorted(removed, reverse=True):
+            os.close(self.fds[index])
+            del self.names[index]
+            del self.fds[index]
+        self.last_usage = np.delete(self.last_usage, removed)
+
+    def read(self):
+        # Returns the host utilization in percent, the busy CPU time in usec and the usage of
+        # every cgroup in usec, all since the previous read
+        busy, total = parse_proc_stat(read_fd(self.proc_stat_fd), self.user_hz)
+        busy_delta, total_delta = busy - self.last_busy, total - self.last_total
+        self.last_busy, self.last_total = busy, total
+
+        usage = np.empty(len(self.fds), dtype=np.int64)
+        removed = []
+        for index, fd in enumerate(self.fds):
+            try:
+                usage[index] = parse_usage_usec(read_fd(fd))
+            except (OSError, ValueError): # the cgroup is gone
+                usage[index] = self.last_usage[index]
+                removed.append(index)
+
+        usage_delta = np.maximum(usage - self.last_usage, 0)
+        self.last_usage = usage
+        names = list(self.names)
+
+        if removed:
+            self.close(removed)
+        if time.monotonic() - self.last_scan >= self.rescan_seconds:
+            self.scan()
+
+        utilization = min(max(100 * busy_delta / total_delta, 0.0), 100.0) if total_delta > 0 else 0.0
+        return utilization, busy_delta, names, usage_delta
+
+def apportion(host_joules, idle_joules, busy_usec, usage_usec):
+    # the power above idle by share of the busy time. Clipped, as cpu.stat and /proc/stat are not read atomically
+    if busy_usec <= 0:
+        return np.zeros(len(usage_usec))
+    return (host_joules - idle_joules) * np.minimum(usage_usec / busy_usec, 1.0)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Attribute the estimated host energy to cgroups (v2).')
+
+    parser.add_argument('--curve-file', type=str, required=True, help='Power curve of this machine written by xgb.py --export-curve.')
+    parser.add_argument('--cgroup-root', type=str, default='/sys/fs/cgroup', help='cgroup v2 mount or a subtree of it.')
+    parser.add_argument('--proc-root', type=str, default='/', help='Directory that holds proc/stat. Used for fixture trees.')
+    parser.add_argument('--vhost-ratio', type=float, default=1.0, help='Virtualization ratio of the system.')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between ticks.')
+    parser.add_argument('--ticks-from-stdin',
+        action='store_true',
+        help='Tick on every line on STDIN instead of every --interval. A line can hold the ts_ns of the tick.'
+    )
+    parser.add_argument('--rescan-seconds', type=float, default=30.0, help='Seconds between scans for new cgroups.')
+    parser.add_argument('--silent', action='store_true', help='Will suppress all debug output.')
+
+    args = parser.parse_args()
+
+    if args.silent:
+        logger.setLevel(logging.WARNING)
+
+    curve, _ = load_curve(args.curve_file)
+    idle_watts = curve[0] * args.vhost_ratio
+
+    collector = CgroupCollector(args.cgroup_root, args.proc_root, args.rescan_seconds)
+    logger.info('Watching %d cgroups below %s', len(collector.names), args.cgroup_root)
+
+    def ticks():
+        if args.ticks_from_stdin:
+            for line in sys.stdin:
+                yield int(line) if line.strip() else time.monotonic_ns()
+        else:
+            while True:
+                time.sleep(args.interval)
+                yield time.monotonic_ns()
+
+    # with ticks from STDIN the first tick only sets the start (and answers with 0 J), as its
+    # timestamp can be of any clock
+    last_time = None if args.ticks_from_stdin else time.monotonic_ns()
+    try:
+        for timestamp in ticks():
+            utilization, busy_usec, names, usage_usec = collector.read()
+            if last_time is None:
+                last_time = timestamp
+                usage_usec[:] = 0
+
+            seconds = (timestamp - last_time) / 1_000_000_000
+            last_time = timestamp
+
+            host_joules = curve[utilization] * args.vhost_ratio * seconds
+            idle_joules = idle_watts * seconds
+            joules = apportion(host_joules, idle_joules, busy_usec, usage_usec)
+
+            lines = [f"{timestamp},{names[index]},{joules[index]}" for index in np.flatnonzero(usage_usec)]
+            lines.append(f"{timestamp},idle,{idle_joules}")
+            lines.append(f"{timestamp},host,{host_joules}")
+            print('\n'.join(lines), flush=True)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,249 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import json
+import stat
+import logging
+import threading
+from collections import OrderedDict
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import xgb
+from power_curve import load_curve
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+class CurveStore:
+
+    def __init__(self, model_cache=None, max_curves=256):
+        self.model_cache = model_cache
+        self.max_curves = max_curves
+        self.curves = OrderedDict() # profile => curve, least recently used first
+        self.named = {}
+        self.lock = threading.Lock() # only held for dict operations, never while training
+        self.building = {} # profile => lock held while its curve is trained
+
+    def add_file(self, name, file_path):
+        self.named[name], metadata = load_curve(file_path)
+        logger.info('Loaded curve %s from %s. It was built for: %s', name, file_path, metadata['profile'])
+
+    def get(self, profile):
+        if isinstance(profile, str):
+            if profile not in self.named:
+                raise KeyError(f"Unknown curve {profile}. Loaded are: {sorted(self.named)}")
+            return self.named[profile]
+        if profile is not None and not isinstance(profile, dict):
+            raise ValueError(f"profile must be an object or the name of a curve, but was {profile!r}")
+
+        profile = {key.replace('-', '_'): val for key, val in (profile or {}).items()}
+        unknown = set(profile) - set(xgb.PROFILE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown profile fields {sorted(unknown)}. Allowed are {xgb.PROFILE_FIELDS}")
+
+        key = json.dumps(profile, sort_keys=True)
+        curve = self.lookup(key)
+        if curve is not None:
+            return curve
+
+        # Concurrent requests for the same new profile wait for one training. All others,
+        # including the ones for cached curves, go on
+        with self.lock:
+            building = self.building.setdefault(key, threading.Lock())
+        try:
+            with building:
+                curve = self.lookup(key)
+                if curve is None:
+                    logger.info('Building curve for profile %s', profile)
+                    Z = xgb.make_feature_frame(profile)
+                    model = xgb.train_model(profile.get('cpu_chips'), Z, self.model_cache)
+                    curve = xgb.interpolate_predictions(xgb.infer_predictions(model, Z))
+                    self.insert(key, curve)
+                return curve
+        finally:
+            with self.lock:
+                if self.building.get(key) is building:
+                    del self.building[key]
+
+    def lookup(self, key):
+        with self.lock:
+            curve = self.curves.get(key)
+            if curve is not None:
+                self.curves.move_to_end(key)
+            return curve
+
+    def insert(self, key, curve):
+        with self.lock:
+            self.curves[key] = curve
+            while len(self.curves) > self.max_curves:
+                evicted, _ = self.curves.popitem(last=False)
+                logger.info('Evicted curve for profile %s', evicted)
+
+def estimate(store, request):
+    # request: {"profile": {...} or "curve name", "utilization": float or [floats],
+    #           "vhost_ratio": float, "interval": seconds per sample (switches to Joules)}
+    if not isinstance(request, dict):
+        raise ValueError(f"A request must be a JSON object, but was {request!r}")
+
+    curve = store.get(request.get('profile'))
+
+    # null, NaN and Infinity would not be valid JSON in the answer
+    utilization = np.asarray(request['utilization'], dtype=np.float64)
+    if not np.isfinite(utilization).all():
+        raise ValueError(f"utilization must be a number or a list of numbers, but was {request['utilization']!r}")
+    watts = curve.lookup(utilization) * float(request.get('vhost_ratio') or 1.0)
+
+    result = {'watts': watts.tolist()}
+    if request.get('interval') is not None:
+        interval = np.asarray(request['interval'], dtype=np.float64)
+        if not np.isfinite(interval).all():
+            raise ValueError(f"interval must be a number or a list of numbers, but was {request['interval']!r}")
+        result['joules'] = (watts * interval).tolist()
+    return result
+
+class EstimationHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1' # keep-alive, so reporters can reuse one connection
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return 'unix-socket'
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'curves': len(self.server.store.curves), 'named': sorted(self.server.store.named)})
+        else:
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+
+            if self.path == '/estimate':
+                self.send_json(200, estimate(self.server.store, request))
+            elif self.path == '/estimate/batch':
+                # one broken item must not fail the whole batch
+                if not isinstance(request, dict) or not isinstance(request.get('requests'), list):
+                    raise ValueError('A batch must be a JSON object with a list of requests')
+                results = []
+                for item in request['requests']:
+                    try:
+                        results.append(estimate(self.server.store, item))
+                    except (ValueError, KeyError, TypeError, RuntimeError) as err:
+                        results.append({'error': str(err)})
+                self.send_json(200, {'results': results})
+            else:
+                self.send_json(404, {'error': f"Unknown path {self.path}"})
+        except (ValueError, KeyError, TypeError) as err:
+            self.send_json(400, {'error': str(err)})
+        except RuntimeError as err: # e.g. no training data for the requested chips
+            self.send_json(422, {'error': str(err)})
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def remove_socket(socket_path):
+    # e.g. left behind by a killed daemon. Anything else at the path (a mistyped --socket) is never removed
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError(f"{socket_path} exists and is not a socket. Refusing to replace it")
+    os.remove(socket_path)
+
+def make_server(store, port=None, host='127.0.0.1', socket_path=None):
+    if socket_path:
+        remove_socket(socket_path)
+        server = UnixHTTPServer(socket_path, EstimationHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), EstimationHandler)
+    server.store = store
+    return server
+
+if __name__ == '__main__':
+    import signal
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve power estimations over HTTP and / or a Unix domain socket.')
+
+    parser.add_argument('--port', type=int, help='TCP port to listen on.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind the TCP port to.')
+    parser.add_argument('--socket', type=str, help='Path of a Unix domain socket to listen on.')
+    parser.add_argument('--curve-file',
+        action='append',
+        default=[],
+        help='NAME=PATH of a curve written by xgb.py --export-curve. Requests can then use "profile": "NAME". Can be repeated.'
+    )
+    parser.add_argument('--model-cache-dir', type=str, help='Directory for the trained model cache.')
+    parser.add_argument('--no-model-cache', action='store_true', help='Always retrain the models and do not touch the cache.')
+    parser.add_argument('--max-curves', type=int, default=256, help='Curves of profiles kept in memory. The least recently used one is dropped first.')
+    parser.add_argument('--silent', action='store_true', help='Will suppress all debug output.')
+
+    args = parser.parse_args()
+
+    if not args.port and not args.socket:
+        parser.error('at least one of --port or --socket is required')
+
+    if args.silent:
+        xgb.set_silent()
+        logger.setLevel(logging.WARNING)
+
+    model_cache = None
+    if not args.no_model_cache:
+        from model_cache import ModelCache, default_cache_dir
+        model_cache = ModelCache(args.model_cache_dir or default_cache_dir(), logger)
+
+    store = CurveStore(model_cache, args.max_curves)
+    for curve_file in args.curve_file:
+        name, _, path = curve_file.partition('=')
+        if not path:
+            parser.error(f"--curve-file must be NAME=PATH, but was {curve_file}")
+        store.add_file(name, path)
+
+    servers = []
+    if args.port:
+        servers.append(make_server(store, port=args.port, host=args.host))
+        logger.info('Listening on http://%s:%d', args.host, args.port)
+    if args.socket:
+        try:
+            servers.append(make_server(store, socket_path=args.socket))
+        except RuntimeError as err:
+            parser.error(str(err))
+        logger.info('Listening on unix socket %s', args.socket)
+
+    for server in servers[1:]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    # e.g. kill or systemctl stop. Handled like Ctrl-C, so the socket is removed below and the next start does not find a stale one
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        servers[0].serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.server_close()
+        if args.socket:
+            remove_socket(args.socket)
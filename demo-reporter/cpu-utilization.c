@@ -1,10 +1,18 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <errno.h>
+#include <fcntl.h>
+#include <stdint.h>
 #include <unistd.h>
-#include <sys/time.h>
 #include <time.h>
 
+// Built with -DCLOUD_ENERGY_CURVE='"curve.h"' (a header written by xgb.py --dump-c-header) the
+// reporter can output Watts (-w) or Joules (-j) itself, without Python at runtime.
+#ifdef CLOUD_ENERGY_CURVE
+#include CLOUD_ENERGY_CURVE
+#endif
+
 typedef struct procfs_time_t { // struct is a specification and this static makes no sense here
     unsigned long user_time;
     unsigned long nice_time;
@@ -26,24 +34,60 @@ typedef struct procfs_time_t { // struct is a specification and this static make
 // TODO: If this code ever gets multi-threaded please review this assumption to
 // not pollute another threads state
 static long int user_hz;
-static unsigned int msleep_time=1000;
+static double msleep_time=1000;
+
+// /proc/stat stays open and is read from offset 0 with pread. procfs regenerates the file on
+// every read, so neither reopening nor seeking is needed.
+static int proc_stat_fd = -1;
+static char* proc_stat_buffer = NULL;
+static size_t proc_stat_buffer_size = 0;
 
-static void read_cpu_proc(procfs_time_t* procfs_time_struct) {
+static int cpu_count = 0; // number of per CPU columns, highest CPU number + 1 at startup
 
-    FILE* fd = NULL;
+static int show_timestamp = 0;
+static clockid_t timestamp_clock = CLOCK_MONOTONIC;
+static int per_cpu = 0;
+static unsigned int batch_size = 0; // samples per binary frame, 0 is text output
+static int float_bits = 32;
+static int output_energy = 0; // 0: utilization, 1: Watts, 2: Joules of the interval
 
-    fd = fopen("/proc/stat", "r");
-    if ( fd == NULL) {
-        fprintf(stderr, "Error - file %s failed to open: errno: %d\n", "/proc/stat/", errno);
+static void open_cpu_proc() {
+    proc_stat_fd = open("/proc/stat", O_RDONLY);
+    if (proc_stat_fd == -1) {
+        fprintf(stderr, "Error - file %s failed to open: errno: %d\n", "/proc/stat", errno);
         exit(1);
     }
 
-    fscanf(fd, "cpu %ld %ld %ld %ld %ld %ld %ld %ld %ld", &procfs_time_struct->user_time, &procfs_time_struct->nice_time, &procfs_time_struct->system_time, &procfs_time_struct->wait_time, &procfs_time_struct->iowait_time, &procfs_time_struct->irq_time, &procfs_time_struct->softirq_time, &procfs_time_struct->steal_time, &procfs_time_struct->guest_time);
+    // the cpu lines are at the top of the file, ~ 100 bytes each
+    long configured_cpus = sysconf(_SC_NPROCESSORS_CONF);
+    if (configured_cpus < 1) configured_cpus = 1;
+    proc_stat_buffer_size = 4096 + (size_t)configured_cpus * 128;
+    proc_stat_buffer = malloc(proc_stat_buffer_size);
+    if (proc_stat_buffer == NULL) {
+        fprintf(stderr, "Error - could not allocate %zu bytes\n", proc_stat_buffer_size);
+        exit(1);
+    }
+}
 
-    // debug
-    // printf("Read: cpu %ld %ld %ld %ld %ld %ld %ld %ld %ld\n", procfs_time_struct->user_time, procfs_time_struct->nice_time, procfs_time_struct->system_time, procfs_time_struct->idle_time, procfs_time_struct->iowait_time, procfs_time_struct->irq_time, procfs_time_struct->softirq_time, procfs_time_struct->steal_time, procfs_time_struct->guest_time);
+static size_t pread_cpu_proc() {
+    ssize_t length = pread(proc_stat_fd, proc_stat_buffer, proc_stat_buffer_size - 1, 0);
+    if (length <= 0) {
+        fprintf(stderr, "Error - file %s failed to read: errno: %d\n", "/proc/stat", errno);
+        exit(1);
+    }
+    proc_stat_buffer[length] = '\0';
+    return (size_t)length;
+}
 
-    fclose(fd);
+static char* parse_cpu_line(char* line, procfs_time_t* procfs_time_struct) {
+    // line points behind the "cpu" / "cpuN" label. Returns the start of the next line
+    unsigned long* fields[] = {&procfs_time_struct->user_time, &procfs_time_struct->nice_time, &procfs_time_struct->system_time, &procfs_time_struct->wait_time, &procfs_time_struct->iowait_time, &procfs_time_struct->irq_time, &procfs_time_struct->softirq_time, &procfs_time_struct->steal_time, &procfs_time_struct->guest_time};
+    char* end;
+
+    for (size_t i = 0; i < sizeof(fields) / sizeof(fields[0]); i++) {
+        *fields[i] = strtoul(line, &end, 10);
+        line = end;
+    }
 
     // after this multiplication we are on microseconds
     // integer division is deliberately, cause we don't loose precision as *1000000 is done before
@@ -52,39 +96,196 @@ static void read_cpu_proc(procfs_time_t* procfs_time_struct) {
     // in /proc/stat nice time is NOT included in the user time! (it is in cgroups however though)
     procfs_time_struct->compute_time = procfs_time_struct->user_time + procfs_time_struct->system_time + procfs_time_struct->nice_time;
 
+    end = strchr(line, '\n');
+    return end == NULL ? line + strlen(line) : end + 1;
 }
 
+static void read_cpu_proc(procfs_time_t* procfs_time_struct, procfs_time_t* per_cpu_structs) {
+    // fills the aggregate and, if per_cpu_structs is given, every CPU. CPUs that are offline
+    // are missing from /proc/stat and keep their previous values
+    pread_cpu_proc();
 
-static int output_stats(int show_diff_time) {
-    long int idle_reading, compute_time_reading;
-    procfs_time_t main_cpu_reading_before;
-    procfs_time_t main_cpu_reading_after;
-    struct timeval start, end;
-
-    gettimeofday(&start, NULL);
-    read_cpu_proc(&main_cpu_reading_before);
+    char* line = proc_stat_buffer;
+    while (strncmp(line, "cpu", 3) == 0) {
+        if (line[3] == ' ') {
+            line = parse_cpu_line(line + 3, procfs_time_struct);
+            if (per_cpu_structs == NULL) return;
+        } else {
+            char* end;
+            long cpu = strtol(line + 3, &end, 10);
+            if (cpu >= 0 && cpu < cpu_count) {
+                line = parse_cpu_line(end, &per_cpu_structs[cpu]);
+            } else { // came online after startup
+                line = strchr(line, '\n');
+                if (line == NULL) return;
+                line++;
+            }
+        }
+    }
+}
 
-    usleep(msleep_time * 1000);
+static int count_cpus() {
+    int highest = -1;
+    pread_cpu_proc();
 
-    gettimeofday(&end, NULL);
-    read_cpu_proc(&main_cpu_reading_after);
+    char* line = proc_stat_buffer;
+    while (strncmp(line, "cpu", 3) == 0) {
+        if (line[3] != ' ') {
+            int cpu = atoi(line + 3);
+            if (cpu > highest) highest = cpu;
+        }
+        line = strchr(line, '\n');
+        if (line == NULL) break;
+        line++;
+    }
+    return highest + 1;
+}
 
-    // Calculate actual sleep duration in seconds (as double)
-    double slept_time = (end.tv_sec - start.tv_sec) + (end.tv_usec - start.tv_usec) / 1.0e6;
+static double utilization(procfs_time_t* before, procfs_time_t* after) {
+    long int idle_reading = after->idle_time - before->idle_time;
+    long int compute_time_reading = after->compute_time - before->compute_time;
 
-    idle_reading = main_cpu_reading_after.idle_time - main_cpu_reading_before.idle_time;
-    compute_time_reading = main_cpu_reading_after.compute_time - main_cpu_reading_before.compute_time;
+    if (compute_time_reading + idle_reading == 0) return 0.0; // no tick on this CPU, e.g. when sampling faster than user_hz
 
     double output = 100.0 * (double)compute_time_reading / (compute_time_reading + idle_reading);
     if (output < 0.0) output = 0.0;
     if (output > 100.0) output = 100.0;
+    return output;
+}
+
+static double convert(double utilization, double seconds) {
+#ifdef CLOUD_ENERGY_CURVE
+    if (output_energy == 1) return cloud_energy_watts(utilization);
+    if (output_energy == 2) return cloud_energy_joules(utilization, seconds);
+#endif
+    (void)seconds;
+    return utilization;
+}
+
+static uint64_t now_ns(clockid_t clock) {
+    struct timespec ts;
+    clock_gettime(clock, &ts);
+    return (uint64_t)ts.tv_sec * 1000000000ull + (uint64_t)ts.tv_nsec;
+}
+
+static void write_all(const char* data, size_t length) {
+    // one write per line or frame. stdout is not used, so nothing is buffered in between
+    while (length > 0) {
+        ssize_t written = write(STDOUT_FILENO, data, length);
+        if (written == -1) {
+            if (errno == EINTR) continue;
+            exit(errno == EPIPE ? 0 : 1);
+        }
+        data += written;
+        length -= (size_t)written;
+    }
+}
 
-    if (show_diff_time == 1) {
-        printf("%.6f %.2f\n", slept_time, output);  // Print sleep time and utilization
+static void put_le(unsigned char* destination, uint64_t value, int bytes) {
+    // the binary formats are little-endian regardless of the host
+    for (int i = 0; i < bytes; i++) {
+        destination[i] = (unsigned char)(value >> (8 * i));
+    }
+}
+
+static void add_to_frame(unsigned char* frame, unsigned int index, double value) {
+    unsigned char* destination = frame + 4 + (size_t)index * (float_bits / 8);
+    if (float_bits == 32) {
+        float single = (float)value;
+        uint32_t bits;
+        memcpy(&bits, &single, sizeof(bits));
+        put_le(destination, bits, 4);
     } else {
-        printf("%.2f\n", output);  // Print  utilization only
+        uint64_t bits;
+        memcpy(&bits, &value, sizeof(bits));
+        put_le(destination, bits, 8);
+    }
+}
+
+static void sleep_until(struct timespec* deadline) {
+    // absolute deadlines, so the time spent reading and writing does not add up to a drift
+    uint64_t interval_ns = (uint64_t)(msleep_time * 1000000.0);
+    uint64_t deadline_ns = (uint64_t)deadline->tv_sec * 1000000000ull + (uint64_t)deadline->tv_nsec + interval_ns;
+
+    uint64_t current_ns = now_ns(CLOCK_MONOTONIC);
+    if (current_ns > deadline_ns + interval_ns) {
+        deadline_ns = current_ns; // fell more than one interval behind (e.g. suspended), do not catch up with a burst
+    }
+
+    deadline->tv_sec = (time_t)(deadline_ns / 1000000000ull);
+    deadline->tv_nsec = (long)(deadline_ns % 1000000000ull);
+    while (clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, deadline, NULL) == EINTR);
+}
+
+static void output_stats(int show_diff_time) {
+    procfs_time_t main_cpu_reading_before, main_cpu_reading_after;
+    procfs_time_t *per_cpu_before = NULL, *per_cpu_after = NULL;
+    struct timespec deadline;
+
+    if (per_cpu) {
+        per_cpu_before = calloc((size_t)cpu_count, sizeof(procfs_time_t));
+        per_cpu_after = calloc((size_t)cpu_count, sizeof(procfs_time_t));
+    }
+
+    // a line holds the timestamp and every CPU with up to 7 characters each ("100.00,")
+    size_t line_size = 64 + (size_t)(per_cpu ? cpu_count : 1) * 8;
+    char* line = malloc(line_size);
+
+    size_t frame_size = batch_size ? 4 + (size_t)batch_size * (float_bits / 8) : 0;
+    unsigned char* frame = batch_size ? malloc(frame_size) : NULL;
+    unsigned int samples_in_frame = 0;
+
+    if (line == NULL || (per_cpu && (per_cpu_before == NULL || per_cpu_after == NULL)) || (batch_size && frame == NULL)) {
+        fprintf(stderr, "Error - could not allocate the output buffers\n");
+        exit(1);
+    }
+
+    clock_gettime(CLOCK_MONOTONIC, &deadline);
+    uint64_t last_ns = now_ns(CLOCK_MONOTONIC);
+    read_cpu_proc(&main_cpu_reading_before, per_cpu_before);
+
+    while (1) {
+        sleep_until(&deadline);
+
+        uint64_t current_ns = now_ns(CLOCK_MONOTONIC);
+        read_cpu_proc(&main_cpu_reading_after, per_cpu_after);
+        double output = convert(utilization(&main_cpu_reading_before, &main_cpu_reading_after), (current_ns - last_ns) / 1.0e9);
+
+        if (batch_size) {
+            add_to_frame(frame, samples_in_frame++, output);
+            if (samples_in_frame == batch_size) {
+                put_le(frame, batch_size, 4);
+                write_all((char*)frame, frame_size);
+                samples_in_frame = 0;
+            }
+        } else {
+            int length = 0;
+            if (show_diff_time == 1) {
+                // Calculate actual sleep duration in seconds (as double)
+                length += snprintf(line + length, line_size - length, "%.6f ", (current_ns - last_ns) / 1.0e9);
+            }
+            if (show_timestamp) {
+                length += snprintf(line + length, line_size - length, "%llu,", (unsigned long long)(timestamp_clock == CLOCK_MONOTONIC ? current_ns : now_ns(timestamp_clock)));
+            }
+            if (per_cpu) {
+                for (int cpu = 0; cpu < cpu_count; cpu++) {
+                    length += snprintf(line + length, line_size - length, cpu ? ",%.2f" : "%.2f", utilization(&per_cpu_before[cpu], &per_cpu_after[cpu]));
+                }
+                length += snprintf(line + length, line_size - length, "\n");
+            } else {
+                length += snprintf(line + length, line_size - length, output_energy ? "%.6f\n" : "%.2f\n", output);
+            }
+            write_all(line, (size_t)length);
+        }
+
+        main_cpu_reading_before = main_cpu_reading_after;
+        if (per_cpu) {
+            procfs_time_t* swap = per_cpu_before;
+            per_cpu_before = per_cpu_after;
+            per_cpu_after = swap;
+        }
+        last_ns = current_ns;
     }
-    return 1;
 }
 
 
@@ -93,16 +294,22 @@ int main(int argc, char **argv) {
     int c;
     int show_diff_time = 0;
 
-    setvbuf(stdout, NULL, _IONBF, 0);
     user_hz = sysconf(_SC_CLK_TCK);
 
-    while ((c = getopt (argc, argv, "i:hx")) != -1) {
+    while ((c = getopt (argc, argv, "i:hxtrpb:f:wj")) != -1) {
         switch (c) {
         case 'h':
-            printf("Usage: %s [-i msleep_time] [-h]\n\n",argv[0]);
+            printf("Usage: %s [-i msleep_time] [-x] [-t] [-r] [-p] [-b samples] [-f 32|64] [-w|-j] [-h]\n\n",argv[0]);
             printf("\t-h      : displays this help\n");
-            printf("\t-i      : specifies the milliseconds sleep time that will be slept between measurements\n\n");
+            printf("\t-i      : specifies the milliseconds sleep time that will be slept between measurements. Fractions like 0.5 are allowed\n\n");
             printf("\t-x      : show diff time before utilization\n\n");
+            printf("\t-t      : start every line with a nanosecond timestamp (ts_ns,utilization), like xgb.py --input-format timestamped\n");
+            printf("\t-r      : take the timestamps of -t from the realtime clock instead of the monotonic clock\n");
+            printf("\t-p      : output the utilization of every CPU, comma separated, like xgb.py --input-format percpu\n");
+            printf("\t-b      : write binary frames of this many samples, like xgb.py --input-format binary32 / binary64\n");
+            printf("\t-f      : float size of the binary frames, 32 (default) or 64\n");
+            printf("\t-w      : output Watts instead of utilization. Needs a build with -DCLOUD_ENERGY_CURVE\n");
+            printf("\t-j      : output the Joules of every interval instead of utilization. Needs a build with -DCLOUD_ENERGY_CURVE\n\n");
 
             struct timespec res;
             double resolution;
@@ -115,20 +322,71 @@ int main(int argc, char **argv) {
             printf("\tCLOCKS_PER_SEC\t%ld\n", CLOCKS_PER_SEC);
             exit(0);
         case 'i':
-            msleep_time = atoi(optarg);
+            msleep_time = atof(optarg);
             break;
         case 'x':
             show_diff_time = 1;
             break;
+        case 't':
+            show_timestamp = 1;
+            break;
+        case 'r':
+            timestamp_clock = CLOCK_REALTIME;
+            break;
+        case 'p':
+            per_cpu = 1;
+            break;
+        case 'b':
+            batch_size = (unsigned int)atoi(optarg);
+            break;
+        case 'f':
+            float_bits = atoi(optarg);
+            break;
+        case 'w':
+            output_energy = 1;
+            break;
+        case 'j':
+            output_energy = 2;
+            break;
         default:
             fprintf(stderr,"Unknown option %c\n",c);
             exit(-1);
         }
     }
 
-    while(1) {
-        output_stats(show_diff_time);
+    if (msleep_time <= 0) {
+        fprintf(stderr, "Error - the sleep time must be positive\n");
+        exit(-1);
+    }
+    if (float_bits != 32 && float_bits != 64) {
+        fprintf(stderr, "Error - -f must be 32 or 64\n");
+        exit(-1);
+    }
+#ifndef CLOUD_ENERGY_CURVE
+    if (output_energy) {
+        fprintf(stderr, "Error - -w and -j need a build with -DCLOUD_ENERGY_CURVE='\"curve.h\"'\n");
+        exit(-1);
+    }
+#endif
+    if (output_energy && per_cpu) {
+        fprintf(stderr, "Error - -w and -j cannot be combined with -p\n");
+        exit(-1);
+    }
+    if (batch_size && (show_timestamp || per_cpu || show_diff_time)) {
+        fprintf(stderr, "Error - binary frames (-b) hold one value per sample and cannot be combined with -t, -p or -x\n");
+        exit(-1);
+    }
+    if (show_diff_time && (show_timestamp || per_cpu)) {
+        fprintf(stderr, "Error - -x cannot be combined with -t or -p\n");
+        exit(-1);
+    }
+
+    open_cpu_proc();
+    if (per_cpu) {
+        cpu_count = count_cpus();
     }
 
+    output_stats(show_diff_time);
+
     return 0;
-}
\ No newline at end of file
+}
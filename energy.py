@@ -0,0 +1,131 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+# Energy integration over explicit timestamps (in ns), instead of the time at which a
+# sample happens to arrive on STDIN. Rules:
+#
+#   step       a sample's Watts hold for the interval since the previous sample. This is how
+#              utilization tools report: cpu_percent(interval) describes the interval that just ended
+#   trapezoid  the mean of the Watts of both ends of the interval
+#
+# The first sample has no interval yet and integrates to 0 Joules, unless a start time is given.
+RULES = ['step', 'trapezoid']
+
+class EnergyIntegrator:
+
+    def __init__(self, rule='step', start_ns=None):
+        if rule not in RULES:
+            raise ValueError(f"Unknown integration rule {rule}. Allowed are {RULES}")
+        self.rule = rule
+        self.last_time = start_ns
+        self.last_watts = None
+        self.joules = 0.0
+
+    def add(self, timestamp_ns, watts):
+        # returns the Joules of the interval ending at this sample
+        if self.last_time is None:
+            joules = watts * 0.0 # keeps the shape if watts is an array of CPUs
+        elif timestamp_ns < self.last_time:
+            raise ValueError(f"Timestamps must not go backwards, but {timestamp_ns} came after {self.last_time}")
+        elif self.rule == 'step' or self.last_watts is None: # nothing to average with after a start time
+            joules = watts * (timestamp_ns - self.last_time) / 1_000_000_000
+        else:
+            joules = (self.last_watts + watts) / 2 * (timestamp_ns - self.last_time) / 1_000_000_000
+
+        self.last_time = timestamp_ns
+        self.last_watts = watts
+        self.joules += joules
+        return joules
+
+class WindowAggregator:
+    # Min / mean / max Watts and the Joules of consecutive windows, in constant memory.
+    # Windows either span `seconds` (aligned to multiples of it) or `samples` samples.
+    # Like the buckets of replay.py, the Joules of an interval belong to the window of the sample ending it.
+
+    def __init__(self, seconds=None, samples=None):
+        if bool(seconds) == bool(samples):
+            raise ValueError('A window needs either seconds or samples')
+        self.window_ns = round(seconds * 1_000_000_000) if seconds else None
+        self.window_samples = samples
+        self.start = None
+        self.reset(None)
+
+    def reset(self, start):
+        self.start = start
+        self.samples = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self.sum = 0.0
+        self.joules = 0.0
+
+    def window_start(self, timestamp_ns):
+        if self.window_ns:
+            return timestamp_ns // self.window_ns * self.window_ns
+        return timestamp_ns
+
+    def add(self, timestamp_ns, watts, joules):
+        # returns the finished window, if this sample is the first one after it
+        finished = None
+        if self.samples and (self.samples == self.window_samples or \
+                (self.window_ns and self.window_start(timestamp_ns) != self.start)):
+            finished = self.flush()
+        if not self.samples:
+            self.reset(self.window_start(timestamp_ns))
+
+        self.samples += 1
+        self.min = min(self.min, watts)
+        self.max = max(self.max, watts)
+        self.sum += watts
+        self.joules += joules
+        return finished
+
+    def flush(self):
+        # (window start in ns, samples, min Watts, mean Watts, max Watts, Joules) or None if empty
+        if not self.samples:
+            return None
+        window = (self.start, self.samples, self.min, self.sum / self.samples, self.max, self.joules)
+        self.reset(None)
+        return window
+
+def attribute_power(watts, idle_watts, utilizations):
+    # Splits the power of a host onto its CPUs: the idle power evenly, as every CPU keeps the machine
+    # powered, and the power above idle in proportion to the utilization of each CPU.
+    import numpy as np
+
+    utilizations = np.asarray(utilizations, dtype=np.float64)
+    total = utilizations.sum()
+    idle_share = np.full(utilizations.shape, idle_watts / len(utilizations))
+    if total <= 0:
+        return idle_share + (watts - idle_watts) / len(utilizations)
+    return idle_share + (watts - idle_watts) * utilizations / total
+
+def integrate(timestamps_ns, watts, rule='step', last_time=None, last_watts=None):
+    # Vectorized version of EnergyIntegrator.add() for a whole chunk of samples of one source.
+    # last_time / last_watts carry the previous chunk over, so chunked and streamed results are equal.
+    import numpy as np
+
+    if rule not in RULES:
+        raise ValueError(f"Unknown integration rule {rule}. Allowed are {RULES}")
+
+    timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+    watts = np.asarray(watts, dtype=np.float64)
+
+    if last_time is None:
+        previous_time = np.concatenate([timestamps_ns[:1], timestamps_ns[:-1]])
+        previous_watts = np.concatenate([watts[:1], watts[:-1]])
+    else:
+        previous_time = np.concatenate([[last_time], timestamps_ns[:-1]])
+        previous_watts = np.concatenate([[last_watts], watts[:-1]])
+
+    return interval_joules(previous_time, previous_watts, timestamps_ns, watts, rule)
+
+def interval_joules(previous_time, previous_watts, timestamps_ns, watts, rule='step'):
+    # Joules of the intervals between two samples each. Works on scalars and arrays
+    import numpy as np
+
+    seconds = (np.asarray(timestamps_ns) - previous_time) / 1_000_000_000
+    if np.any(seconds < 0):
+        raise ValueError('Timestamps must not go backwards')
+
+    if rule == 'step':
+        return watts * seconds
+    return (previous_watts + watts) / 2 * seconds
@@ -0,0 +1,247 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import sys
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+import xgb
+from power_curve import RESOLUTION
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# profile field => column in the training data. make and architecture become dummy columns
+FEATURES = {
+    'cpu_freq': 'HW_CPUFreq',
+    'cpu_threads': 'CPUThreads',
+    'cpu_cores': 'CPUCores',
+    'tdp': 'TDP',
+    'release_year': 'Hardware_Availability_Year',
+    'ram': 'HW_MemAmountGB',
+}
+
+# Short names as they are typically found in inventories. Long names are the xgb.py options
+ALIASES = {
+    'freq': 'cpu_freq',
+    'threads': 'cpu_threads',
+    'cores': 'cpu_cores',
+    'chips': 'cpu_chips',
+    'make': 'cpu_make',
+    'mem': 'ram',
+}
+
+def read_profiles(file_path):
+    if file_path.endswith('.jsonl') or file_path.endswith('.json'):
+        profiles = pd.read_json(file_path, lines=file_path.endswith('.jsonl'))
+    else:
+        profiles = pd.read_csv(file_path)
+
+    profiles.columns = [column.strip().lower().replace('-', '_') for column in profiles.columns]
+    profiles = profiles.rename(columns=ALIASES)
+
+    unknown = set(profiles.columns) - set(xgb.PROFILE_FIELDS) - {'id', 'vhost_ratio'}
+    if unknown:
+        raise ValueError(f"Unknown columns in {file_path}: {sorted(unknown)}. Allowed are id, vhost-ratio and {xgb.PROFILE_FIELDS}")
+
+    for field in xgb.PROFILE_FIELDS:
+        if field not in profiles.columns:
+            profiles[field] = None
+
+    if 'id' not in profiles.columns:
+        profiles['id'] = profiles.index
+    if 'vhost_ratio' not in profiles.columns:
+        profiles['vhost_ratio'] = 1.0
+    profiles['vhost_ratio'] = profiles['vhost_ratio'].fillna(1.0)
+
+    # make and architecture are matched against the lowercase dummy columns of the training data
+    for field in ['cpu_make', 'architecture']:
+        profiles[field] = profiles[field].where(profiles[field].isna(), profiles[field].astype(str).str.lower())
+
+    return profiles
+
+def group_profiles(profiles):
+    # Every distinct model is keyed by its feature columns and the chips restriction. Profiles with the same
+    # non-empty fields, make, architecture and chips end up with identical columns, so we group on these
+    # instead of building a feature frame per profile.
+    signature = profiles[list(FEATURES)].notna()
+    signature['cpu_make'] = profiles['cpu_make']
+    signature['architecture'] = profiles['architecture']
+    signature['cpu_chips'] = profiles['cpu_chips']
+
+    groups = {}
+    for _, index in signature.groupby(list(signature.columns), dropna=False).groups.items():
+        first = profiles.loc[index[0]]
+        Z = xgb.make_feature_frame({field: None if pd.isna(first[field]) else first[field] for field in xgb.PROFILE_FIELDS})
+        cpu_chips = None if pd.isna(first['cpu_chips']) else int(first['cpu_chips'])
+
+        groups.setdefault((tuple(Z.columns), cpu_chips), (Z, []))[1].extend(index)
+
+    return groups
+
+def make_features(profiles, columns):
+    X = pd.DataFrame(index=profiles.index)
+    for column in columns:
+        if column.startswith('CPUMake_') or column.startswith('Architecture_'):
+            X[column] = True # the group shares make and architecture
+        elif column == 'utilization':
+            X[column] = 0.0
+        else:
+            field = next(field for field, feature in FEATURES.items() if feature == column)
+            X[column] = profiles[field].astype(float)
+    return X
+
+def fleet_curves(profiles, model_cache=None, resolution=1.0, chunk_size=1024):
+    # Only every `resolution` percent of the curve is returned. Since the curve is linear between the
+    # support points of the model (0, 5, 15, ... 95, 100) a resolution of 1 % loses no information.
+    stride = round(resolution * RESOLUTION)
+    if stride < 1 or 100 * RESOLUTION % stride:
+        raise ValueError(f"Resolution must divide 100 and be a multiple of {1 / RESOLUTION}, but was {resolution}")
+    utilizations = np.arange(0, 100 * RESOLUTION + 1, stride) / RESOLUTION
+
+    groups = group_profiles(profiles)
+    logger.info('%d profiles need %d distinct models', len(profiles), len(groups))
+
+    results = []
+    for number, ((columns, cpu_chips), (Z, index)) in enumerate(groups.items(), start=1):
+        logger.info('Model %d/%d: %d profiles, chips: %s, columns: %s', number, len(groups), len(index), cpu_chips, list(columns))
+
+        try:
+            model = xgb.train_model(cpu_chips, Z, model_cache)
+        except RuntimeError as err:
+            logger.warning('Skipping %d profiles: %s', len(index), err)
+            continue
+
+        group = profiles.loc[index]
+        for start in range(0, len(group), chunk_size): # bounds the memory of the full resolution curves
+            chunk = group.iloc[start:start+chunk_size]
+
+            values = xgb.interpolate_values(xgb.infer_predictions(model, make_features(chunk, columns)))
+            if len(chunk) == 1:
+                values = values[np.newaxis]
+
+            watts = values[:, ::stride] * chunk['vhost_ratio'].to_numpy()[:, np.newaxis]
+
+            curves = pd.DataFrame(watts, index=chunk.index, columns=[f"watts_{u:g}" for u in utilizations])
+            results.append(pd.concat([chunk[['id'] + xgb.PROFILE_FIELDS + ['vhost_ratio']], curves], axis=1))
+
+    if not results:
+        raise RuntimeError('No power curve could be computed for any of the profiles')
+
+    return pd.concat(results).sort_index()
+
+def prebuild_model(Z, cpu_chips, cache_dir, cache_size, n_jobs, silent):
+    # Runs in a worker process
+    from model_cache import ModelCache
+
+    if silent:
+        xgb.set_silent()
+        logger.setLevel(logging.WARNING)
+
+    model_cache = ModelCache(cache_dir, logger, max_bytes=cache_size)
+    start_time = time.time()
+    try:
+        xgb.train_model(cpu_chips, Z, model_cache, n_jobs=n_jobs)
+    except RuntimeError as err:
+        return f"failed: {err}", time.time() - start_time
+
+    return 'cached' if model_cache.hits else 'trained', time.time() - start_time
+
+def prebuild_models(profiles, cache_dir, cache_size, jobs, threads_per_job, silent=False):
+    groups = group_profiles(profiles)
+    logger.info('%d profiles need %d distinct models. Building with %d processes and %d threads each',
+        len(profiles), len(groups), jobs, threads_per_job)
+
+    # spawn instead of fork: the OpenMP runtime of xgboost does not survive a fork once it was used
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {
+            executor.submit(prebuild_model, Z, cpu_chips, cache_dir, cache_size, threads_per_job, silent): (columns, cpu_chips, len(index))
+            for (columns, cpu_chips), (Z, index) in groups.items()
+        }
+
+        report = []
+        for future in as_completed(futures):
+            columns, cpu_chips, count = futures[future]
+            try:
+                status, seconds = future.result()
+            #pylint: disable=broad-except
+            except Exception as err:
+                # e.g. a worker that died. The models that are already built must still be reported
+                status, seconds = f"failed: {err!r}", 0.0
+            logger.info('%7.2f s  %s  chips: %s, profiles: %d, columns: %s', seconds, status, cpu_chips, count, list(columns))
+            report.append((status, seconds))
+
+    return report
+
+def write_curves(curves, file_path):
+    if file_path.endswith('.parquet'):
+        curves.to_parquet(file_path, index=False)
+    elif file_path.endswith('.feather'):
+        curves.reset_index(drop=True).to_feather(file_path)
+    else:
+        curves.to_csv(file_path, index=False)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compute the power curves for many machines in one go.')
+
+    parser.add_argument('profiles', type=str, help='CSV or JSONL file with one machine per row. Columns are named like the xgb.py options.')
+    parser.add_argument('output', type=str, nargs='?', help='Output file. .parquet, .feather or .csv')
+    parser.add_argument('--resolution', type=float, default=1.0, help='Utilization step of the written curves in percent.')
+    parser.add_argument('--model-cache-dir', type=str, help='Directory for the trained model cache.')
+    parser.add_argument('--model-cache-size', type=int, help='Maximum size of the model cache in MB.', default=256)
+    parser.add_argument('--no-model-cache', action='store_true', help='Always retrain the models and do not touch the cache.')
+    parser.add_argument('--prebuild',
+        action='store_true',
+        help='Only train all models the profiles need into the model cache, in parallel. No curves are written.'
+    )
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of models trained in parallel with --prebuild.')
+    parser.add_argument('--threads-per-job',
+        type=int,
+        default=1,
+        help='Threads used by every training job with --prebuild. jobs * threads should not exceed the cores.'
+    )
+    parser.add_argument('--silent', action='store_true', help='Will suppress all debug output.')
+
+    args = parser.parse_args()
+
+    if args.silent:
+        xgb.set_silent()
+        logger.setLevel(logging.WARNING)
+
+    if args.prebuild and args.no_model_cache:
+        parser.error('--prebuild fills the model cache and cannot be used with --no-model-cache')
+    if not args.prebuild and not args.output:
+        parser.error('the output file is required unless --prebuild is used')
+
+    from model_cache import ModelCache, default_cache_dir
+
+    cache_dir = args.model_cache_dir or default_cache_dir()
+    cache_size = args.model_cache_size*1024*1024
+
+    start_time = time.time()
+
+    profiles = read_profiles(args.profiles)
+
+    if args.prebuild:
+        report = prebuild_models(profiles, cache_dir, cache_size, args.jobs, args.threads_per_job, args.silent)
+        failed = sum(1 for status, _ in report if status.startswith('failed'))
+        logger.info('Built %d models in %.1f s (%.1f s of training). %d failed',
+            len(report), time.time() - start_time, sum(seconds for _, seconds in report), failed)
+        sys.exit(2 if failed else 0)
+
+    model_cache = None if args.no_model_cache else ModelCache(cache_dir, logger, max_bytes=cache_size)
+
+    curves = fleet_curves(profiles, model_cache, args.resolution)
+    write_curves(curves, args.output)
+
+    logger.info('Wrote %d power curves to %s in %.1f s', len(curves), args.output, time.time() - start_time)
+
+    if len(curves) < len(profiles):
+        sys.exit(2)
@@ -1,10 +1,10 @@
-import os
 import pandas as pd
 from xgboost import XGBRegressor
 from sklearn.metrics import mean_absolute_error
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 import optuna
+from training_data import load_training_data
 
 
 def objective(trial):
@@ -36,7 +36,8 @@ def objective(trial):
     return mean_squared_error(y_valid, y_hat, squared=False)
 
 
-df = pd.read_csv(f"{os.path.dirname(os.path.abspath(__file__))}/data/spec_data_cleaned.csv")
+df = load_training_data(['HW_CPUFreq', 'CPUCores', 'CPUThreads', 'TDP', 'Hardware_Availability_Year', 'HW_MemAmountGB',
+    'Architecture', 'CPUMake', 'utilization', 'CPUChips', 'power'])
 
 X = df[df.CPUChips == 2] # Re-run script with a tuning for every amount of CPUChips
 y = X["power"]
@@ -1,10 +1,11 @@
-import os
 import pandas as pd
 from xgboost import XGBRegressor
 from sklearn.model_selection import RepeatedKFold
 from sklearn.model_selection import cross_val_score
+from training_data import load_training_data
 
-df = pd.read_csv(f"{os.path.dirname(os.path.abspath(__file__))}/data/spec_data_cleaned.csv")
+df = load_training_data(['HW_MemAmountGB', 'TDP', 'utilization', 'CPUCores', 'CPUThreads', 'HW_CPUFreq',
+    'Hardware_Availability_Year', 'HW_FormFactor', 'HW_Vendor', 'Architecture', 'CPUMake', 'CPUChips', 'power'])
 
 df_new = df.copy()
 df_new = df_new[df_new.CPUChips == 2] # Fit a model for every amount of CPUChips
@@ -0,0 +1,119 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import json
+import hashlib
+import tempfile
+
+# xgboost is imported where needed, so default_cache_dir() stays cheap for auto_detect and the curve modes
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.environ.get('CLOUD_ENERGY_CACHE_DIR') or os.path.join(base, 'cloud-energy')
+
+def file_hash(file_path):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+class ModelCache:
+
+    # Bump whenever the key layout or the serialization format changes. Old
+    # entries then simply stop matching and age out through the eviction.
+    VERSION = 1
+
+    SUFFIX = '.ubj'
+
+    def __init__(self, directory, logger, max_bytes=256*1024*1024, max_entries=None):
+        self.directory = os.path.join(directory, 'models', f"v{self.VERSION}")
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data_hashes = {}
+        self.hits = 0
+
+    def key(self, data_file, columns, cpu_chips, params):
+        import xgboost
+
+        # hashing the 1.5 MB csv is a few ms, but fleet callers ask for many keys in one process
+        if data_file not in self._data_hashes:
+            self._data_hashes[data_file] = file_hash(data_file)
+
+        description = json.dumps({
+            'cache_version': self.VERSION,
+            'data': self._data_hashes[data_file],
+            'columns': list(columns),
+            'cpu_chips': cpu_chips,
+            'params': params,
+            'xgboost': xgboost.__version__,
+        }, sort_keys=True, default=str)
+
+        return hashlib.sha256(description.encode('UTF-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def load(self, key):
+        from xgboost import XGBRegressor
+
+        file_path = self.path(key)
+        if not os.path.isfile(file_path):
+            return None
+
+        model = XGBRegressor()
+        try:
+            model.load_model(file_path)
+        #pylint: disable=broad-except
+        except Exception as err:
+            # A corrupt or truncated entry (e.g. disk full on the shared volume) must never break startup
+            self.logger.info('Could not load cached model %s: %s. Retraining ...', file_path, err)
+            return None
+
+        os.utime(file_path) # mtime is our LRU clock
+        self.hits += 1
+        self.logger.info('Loaded model from cache: %s', file_path)
+        return model
+
+    def store(self, key, model):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # write to a temp file and rename, so concurrent readers on a shared volume never see partial models
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=f".tmp{self.SUFFIX}")
+        os.close(fd)
+        try:
+            model.save_model(tmp_path)
+            os.replace(tmp_path, self.path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self.logger.info('Stored model in cache: %s', self.path(key))
+        self.evict()
+
+    def entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self.SUFFIX) or '.tmp' in entry.name:
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # evicted by another process in the meantime
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total_size = sum(size for _, size, _ in entries)
+
+        while entries and (total_size > self.max_bytes or (self.max_entries and len(entries) > self.max_entries)):
+            _, size, file_path = entries.pop(0) # least recently used first
+            try:
+                os.remove(file_path)
+                self.logger.info('Evicted model from cache: %s', file_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
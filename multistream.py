@@ -0,0 +1,214 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import sys
+import json
+import time
+import stat
+import asyncio
+import logging
+
+import xgb
+from daemon import CurveStore, remove_socket
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+# Line protocol, for sockets as well as named pipes:
+#
+#   {"stream": "vm-1", "profile": {"tdp": 240}, "vhost_ratio": 0.25, "energy": false}
+#       registers (or reconfigures) a stream. "profile" can also be the name of a --curve-file
+#   vm-1 12.5
+#       one utilization sample for stream vm-1. Answered with "vm-1 <watts>" (or Joules with "energy": true)
+#
+# Errors are answered with "<stream> error <message>" and do not end the connection.
+
+class Stream:
+
+    def __init__(self, stream_id, curve, vhost_ratio=1.0, energy=False):
+        self.stream_id = stream_id
+        self.curve = curve
+        self.vhost_ratio = vhost_ratio
+        self.energy = energy
+        self.last_time = time.monotonic_ns()
+
+    def process(self, utilization):
+        if utilization < 0 or utilization > 100:
+            raise ValueError('Utilization can not be over 100%. If you have multiple CPU cores please divide by cpu count.')
+
+        watts = self.curve[utilization] * self.vhost_ratio
+        if not self.energy:
+            return watts
+
+        now = time.monotonic_ns()
+        joules = watts * (now - self.last_time) / 1_000_000_000
+        self.last_time = now
+        return joules
+
+async def register(store, streams, header):
+    stream_id = str(header['stream'])
+    if ' ' in stream_id:
+        raise ValueError(f"Stream ids must not contain spaces: {stream_id!r}")
+
+    # Building a new curve trains a model, which must not block all other streams
+    curve = await asyncio.get_running_loop().run_in_executor(None, store.get, header.get('profile'))
+    streams[stream_id] = Stream(stream_id, curve, float(header.get('vhost_ratio') or 1.0), bool(header.get('energy')))
+    logger.info('Registered stream %s', stream_id)
+    return stream_id
+
+async def handle_lines(reader, writer, store, streams):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+
+        line = line.decode('UTF-8', errors='replace').strip()
+        if not line:
+            continue
+
+        stream_id = '-'
+        try:
+            if line.startswith('{'):
+                await register(store, streams, json.loads(line))
+                continue
+
+            stream_id, _, value = line.partition(' ')
+            if stream_id not in streams:
+                raise ValueError(f"Unknown stream {stream_id}. Send its JSON header first")
+
+            writer.write(f"{stream_id} {streams[stream_id].process(float(value))}\n".encode('UTF-8'))
+        except (ValueError, KeyError, TypeError, RuntimeError) as err:
+            writer.write(f"{stream_id} error {err}\n".encode('UTF-8'))
+
+        # returns immediately unless the peer stopped reading and the buffer is over the high-water mark
+        await writer.drain()
+
+async def handle_connection(reader, writer, store):
+    try:
+        await handle_lines(reader, writer, store, {})
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+class StdoutWriter:
+    # Fallback when stdout is a regular file, which asyncio cannot write to without blocking
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def drain(self):
+        pass
+
+async def stdout_writer():
+    loop = asyncio.get_running_loop()
+    if not stat.S_ISFIFO(os.fstat(sys.stdout.fileno()).st_mode) and not sys.stdout.isatty():
+        return StdoutWriter()
+
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+    return asyncio.StreamWriter(transport, protocol, None, loop)
+
+async def serve_fifo(path, store, writer):
+    if not os.path.exists(path):
+        os.mkfifo(path)
+    if not stat.S_ISFIFO(os.stat(path).st_mode):
+        raise RuntimeError(f"{path} exists but is not a named pipe")
+
+    loop = asyncio.get_running_loop()
+    read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    # Holding a write end ourselves means we never see EOF when a writer closes and reopens the pipe
+    keep_open_fd = os.open(path, os.O_WRONLY)
+
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, 'rb'))
+    logger.info('Reading from named pipe %s', path)
+
+    try:
+        await handle_lines(reader, writer, store, {})
+    finally:
+        os.close(keep_open_fd)
+
+async def main(args, store):
+    tasks = []
+
+    if args.socket:
+        remove_socket(args.socket)
+        server = await asyncio.start_unix_server(lambda r, w: handle_connection(r, w, store), path=args.socket)
+        logger.info('Listening on unix socket %s', args.socket)
+        tasks.append(server.serve_forever())
+
+    if args.port:
+        server = await asyncio.start_server(lambda r, w: handle_connection(r, w, store), host=args.host, port=args.port)
+        logger.info('Listening on %s:%d', args.host, args.port)
+        tasks.append(server.serve_forever())
+
+    if args.fifo:
+        writer = await stdout_writer()
+        for path in args.fifo:
+            tasks.append(serve_fifo(path, store, writer))
+
+    await asyncio.gather(*tasks)
+
+if __name__ == '__main__':
+    import signal
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Estimate many utilization streams concurrently in one process.')
+
+    parser.add_argument('--socket', type=str, help='Path of a Unix domain socket to accept streams on.')
+    parser.add_argument('--port', type=int, help='TCP port to accept streams on.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind the TCP port to.')
+    parser.add_argument('--fifo',
+        action='append',
+        default=[],
+        help='Named pipe to read streams from. Created if missing. Results are written to STDOUT. Can be repeated.'
+    )
+    parser.add_argument('--curve-file',
+        action='append',
+        default=[],
+        help='NAME=PATH of a curve written by xgb.py --export-curve. Streams can then use "profile": "NAME". Can be repeated.'
+    )
+    parser.add_argument('--model-cache-dir', type=str, help='Directory for the trained model cache.')
+    parser.add_argument('--no-model-cache', action='store_true', help='Always retrain the models and do not touch the cache.')
+    parser.add_argument('--silent', action='store_true', help='Will suppress all debug output.')
+
+    args = parser.parse_args()
+
+    if not args.socket and not args.port and not args.fifo:
+        parser.error('at least one of --socket, --port or --fifo is required')
+
+    if args.silent:
+        xgb.set_silent()
+        logger.setLevel(logging.WARNING)
+        logging.getLogger('daemon').setLevel(logging.WARNING)
+
+    model_cache = None
+    if not args.no_model_cache:
+        from model_cache import ModelCache, default_cache_dir
+        model_cache = ModelCache(args.model_cache_dir or default_cache_dir(), logger)
+
+    store = CurveStore(model_cache)
+    for curve_file in args.curve_file:
+        name, _, path = curve_file.partition('=')
+        if not path:
+            parser.error(f"--curve-file must be NAME=PATH, but was {curve_file}")
+        store.add_file(name, path)
+
+    def stop(*_):
+        raise KeyboardInterrupt
+
+    # e.g. kill or systemctl stop. Handled like Ctrl-C, so the socket is removed below
+    signal.signal(signal.SIGTERM, stop)
+
+    if args.socket and os.path.exists(args.socket) and not stat.S_ISSOCK(os.stat(args.socket).st_mode):
+        parser.error(f"{args.socket} exists and is not a socket. Refusing to replace it")
+
+    try:
+        asyncio.run(main(args, store))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket:
+            remove_socket(args.socket)
@@ -3,10 +3,11 @@
 import sys
 import statsmodels.formula.api as smf
 import pandas as pd
+from training_data import load_training_data
 
 def train_model(cpu_chips, ram, tdp, cpu_threads):
 
-    df = pd.read_csv('./data/spec_data_cleaned.csv')
+    df = load_training_data(['power', 'utilization', 'CPUThreads', 'CPUChips', 'HW_MemAmountGB', 'TDP'])
 
     formula = 'power ~ utilization'
 
@@ -0,0 +1,182 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import sys
+import json
+import struct
+from array import array
+
+# numpy is only imported for the vectorized lookup() and for saving. Serving a precomputed
+# curve line by line works on a plain array, so startup does not pay the numpy import.
+
+# Binary layout of a curve artifact (all little-endian):
+#   8 bytes   magic
+#   uint32    format version
+#   uint32    number of curve points
+#   uint32    length of the JSON metadata in bytes
+#   ...       JSON metadata (UTF-8)
+#   float32[] watts for utilization 0.00, 0.01, ... 100.00 (index = utilization * 100)
+MAGIC = b'CECURVE\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sIII')
+
+RESOLUTION = 100 # points per percent of utilization
+POINTS = 100 * RESOLUTION + 1
+
+class PowerCurve:
+
+    # Inputs closer than this to a grid point (in 1/RESOLUTION %) are treated as on the grid.
+    # Keeps the classic 2-decimal inputs exact instead of picking up rounding noise from the interpolation.
+    GRID_TOLERANCE = 1e-6
+
+    def __init__(self, values, points=None):
+        # Any sequence of floats: a float64 ndarray when freshly interpolated, an array('f') when loaded from a file
+        if len(values) != POINTS:
+            raise ValueError(f"A power curve must have exactly {POINTS} points, but got {len(values)}")
+        self.values = values
+        self._ndarray = None
+
+        # The raw model predictions the curve was interpolated from. Only used to keep --dump output stable
+        self.points = points or {}
+
+    def __len__(self):
+        return POINTS
+
+    def __getitem__(self, utilization):
+        if not 0 <= utilization <= 100: # also NaN
+            raise ValueError(f"Utilization must be between 0 and 100, but was {utilization}")
+
+        position = utilization * RESOLUTION
+        nearest = round(position)
+        if abs(position - nearest) < self.GRID_TOLERANCE:
+            return self.values[nearest]
+
+        lower = int(position)
+        return self.values[lower] + (self.values[lower+1] - self.values[lower]) * (position - lower)
+
+    def lookup(self, utilizations):
+        import numpy as np
+
+        if self._ndarray is None:
+            self._ndarray = np.asarray(self.values, dtype=np.float64)
+
+        return lookup_values(self._ndarray, utilizations)
+
+    def items(self):
+        # The support points come first and then the rest of the grid, which is the order of
+        # the dict this class replaced. Scripts diff the --dump output, so we keep it.
+        for key, val in self.points.items():
+            yield key, self.values[round(key * RESOLUTION)] if key <= 100 else val
+
+        for i in range(POINTS):
+            key = round(i / RESOLUTION, 2)
+            if key not in self.points:
+                yield key, self.values[i]
+
+def lookup_values(values, utilizations, rows=None):
+    # Vectorized lookup on the last axis of values, which spans 0 - 100 % in equal steps.
+    # With rows, values holds one curve per row and every utilization is looked up on its own row.
+    import numpy as np
+
+    resolution = (values.shape[-1] - 1) / 100
+    position = np.asarray(utilizations, dtype=np.float64) * resolution
+    # NaN passes the comparisons and would index with the smallest intp
+    if position.size and (not np.isfinite(position).all() or position.min() < 0 or position.max() > values.shape[-1] - 1):
+        raise ValueError('Utilization must be between 0 and 100')
+
+    def at(index):
+        return values[index] if rows is None else values[rows, index]
+
+    nearest = np.rint(position).astype(np.intp)
+    lower = np.minimum(position.astype(np.intp), values.shape[-1] - 2)
+    interpolated = at(lower) + (at(lower+1) - at(lower)) * (position - lower)
+
+    return np.where(np.abs(position - nearest) < PowerCurve.GRID_TOLERANCE, at(nearest), interpolated)
+
+def save_curve(file_path, curve, metadata):
+    import numpy as np
+
+    values = np.asarray(curve.values, dtype='<f4')
+    meta = json.dumps(metadata, sort_keys=True).encode('UTF-8')
+    with open(file_path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, POINTS, len(meta)))
+        file.write(meta)
+        file.write(values.tobytes())
+
+C_HEADER_TEMPLATE = '''/* Power curve generated by cloud-energy ({profile}). Do not edit.
+ *
+ * Header only: #include it and call {name}_watts(utilization). To build a shared object instead:
+ *   gcc -O2 -shared -fPIC -DCLOUD_ENERGY_SHARED -x c <this header> -o lib{name}.so
+ */
+#ifndef {guard}
+#define {guard}
+
+#define {macro}_POINTS {points}
+#define {macro}_RESOLUTION {resolution} /* points per percent of utilization */
+
+#ifdef CLOUD_ENERGY_SHARED
+#define {macro}_API
+#else
+#define {macro}_API static inline
+#endif
+
+/* Watts for utilization 0.00, 0.01, ... 100.00 (index = utilization * {resolution}), vHost ratio {vhost_ratio} applied */
+static const float {name}_curve[{points}] = {{
+{values}
+}};
+
+/* Linear interpolation between the points, utilization is clamped to 0 - 100 */
+{macro}_API double {name}_watts(double utilization) {{
+    double position = utilization * {macro}_RESOLUTION;
+    if (!(position > 0.0)) return {name}_curve[0];
+    if (position >= {macro}_POINTS - 1) return {name}_curve[{macro}_POINTS - 1];
+
+    int lower = (int)position;
+    return {name}_curve[lower] + ({name}_curve[lower + 1] - {name}_curve[lower]) * (position - lower);
+}}
+
+{macro}_API double {name}_joules(double utilization, double seconds) {{
+    return {name}_watts(utilization) * seconds;
+}}
+
+#endif /* {guard} */
+'''
+
+def write_c_header(output, curve, vhost_ratio=1.0, profile=None, name='cloud_energy'):
+    # A C header with the curve as a static float array and the lookup as inline functions,
+    # so C programs estimate without Python. %.9g round trips every float32 exactly.
+    rows = []
+    for start in range(0, POINTS, 8):
+        rows.append('    ' + ', '.join(f"{value * vhost_ratio:.9g}f" for value in curve.values[start:start+8]) + ',')
+
+    output.write(C_HEADER_TEMPLATE.format(
+        profile=json.dumps(profile or {}, sort_keys=True).replace('*/', '* /'),
+        name=name,
+        macro=name.upper(),
+        guard=f"{name.upper()}_CURVE_H",
+        points=POINTS,
+        resolution=RESOLUTION,
+        vhost_ratio=vhost_ratio,
+        values='\n'.join(rows),
+    ))
+
+def load_curve(file_path):
+    with open(file_path, 'rb') as file:
+        magic, version, points, meta_length = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{file_path} is not a power curve file")
+        if version != VERSION:
+            raise ValueError(f"{file_path} has curve format version {version}, but only {VERSION} is supported")
+        if points != POINTS:
+            raise ValueError(f"{file_path} contains {points} points, but {POINTS} were expected")
+
+        metadata = json.loads(file.read(meta_length).decode('UTF-8'))
+        values = array('f')
+        try:
+            values.fromfile(file, points)
+        except EOFError as err:
+            raise ValueError(f"{file_path} is truncated") from err
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    return PowerCurve(values), metadata
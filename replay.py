@@ -0,0 +1,268 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from energy import RULES, interval_joules
+from power_curve import lookup_values
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.INFO)
+
+TIME_UNITS = {'ns': 1, 'us': 1_000, 'ms': 1_000_000, 's': 1_000_000_000}
+
+# Every file is integrated on its own (and possibly in its own process). The first sample of a
+# host in a file therefore has no interval yet. The interval from the last sample of the previous
+# file is added when the per file results are merged, so splitting a log into files (e.g. one
+# per day) does not change the totals. Files must be given in chronological order.
+#
+# An interval is always accounted to the bucket of the sample that ends it.
+
+AGGREGATIONS = {'samples': 'sum', 'joules': 'sum', 'watts_sum': 'sum', 'watts_min': 'min', 'watts_max': 'max'}
+
+def read_chunks(file_path, columns, chunk_size):
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file_path, usecols=columns, chunksize=chunk_size)
+
+def to_nanoseconds(series, time_unit):
+    if pd.api.types.is_integer_dtype(series):
+        return series.to_numpy(dtype=np.int64) * TIME_UNITS[time_unit] # exact, also beyond 2^53 ns
+    if pd.api.types.is_numeric_dtype(series):
+        # scaled before rounding, so e.g. 0.25 s stays 250 ms
+        return np.rint(series.to_numpy(dtype=np.float64) * TIME_UNITS[time_unit]).astype(np.int64)
+    return ((pd.to_datetime(series, utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(1, 'ns')).to_numpy(dtype=np.int64)
+
+def combine(aggregates):
+    return pd.concat(aggregates).groupby(level=[0, 1]).agg(AGGREGATIONS)
+
+def replay_file(file_path, options):
+    # Runs in a worker process. Returns the aggregates plus the first and last sample of every
+    # host, so the caller can integrate over the file boundaries.
+    curves = np.load(options['curves'], mmap_mode='r')
+    host_rows = options['host_rows']
+    if host_rows is None: # one curve for all hosts
+        curves = curves[0]
+
+    columns = [options['time_column'], options['utilization_column']]
+    if options['host_column']:
+        columns.append(options['host_column'])
+
+    aggregates = []
+    first = {}
+    last = {}
+    rows = 0
+    skipped = 0
+
+    for chunk in read_chunks(file_path, columns, options['chunk_size']):
+        rows += len(chunk)
+
+        hosts = chunk[options['host_column']].astype(str).to_numpy() if options['host_column'] else np.full(len(chunk), '-', dtype=object)
+        timestamps = to_nanoseconds(chunk[options['time_column']], options['time_unit'])
+        utilizations = chunk[options['utilization_column']].to_numpy(dtype=np.float64)
+
+        if host_rows is None:
+            curve_rows = None
+        else:
+            curve_rows = pd.Series(hosts).map(host_rows).to_numpy()
+            known = ~pd.isna(curve_rows)
+            skipped += int((~known).sum())
+            hosts, timestamps, utilizations = hosts[known], timestamps[known], utilizations[known]
+            curve_rows = curve_rows[known].astype(np.intp)
+
+        if not len(hosts): # pylint: disable=use-implicit-booleaness-not-len
+            continue
+
+        if utilizations.min() < 0 or utilizations.max() > 100:
+            raise ValueError(f"{file_path} contains utilizations outside of 0 - 100")
+
+        watts = lookup_values(curves, utilizations, curve_rows) * options['vhost_ratio']
+
+        # sort by host and time, so every host is one contiguous run and can be shifted by one
+        codes, uniques = pd.factorize(hosts)
+        order = np.lexsort((timestamps, codes))
+        codes, timestamps, watts = codes[order], timestamps[order], watts[order]
+
+        previous_time = np.roll(timestamps, 1)
+        previous_watts = np.roll(watts, 1)
+        starts = np.flatnonzero(np.diff(codes, prepend=-1))
+        for start in starts:
+            host = uniques[codes[start]]
+            if host in last: # continue from the previous chunk
+                previous_time[start], previous_watts[start] = last[host]
+            else:
+                first[host] = (timestamps[start], watts[start])
+                previous_time[start], previous_watts[start] = timestamps[start], watts[start]
+
+        ends = np.append(starts[1:], len(codes)) - 1
+        for end in ends:
+            last[uniques[codes[end]]] = (timestamps[end], watts[end])
+
+        joules = interval_joules(previous_time, previous_watts, timestamps, watts, options['rule'])
+
+        buckets = timestamps // options['bucket_ns'] * options['bucket_ns'] if options['bucket_ns'] else np.zeros_like(timestamps)
+        frame = pd.DataFrame({'host': uniques[codes], 'bucket': buckets, 'joules': joules, 'watts': watts})
+        aggregate = frame.groupby(['host', 'bucket']).agg(
+            samples=('watts', 'size'), joules=('joules', 'sum'),
+            watts_sum=('watts', 'sum'), watts_min=('watts', 'min'), watts_max=('watts', 'max'))
+
+        # keeps the memory bounded by the number of hosts and buckets, not by the number of rows
+        aggregates = [combine(aggregates + [aggregate])]
+
+    aggregate = combine(aggregates) if aggregates else None
+    return aggregate, first, last, rows, skipped
+
+def load_curves(curve_file, profiles_file, model_cache):
+    # Returns one curve per row and the host => row mapping (None if all hosts share one curve)
+    if curve_file:
+        from power_curve import load_curve
+
+        curve, metadata = load_curve(curve_file)
+        logger.info('Loaded power curve from %s. It was built for: %s', curve_file, metadata['profile'])
+        return np.asarray(curve.values, dtype=np.float64)[np.newaxis], None
+
+    import fleet
+
+    # 1 % steps: the curve is linear between the support points, so nothing is lost
+    curves = fleet.fleet_curves(fleet.read_profiles(profiles_file), model_cache, resolution=1.0)
+    watts_columns = [column for column in curves.columns if column.startswith('watts_')]
+    host_rows = {str(host): row for row, host in enumerate(curves['id'])}
+    return curves[watts_columns].to_numpy(dtype=np.float64), host_rows
+
+def replay(files, curves, host_rows, options, jobs=1):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # workers memory-map the curves instead of getting a pickled copy each
+        options = dict(options, curves=os.path.join(tmp_dir, 'curves.npy'), host_rows=host_rows)
+        np.save(options['curves'], curves)
+
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+                results = list(executor.map(replay_file, files, [options] * len(files)))
+        else:
+            results = [replay_file(file_path, options) for file_path in files]
+
+    aggregates = []
+    last = {}
+    rows = 0
+    skipped = 0
+    for file_path, (aggregate, file_first, file_last, file_rows, file_skipped) in zip(files, results):
+        logger.info('%s: %d rows, %d hosts', file_path, file_rows, len(file_last))
+        rows += file_rows
+        skipped += file_skipped
+        if aggregate is None:
+            continue
+
+        boundaries = []
+        for host, (timestamp, watts) in file_first.items():
+            if host in last:
+                bucket = timestamp // options['bucket_ns'] * options['bucket_ns'] if options['bucket_ns'] else 0
+                joules = interval_joules(last[host][0], last[host][1], timestamp, watts, options['rule'])
+                boundaries.append((host, bucket, joules))
+
+        if boundaries:
+            boundary = pd.DataFrame(boundaries, columns=['host', 'bucket', 'joules']).set_index(['host', 'bucket'])
+            aggregate = aggregate.add(boundary.reindex(aggregate.index, fill_value=0), fill_value=0)
+
+        aggregates.append(aggregate)
+        last.update(file_last)
+
+    if not aggregates:
+        raise RuntimeError('None of the files contained a sample that could be replayed')
+
+    result = combine(aggregates)
+    result['samples'] = result['samples'].astype(np.int64) # the boundary additions made it float
+    result['watts_mean'] = result.pop('watts_sum') / result['samples']
+    result = result.reset_index()
+
+    if options['bucket_ns']:
+        result['bucket'] = pd.to_datetime(result['bucket'], unit='ns', utc=True)
+    else:
+        result = result.drop(columns='bucket')
+
+    return result[[column for column in ['host', 'bucket', 'samples', 'joules', 'watts_mean', 'watts_min', 'watts_max'] if column in result]], rows, skipped
+
+def write_results(results, file_path):
+    if file_path.endswith('.parquet'):
+        results.to_parquet(file_path, index=False)
+    else:
+        results.to_csv(file_path, index=False)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Convert historical utilization logs to energy totals per host and time bucket.')
+
+    parser.add_argument('files', nargs='+', help='CSV or Parquet files with one utilization sample per row. In chronological order.')
+    parser.add_argument('--output', type=str, required=True, help='Output file. .parquet or .csv')
+    parser.add_argument('--curve-file', type=str, help='Power curve written by xgb.py --export-curve. Used for all hosts.')
+    parser.add_argument('--profiles', type=str, help='fleet.py profiles file. Its id column is matched against the host column.')
+    parser.add_argument('--vhost-ratio', type=float, default=1.0, help='Virtualization ratio. Only with --curve-file, profiles have their own.')
+    parser.add_argument('--host-column', type=str, default='host', help='Column with the host. Empty if the files hold one host only.')
+    parser.add_argument('--time-column', type=str, default='timestamp', help='Column with the time of the sample.')
+    parser.add_argument('--time-unit', choices=list(TIME_UNITS), default='ns', help='Unit of numeric timestamps. Date strings are parsed.')
+    parser.add_argument('--utilization-column', type=str, default='utilization', help='Column with the CPU utilization in percent.')
+    parser.add_argument('--bucket-seconds', type=float, default=0, help='Length of the time buckets. 0 gives one total per host.')
+    parser.add_argument('--integration', choices=RULES, default='step', help='Integration rule, see xgb.py --integration.')
+    parser.add_argument('--chunk-size', type=int, default=1_000_000, help='Rows read at once. Bounds the memory per process.')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Number of files replayed in parallel.')
+    parser.add_argument('--model-cache-dir', type=str, help='Directory for the trained model cache. Only with --profiles.')
+    parser.add_argument('--no-model-cache', action='store_true', help='Always retrain the models and do not touch the cache.')
+    parser.add_argument('--silent', action='store_true', help='Will suppress all debug output.')
+
+    args = parser.parse_args()
+
+    if bool(args.curve_file) == bool(args.profiles):
+        parser.error('exactly one of --curve-file or --profiles is required')
+    if args.profiles and args.vhost_ratio != 1.0:
+        parser.error('--vhost-ratio can only be used with --curve-file. Put a vhost-ratio column into the profiles instead')
+    if args.profiles and not args.host_column:
+        parser.error('--profiles needs a --host-column to match the hosts against')
+
+    if args.silent:
+        import xgb
+        xgb.set_silent()
+        logger.setLevel(logging.WARNING)
+        if args.profiles:
+            import fleet
+            fleet.logger.setLevel(logging.WARNING)
+
+    model_cache = None
+    if args.profiles and not args.no_model_cache:
+        from model_cache import ModelCache, default_cache_dir
+        model_cache = ModelCache(args.model_cache_dir or default_cache_dir(), logger)
+
+    start_time = time.time()
+
+    curves, host_rows = load_curves(args.curve_file, args.profiles, model_cache)
+
+    options = {
+        'host_column': args.host_column,
+        'time_column': args.time_column,
+        'time_unit': args.time_unit,
+        'utilization_column': args.utilization_column,
+        'bucket_ns': round(args.bucket_seconds * 1_000_000_000),
+        'rule': args.integration,
+        'chunk_size': args.chunk_size,
+        'vhost_ratio': args.vhost_ratio,
+    }
+
+    results, rows, skipped = replay(args.files, curves, host_rows, options, min(args.jobs, len(args.files)))
+    write_results(results, args.output)
+
+    logger.info('Replayed %d rows from %d files into %d results in %.1f s', rows, len(args.files), len(results), time.time() - start_time)
+
+    if skipped:
+        logger.warning('Skipped %d rows of hosts that are not in %s', skipped, args.profiles)
+        sys.exit(2)
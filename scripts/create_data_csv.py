@@ -1,4 +1,19 @@
-import csv, re, os
+import os
+import re
+import csv
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Builds ../data/spec_data.csv from the SPECpower HTML reports in ../data/raw/spec-power/
+#
+# Parsed rows are cached in a SQLite file keyed by the SHA-256 of the report, so a rebuild only
+# parses reports that are new or changed. The cache is dropped when the parser itself changes.
+# Reports that need parsing are spread over a process pool.
 
 header = [
 
@@ -34,140 +49,188 @@ header = [
 'SUT_BIOS', 'SUT_Firmware', 'SUT_Notes',
 ]
 
-rows = []
-rowcount=-1
-
-for f in os.scandir('../data/raw/spec-power/'):
-    if f.is_file():
-        rowcount+=1
-        rows.append([])
-        o = open(f,'r')
-        text = o.read()
-        o.close()
-
-        ## Get Test info
-        m = re.search(
-            'Test Sponsor:</a></td>$\s*.*>(.*)</td>$'                      # 1
-            '\s*.*SPEC License #:</a></td>$\s*.*>(.*)</td>$'               # 2
-            '\s*.*Test Method:</a></td>$\s*.*>(.*)</td>$\s*</tr>$\s*<tr>$' # 3
-            '\s*.*Tested By:</a></td>$\s*.*>(.*)</td>$'                    # 4
-            '\s*.*Test Location:</a></td>$\s*.*>(.*)</td>$'                # 5
-            '\s*.*Test Date:</a></td>$\s*.*>(.*)</td>$\s*</tr>$\s*<tr>$'   # 6
-            '\s*.*Hardware Availability:</a></td>$\s*.*>(.*)</td>$'        # 7
-            '\s*.*Software Availability:</a></td>$\s*.*>(.*)</td>$'        # 8
-            '\s*.*Publication:</a></td>$\s*.*>(.*)</td>$\s*</tr>$\s*<tr>$' # 9
-            '\s*.*System Source:</a></td>$\s*.*>(.*)</td>$'                # 10
-            '\s*.*System Designation:</a></td>$\s*.*>(.*)</td>$'           # 11
-            '\s*.*Power Provisioning:</a></td>$\s*.*>(.*)</td>$'           # 12
-            ,text , re.M)
-
-        if m:
-            for x in range(1,13):
-                rows[rowcount].append(m.group(x))
-
-
-        ## Get Power Chart
-        for x in range(100, 0, -10):
-            m = re.search(f'<td>{x}%</td>$'
-                '\s*<td>(.*)%</td>$'
-                '\s*<td>(.*)</td>$'
-                '\s*<td>(.*)</td>$'
-                '\s*<td>(.*)</td>$'
-                , text, re.M)
-            if m:
-                ssj_ops_cln = re.sub(',', "", m.group(2))
-                avg_pwr_cln = re.sub(',', "", m.group(3))
-                perf_pwr_ratio_cln = re.sub(',', "", m.group(4))
-                rows[rowcount].extend([m.group(1), ssj_ops_cln, avg_pwr_cln
-                    , perf_pwr_ratio_cln])
-                #print(f"Actual Load: {m.group(1)} --- ssj_ops: {m.group(2)} --- avg.power: {m.group(3)} --- perf.power.ratio: {m.group(4)}\n")
-        
-        ## Get Idle Power
-        m = re.search('Active Idle.*$'
-            '\s*<td>.*</td>$'
-            '\s*<td>(.*)</td>$'
-            , text, re.M)
-        if m: rows[rowcount].append(m.group(1))
-
-        ## Get Hardware Info
-        m = re.search('Hardware Vendor:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'   # 1 
-            '\s*.*Model:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'                  # 2   
-            '\s*.*Form Factor:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'            # 3
-            '\s*.*CPU Name:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'               # 4
-            '\s*.*CPU Characteristics:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'    # 5
-            '\s*.*CPU Frequency \(MHz\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'  # 6
-            '\s*.*CPU\(s\) Enabled:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'       # 7
-            '\s*.*Hardware Threads:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'       # 8
-            '\s*.*CPU\(s\) Orderable:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'     # 9
-            '\s*.*Primary Cache:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'          # 10
-            '\s*.*Secondary Cache:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'        # 11
-            '\s*.*Tertiary Cache:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'         # 12
-            '\s*.*Other Cache:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'            # 13
-            '\s*.*Memory Amount \(GB\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'   # 14 
-            '\s*.*# and size of DIMM:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'     # 15
-            '\s*.*Memory Details:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'         # 16
-            '\s*.*Power Supply Quantity and Rating \(W\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' #17
-            '\s*.*Power Supply Details:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'   # 18
-            '\s*.*Disk Drive:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'             # 19
-            '\s*.*Disk Controller:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'        # 20
-            '\s*.*# and type of Network Interface Cards \(NICs\) Installed:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 21
-            '\s*.*NICs Enabled in Firmware / OS / Connected:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 22
-            '\s*.*Network Speed \(Mbit\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 23
-            '\s*.*Keyboard:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'               # 24
-            '\s*.*Mouse:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'                  # 25
-            '\s*.*Monitor:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'                # 26
-            '\s*.*Optical Drives:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'         # 27
-            '\s*.*Other Hardware:</a></td>$\s*.*>(.*)</td>'                          # 28
-            ,text , re.M)
-
-        if m: #print(m.group(28))
-            for x in range(1,29):
-                rows[rowcount].append(m.group(x))
-
-        ## Get Software Info
-        m = re.search('Power Management:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'  # 1
-            '\s*.*Operating System \(OS\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 2   
-            '\s*.*OS Version:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'             # 3   
-            '\s*.*Filesystem:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'             # 4   
-            '\s*.*JVM Vendor:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'             # 5   
-            '\s*.*JVM Version:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'            # 6   
-            '\s*.*JVM Command-line Options:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 7   
-            '\s*.*JVM Affinity:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'           # 8
-            '\s*.*JVM Instances:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'          # 9
-            '\s*.*JVM Initial Heap \(MB\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 10
-            '\s*.*JVM Maximum Heap \(MB\):</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 11
-            '\s*.*JVM Address Bits:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'       # 12
-            '\s*.*Boot Firmware Version:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'  # 13
-            '\s*.*Management Firmware Version:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$' # 14
-            '\s*.*Workload Version:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'       # 15
-            '\s*.*Director Location:</a></td>$\s*.*>(.*)</td>\s*</tr>$\s*<tr>$'      # 16
-            '\s*.*Other Software:</a></td>$\s*.*>(.*)</td>'                          # 17
-            ,text , re.M)
-
-        if m: #print(m.group(17))
-            for x in range(1, 18):
-                rows[rowcount].append(m.group(x))
-
-        ## Get SUT Notes and BIOS / Firmware
-        m = re.search(
-            'Boot Firmware Settings</a></div>$\s*<div class=\'freeForm\'>\s*([\w\W]*?)\s*</div>$'              # 1
-            '[\w\W]*?Management Firmware Settings</a></div>$\s*<div class=\'freeForm\'>\s*([\w\W]*?)\s*</div>$'# 2
-            '[\w\W]*?System Under Test Notes</a></div>$\s*<div class=\'freeForm\'>\s*([\w\W]*?)\s*</div>$'     # 3
-            ,text , re.M)
-
-        if m:
-            for x in range(1,4):
-                ### Elements are lists inside. We remove HTML tags and separate by ;;;
-                group = m.group(x).replace('<li>', ';;;', case=False) \
-                                  .replace('</li>', '', case=False) \
-                                  .replace('<ul>', '', case=False) \
-                                  .replace('</ul>', '', case=False) \
-                                  .strip()
-                rows[rowcount].append(group)
-
-
-#print(rows)
-with open('../data/spec_data.csv', 'w', encoding='UTF8', newline='\n') as f:
-    writer = csv.writer(f, delimiter='|')
-    writer.writerow(header)
-    writer.writerows(rows)
+# Labels of the label / value tables in the order of their columns. A section only gets its
+# columns if all of its labels are found, otherwise the row just misses them.
+HEADER_LABELS = [
+    'Test Sponsor', 'SPEC License #', 'Test Method', 'Tested By', 'Test Location', 'Test Date',
+    'Hardware Availability', 'Software Availability', 'Publication', 'System Source',
+    'System Designation', 'Power Provisioning',
+]
+HARDWARE_LABELS = [
+    'Hardware Vendor', 'Model', 'Form Factor', 'CPU Name', 'CPU Characteristics', 'CPU Frequency (MHz)',
+    'CPU(s) Enabled', 'Hardware Threads', 'CPU(s) Orderable', 'Primary Cache', 'Secondary Cache',
+    'Tertiary Cache', 'Other Cache', 'Memory Amount (GB)', '# and size of DIMM', 'Memory Details',
+    'Power Supply Quantity and Rating (W)', 'Power Supply Details', 'Disk Drive', 'Disk Controller',
+    '# and type of Network Interface Cards (NICs) Installed', 'NICs Enabled in Firmware / OS / Connected',
+    'Network Speed (Mbit)', 'Keyboard', 'Mouse', 'Monitor', 'Optical Drives', 'Other Hardware',
+]
+SOFTWARE_LABELS = [
+    'Power Management', 'Operating System (OS)', 'OS Version', 'Filesystem', 'JVM Vendor', 'JVM Version',
+    'JVM Command-line Options', 'JVM Affinity', 'JVM Instances', 'JVM Initial Heap (MB)',
+    'JVM Maximum Heap (MB)', 'JVM Address Bits', 'Boot Firmware Version', 'Management Firmware Version',
+    'Workload Version', 'Director Location', 'Other Software',
+]
+LOAD_LEVELS = [str(level) for level in range(100, 0, -10)]
+NOTES_SECTIONS = ['Boot Firmware Settings', 'Management Firmware Settings', 'System Under Test Notes']
+
+# Every pattern starts with a literal that is rare in the reports, so the regex engine skips
+# ahead with a fast substring search instead of trying a match at every position. The label /
+# value tables (57 of the 101 columns) are read with one split and one findall.
+LABEL_END = ':</a></td>'
+LABEL_VALUE = re.compile(r':</a></td>(?:$\s*^.*>(.*)(</td>)$)?', re.M) # one entry per label, group 2 is empty without value
+LOAD_LEVEL = re.compile(r'<td>(\d+)%</td>$\s*<td>(.*)%</td>$\s*<td>(.*)</td>$\s*<td>(.*)</td>$\s*<td>(.*)</td>$', re.M)
+ACTIVE_IDLE = re.compile(r'Active Idle.*$\s*<td>.*</td>$\s*<td>(.*)</td>$', re.M)
+NOTES_END = '</a></div>'
+FREE_FORM = re.compile(r"$\s*<div class='freeForm'>\s*", re.M)
+FREE_FORM_END = '</div>'
+LIST_ITEM = re.compile('<li>', re.I)
+LIST_TAGS = re.compile('</li>|<ul>|</ul>', re.I)
+
+def parse_report(text):
+    # the label is the text between the last > and :</a></td>
+    labels = [chunk.rpartition('>')[2] for chunk in text.split(LABEL_END)[:-1]]
+    fields = {}
+    for label, (value, has_value) in zip(labels, LABEL_VALUE.findall(text)):
+        if has_value and label not in fields:
+            fields[label] = value
+
+    loads = {}
+    for level, actual_load, ssj_ops, avg_power, perf_power_ratio in LOAD_LEVEL.findall(text):
+        if level not in loads:
+            loads[level] = [actual_load, ssj_ops.replace(',', ''), avg_power.replace(',', ''), perf_power_ratio.replace(',', '')]
+
+    row = []
+    if all(label in fields for label in HEADER_LABELS):
+        row.extend(fields[label] for label in HEADER_LABELS)
+
+    for level in LOAD_LEVELS:
+        if level in loads:
+            row.extend(loads[level])
+
+    idle = ACTIVE_IDLE.search(text)
+    if idle:
+        row.append(idle.group(1))
+
+    for labels in [HARDWARE_LABELS, SOFTWARE_LABELS]:
+        if all(label in fields for label in labels):
+            row.extend(fields[label] for label in labels)
+
+    # the sections in their order, each found with a substring search and its text matched in place
+    notes = []
+    position = 0
+    for section in NOTES_SECTIONS:
+        while True:
+            position = text.find(section + NOTES_END, position)
+            if position == -1:
+                break
+            position += len(section) + len(NOTES_END)
+            match = FREE_FORM.match(text, position)
+            if match:
+                # the text runs up to the first </div> at the end of a line
+                end = text.find(FREE_FORM_END, match.end())
+                while end != -1 and text[end + len(FREE_FORM_END):end + len(FREE_FORM_END) + 1] not in ('\n', ''):
+                    end = text.find(FREE_FORM_END, end + 1)
+                if end != -1:
+                    notes.append(text[match.end():end].rstrip())
+                    position = end + len(FREE_FORM_END)
+                    break
+        if position == -1:
+            break
+
+    if len(notes) == len(NOTES_SECTIONS):
+        for group in notes:
+            ### Elements are lists inside. We remove HTML tags and separate by ;;;
+            row.append(LIST_TAGS.sub('', LIST_ITEM.sub(';;;', group)).strip())
+
+    return row
+
+def parse_file(path):
+    with open(path, 'r', encoding='UTF-8') as file:
+        return parse_report(file.read())
+
+def file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def parser_version():
+    # Any change to the file with the parser invalidates all cached rows
+    with open(__file__, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+class ReportCache:
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS reports (hash TEXT PRIMARY KEY, row TEXT)')
+
+        version = parser_version()
+        stored = self.connection.execute("SELECT value FROM meta WHERE key = 'parser'").fetchone()
+        if stored is None or stored[0] != version:
+            self.connection.execute('DELETE FROM reports')
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('parser', ?)", (version,))
+            self.connection.commit()
+
+    def get_all(self, hashes):
+        rows = {}
+        for digest, row in self.connection.execute('SELECT hash, row FROM reports'):
+            if digest in hashes:
+                rows[digest] = json.loads(row)
+        return rows
+
+    def put(self, digest, row):
+        self.connection.execute('INSERT OR REPLACE INTO reports VALUES (?, ?)', (digest, json.dumps(row)))
+
+    def prune(self, hashes):
+        # drops reports that are no longer in the raw directory
+        stale = [(digest,) for (digest,) in self.connection.execute('SELECT hash FROM reports') if digest not in hashes]
+        self.connection.executemany('DELETE FROM reports WHERE hash = ?', stale)
+        return len(stale)
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+def build(raw_dir, output_file, cache_file=None, jobs=None):
+    start = time.monotonic()
+    paths = sorted(entry.path for entry in os.scandir(raw_dir) if entry.is_file())
+    hashes = [file_hash(path) for path in paths]
+
+    cache = ReportCache(cache_file) if cache_file else None
+    rows = cache.get_all(set(hashes)) if cache else {}
+
+    todo = [(path, digest) for path, digest in zip(paths, hashes) if digest not in rows]
+    if todo:
+        jobs = jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            chunksize = max(1, len(todo) // (4 * jobs))
+            for (_, digest), row in zip(todo, executor.map(parse_file, [path for path, _ in todo], chunksize=chunksize)):
+                rows[digest] = row
+                if cache:
+                    cache.put(digest, row)
+
+    pruned = 0
+    if cache:
+        pruned = cache.prune(set(hashes))
+        cache.close()
+
+    with open(output_file, 'w', encoding='UTF8', newline='\n') as f:
+        writer = csv.writer(f, delimiter='|')
+        writer.writerow(header)
+        writer.writerows(rows[digest] for digest in hashes)
+
+    print(f"{len(paths)} reports, {len(todo)} parsed, {len(paths) - len(todo)} from cache, {pruned} removed from cache "
+          f"in {time.monotonic() - start:.2f} s", file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the SPECpower CSV from the raw HTML reports.')
+
+    parser.add_argument('--raw-dir', type=str, default='../data/raw/spec-power/', help='Directory with the SPECpower HTML reports.')
+    parser.add_argument('--output', type=str, default='../data/spec_data.csv', help='CSV file to write.')
+    parser.add_argument('--cache', type=str, default='../data/spec_data_cache.sqlite', help='SQLite file with the parsed rows of every report.')
+    parser.add_argument('--no-cache', action='store_true', help='Parse every report and do not touch the cache.')
+    parser.add_argument('--jobs', type=int, help='Processes that parse reports. Defaults to the number of CPUs.')
+
+    args = parser.parse_args()
+
+    build(args.raw_dir, args.output, None if args.no_cache else args.cache, args.jobs)
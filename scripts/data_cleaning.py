@@ -1,7 +1,14 @@
+import os
 import re
+import sys
 import glob
+import subprocess
 import pandas as pd
 import include.helper_functions as helper
+from include.stage_runner import StageRunner
+from include.wikipedia_snapshots import SnapshotStore
+
+TRAINING_DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'training_data.py')
 
 """
     This file reads the generated CSV file into a data frame
@@ -432,35 +439,37 @@ def make_tdp_old(df_original):
 
     return df
 
-def make_tdp_and_architecture(df_original):
-    df = df_original.copy()
-
+# The Wikipedia pages with the CPU tables are read from local snapshots, see include/wikipedia_snapshots.py
+SNAPSHOT_DIR = "./../data/wikipedia"
+
+WIKIPEDIA_CPU_TABLES = {
+    "opteron" : "https://en.wikipedia.org/wiki/List_of_AMD_Opteron_processors",
+    "core" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Core-based)",
+    "nehalem" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Nehalem-based)",
+    "sandybridge" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Sandy_Bridge-based)",
+    "ivybridge" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Ivy_Bridge-based)",
+    "haswell" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Haswell-based)",
+    "broadwell" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Broadwell-based)",
+    "skylake" :"https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Skylake-based)",
+    "kabylabe" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Kaby_Lake-based)",
+    "coffeelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Coffee_Lake-based)",
+    "cascadelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Cascade_Lake-based)",
+    "cometlake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Comet_Lake-based)",
+    "icelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Ice_Lake-based)",
+    "rocketlake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Rocket_Lake-based)",
+    "tigerlake" : "https://en.wikipedia.org/wiki/Tiger_Lake#List_of_Tiger_Lake_CPUs",
+    "epyc" : "https://en.wikipedia.org/wiki/Epyc",
+    "cooperlake" : "https://en.wikipedia.org/wiki/Cooper_Lake_(microprocessor)#List_of_Cooper_Lake_processors",
+    "netburst" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(NetBurst-based)",
+}
+
+def build_cpu_index(store):
+    # ModelNumber => TDP / Architecture from the CPU tables. Only runs when the snapshots or this function changed
     cpus = pd.DataFrame(columns=["ModelNumber", "TDP", "Architecture"])
 
-    urls = {
-        "opteron" : "https://en.wikipedia.org/wiki/List_of_AMD_Opteron_processors",
-        "core" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Core-based)",
-        "nehalem" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Nehalem-based)",
-        "sandybridge" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Sandy_Bridge-based)",
-        "ivybridge" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Ivy_Bridge-based)",
-        "haswell" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Haswell-based)",
-        "broadwell" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Broadwell-based)",
-        "skylake" :"https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Skylake-based)",
-        "kabylabe" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Kaby_Lake-based)",
-        "coffeelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Coffee_Lake-based)",
-        "cascadelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Cascade_Lake-based)",
-        "cometlake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Comet_Lake-based)",
-        "icelake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Ice_Lake-based)",
-        "rocketlake" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(Rocket_Lake-based)",
-        "tigerlake" : "https://en.wikipedia.org/wiki/Tiger_Lake#List_of_Tiger_Lake_CPUs",
-        "epyc" : "https://en.wikipedia.org/wiki/Epyc",
-        "cooperlake" : "https://en.wikipedia.org/wiki/Cooper_Lake_(microprocessor)#List_of_Cooper_Lake_processors",
-        "netburst" : "https://en.wikipedia.org/wiki/List_of_Intel_Xeon_processors_(NetBurst-based)",
-    }
-
-    for architecture in urls.keys():
+    for architecture in WIKIPEDIA_CPU_TABLES.keys():
         print(architecture)
-        tables = pd.read_html(urls[architecture])
+        tables = store.tables(architecture)
 
         for table in tables:
 
@@ -532,6 +541,11 @@ def make_tdp_and_architecture(df_original):
     # now remove the duplicates
     cpus = cpus.drop_duplicates(subset=["ModelNumber"])
 
+    return cpus
+
+def make_tdp_and_architecture(df_original, cpus):
+    df = df_original.copy()
+
     clean_names = df.CPUName.str.replace(r"opteron", "", regex=True)
     for i, clean_name in clean_names.iteritems():
         if cpus[cpus.ModelNumber == clean_name].empty:
@@ -823,7 +837,16 @@ def make_bios_features(df_original):
 
     return df
 
-def main():
+def add_average_power(df_original):
+    df = df_original.copy()
+
+    df["AvgPower"] = df.loc[:,['100_AvgPower', '90_AvgPower', '80_AvgPower', '70_AvgPower',
+           '60_AvgPower', '50_AvgPower', '40_AvgPower', '30_AvgPower',
+           '20_AvgPower', '10_AvgPower', 'ActiveIdle']].mean(axis=1)
+
+    return df
+
+def main(checkpoint_dir=None, refresh_snapshots=False):
     pd.set_option("display.max_rows", 100)
     pd.set_option("display.max_columns", 20)
     pd.set_option('display.max_colwidth', None)
@@ -835,51 +858,58 @@ def main():
     #assert(df.hash.nunique() == df.shape[0]) # no duplicate hashes
 
     ## Cleaning
+    # Every stage is checkpointed, so after changing one only that stage and the ones after it run again
+    runner = StageRunner(checkpoint_dir)
 
-    helper.visual_check(df.dtypes.to_dict(), "Are all data types ok?")
-
-    df = remove_unneeded_columns(df)
+    store = SnapshotStore(SNAPSHOT_DIR)
+    if refresh_snapshots:
+        store.fetch(WIKIPEDIA_CPU_TABLES)
+    else:
+        store.ensure(WIKIPEDIA_CPU_TABLES)
+    cpus = store.index('cpu_index', build_cpu_index)
 
-    df = split_hardware_availabilty(df)
-
-    df = create_cpu_make(df)
+    helper.visual_check(df.dtypes.to_dict(), "Are all data types ok?")
 
-    df = create_cpu_name(df)
+    df = runner.run(remove_unneeded_columns, df)
 
-    df = create_turbo_boost(df)
+    df = runner.run(split_hardware_availabilty, df)
 
-    df = make_cpu_cores(df)
-    df = make_cpu_chips(df)
+    df = runner.run(create_cpu_make, df)
 
-    df = make_hardware_threads(df)
+    df = runner.run(create_cpu_name, df)
 
-    df = split_psu(df)
+    df = runner.run(create_turbo_boost, df)
 
-    df = make_cpu_family(df)
+    df = runner.run(make_cpu_cores, df)
+    df = runner.run(make_cpu_chips, df)
 
-    df = make_l2_cache(df)
+    df = runner.run(make_hardware_threads, df)
 
-    df = make_l3_cache(df)
+    df = runner.run(split_psu, df)
 
-    df = make_architecture_old(df)
+    df = runner.run(make_cpu_family, df)
 
-    df = make_tdp_and_architecture(df)
+    df = runner.run(make_l2_cache, df)
 
-    df = make_bios_features(df)
+    df = runner.run(make_l3_cache, df)
 
-    df["AvgPower"] = df.loc[:,['100_AvgPower', '90_AvgPower', '80_AvgPower', '70_AvgPower',
-           '60_AvgPower', '50_AvgPower', '40_AvgPower', '30_AvgPower',
-           '20_AvgPower', '10_AvgPower', 'ActiveIdle']].mean(axis=1)
+    df = runner.run(make_architecture_old, df)
 
-    df.to_csv("./../data/spec_data_cleaned_unmelted.csv")
+    df = runner.run(make_tdp_and_architecture, df, cpus)
 
+    df = runner.run(make_bios_features, df)
 
-    df = df.drop("AvgPower", axis=1)
+    unmelted = runner.run(add_average_power, df)
+    unmelted.to_csv("./../data/spec_data_cleaned_unmelted.csv")
 
-    df = melt_power_and_load(df) # spread columns to rows
-    df = clean_power_and_load(df) # move 100_AvgPower => 100 as int
+    df = runner.run(melt_power_and_load, df) # spread columns to rows
+    df = runner.run(clean_power_and_load, df) # move 100_AvgPower => 100 as int
 
     df.to_csv("./../data/spec_data_cleaned.csv")
+    runner.summary()
+
+    # the typed columnar copy the training scripts load instead of the CSV
+    subprocess.run([sys.executable, TRAINING_DATA, '--csv', "./../data/spec_data_cleaned.csv", '--output', "./../data/spec_data_cleaned.feather"], check=True)
 
 
     '''
@@ -963,4 +993,13 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint-dir', type=str, default='./../data/cleaning_checkpoints', help='Directory for the output of every stage.')
+    parser.add_argument('--no-checkpoints', action='store_true', help='Run all stages and do not write checkpoints.')
+    parser.add_argument('--refresh-snapshots', action='store_true', help=f"Fetch the Wikipedia CPU tables into {SNAPSHOT_DIR} again. Needs the network.")
+
+    args = parser.parse_args()
+
+    main(None if args.no_checkpoints else args.checkpoint_dir, args.refresh_snapshots)
@@ -0,0 +1,162 @@
+import os
+import sys
+import time
+import hashlib
+import inspect
+import tracemalloc
+import pandas as pd
+
+"""
+    Runs the stages of data_cleaning.py and checkpoints the data frame every
+    stage returns.
+
+    A checkpoint is keyed by the source code of the stage (including the
+    functions of the same module it calls, the helpers of this project it
+    uses and the values of the module level constants it reads) and the
+    keys of its inputs. The key
+    of a stage output is in turn the input key of the next stage, so changing
+    one cleaning rule only re-runs that stage and the ones after it. Inputs that
+    do not come from a stage (e.g. the freshly read CSV) are keyed by a hash of
+    their content.
+"""
+
+class StageRunner:
+
+    SUFFIX = '.pkl'
+
+    def __init__(self, checkpoint_dir=None, out=sys.stdout):
+        self.checkpoint_dir = checkpoint_dir
+        self.out = out
+        self.outputs = {} # id of a returned frame => (frame, key). The frame is kept, so the id stays unique
+        self.report = []
+
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def run(self, stage, *inputs):
+        key = self.key(stage, inputs)
+        path = self.path(stage, key)
+
+        start = time.monotonic()
+        if path and os.path.isfile(path):
+            df = pd.read_pickle(path)
+            self.record(stage.__name__, 'cached', time.monotonic() - start, None, df)
+        else:
+            tracemalloc.start()
+            try:
+                df = stage(*inputs)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.record(stage.__name__, 'ran', time.monotonic() - start, peak, df)
+
+            if path:
+                self.store(stage, path, df)
+
+        self.outputs[id(df)] = (df, key)
+        return df
+
+    def key(self, stage, inputs):
+        sha = hashlib.sha256()
+        sha.update(pd.__version__.encode('UTF-8'))
+        sha.update(code_hash(stage).encode('UTF-8'))
+        for value in inputs:
+            sha.update(self.input_key(value).encode('UTF-8'))
+        return sha.hexdigest()
+
+    def input_key(self, value):
+        output = self.outputs.get(id(value))
+        if output is not None and output[0] is value:
+            return output[1]
+        return data_hash(value)
+
+    def path(self, stage, key):
+        if not self.checkpoint_dir:
+            return None
+        return os.path.join(self.checkpoint_dir, f"{stage.__name__}-{key[:16]}{self.SUFFIX}")
+
+    def store(self, stage, path, df):
+        # write to a temp file and rename, so an interrupted run never leaves a partial checkpoint
+        tmp_path = f"{path}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+
+        # only the latest checkpoint of every stage is kept
+        for entry in os.scandir(self.checkpoint_dir):
+            if entry.name.startswith(f"{stage.__name__}-") and entry.name.endswith(self.SUFFIX) and entry.path != path:
+                os.remove(entry.path)
+
+    def record(self, name, status, seconds, peak, df):
+        self.report.append((name, status, seconds, peak, df.shape))
+        memory = '-' if peak is None else f"{peak / 1024 / 1024:.1f} MB"
+        print(f"[{status:>6}] {name:<30} {seconds:8.2f} s  peak {memory:>10}  {df.shape[0]} x {df.shape[1]}", file=self.out, flush=True)
+
+    def summary(self):
+        ran = [row for row in self.report if row[1] == 'ran']
+        seconds = sum(row[2] for row in self.report)
+        print(f"{len(self.report)} stages, {len(ran)} ran, {len(self.report) - len(ran)} from checkpoints in {seconds:.2f} s", file=self.out, flush=True)
+        for name, _, stage_seconds, peak, _ in sorted(ran, key=lambda row: -row[2])[:5]:
+            print(f"    {name:<30} {stage_seconds:8.2f} s  peak {peak / 1024 / 1024:.1f} MB", file=self.out)
+
+def code_hash(stage):
+    # The source of the stage and of everything of this project it uses, also indirectly: functions of
+    # its module, modules, functions and classes imported from next to it (e.g. include/) and the values
+    # of the module level constants (e.g. regex tables or mapping dicts). Libraries are not followed
+    sha = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(inspect.getfile(stage)))
+    seen = set()
+    todo = [stage]
+    while todo:
+        function = todo.pop()
+        if function in seen:
+            continue
+        seen.add(function)
+        sha.update(inspect.getsource(function).encode('UTF-8'))
+
+        for name in sorted(set(global_names(function.__code__))):
+            if name not in function.__globals__:
+                continue # e.g. a builtin or an attribute
+            value = function.__globals__[name]
+            if inspect.isfunction(value) and value.__module__ == stage.__module__:
+                todo.append(value)
+            elif inspect.ismodule(value) or inspect.isclass(value) or callable(value):
+                if is_local(value, root) and id(value) not in seen:
+                    seen.add(id(value))
+                    sha.update(f"{name}={inspect.getsource(value)}".encode('UTF-8'))
+            else:
+                sha.update(f"{name}={data_hash(value)}".encode('UTF-8'))
+    return sha.hexdigest()
+
+def global_names(code):
+    # also of the comprehensions and lambdas in the function, which have code objects of their own
+    yield from code.co_names
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            yield from global_names(const)
+
+def is_local(value, root):
+    try:
+        path = os.path.abspath(inspect.getfile(value))
+    except TypeError:
+        return False # builtin
+    return path.startswith(root + os.sep)
+
+def data_hash(value):
+    sha = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        sha.update(repr(list(value.columns)).encode('UTF-8'))
+        sha.update(repr(value.dtypes.astype(str).tolist()).encode('UTF-8'))
+        sha.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    else:
+        sha.update(stable_repr(value).encode('UTF-8'))
+    return sha.hexdigest()
+
+def stable_repr(value):
+    # repr, but the same in every run: sets are sorted, as the order of str in them changes with the hash seed
+    if isinstance(value, (set, frozenset)):
+        return f"{type(value).__name__}({sorted(stable_repr(item) for item in value)})"
+    if isinstance(value, dict):
+        return '{' + ', '.join(f"{stable_repr(key)}: {stable_repr(item)}" for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}({', '.join(stable_repr(item) for item in value)})"
+    return repr(value)
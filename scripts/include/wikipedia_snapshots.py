@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import datetime
+import urllib.request
+from io import StringIO
+import pandas as pd
+from include.stage_runner import code_hash
+
+"""
+    Local snapshots of the Wikipedia pages that data_cleaning.py reads the
+    CPU tables from, so cleaning needs no network.
+
+    Every page is stored as fetched, and manifest.json records its URL, the
+    time of the fetch and its SHA-256. A page whose checksum does not match
+    is never parsed. Indexes built from the pages are stored next to them
+    as CSV, keyed by the checksums of all pages and the source code of the
+    function that built them, so the HTML is only parsed again after a
+    refresh or a change of that function.
+"""
+
+USER_AGENT = 'cloud-energy data cleaning (https://github.com/green-coding-solutions/cloud-energy)'
+
+class SnapshotStore:
+
+    MANIFEST = 'manifest.json'
+
+    # Bump whenever the layout of the store changes
+    VERSION = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def manifest(self):
+        try:
+            with open(self.path(self.MANIFEST), 'r', encoding='UTF-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {'version': self.VERSION, 'pages': {}, 'indexes': {}}
+
+        if manifest.get('version') != self.VERSION:
+            raise ValueError(f"{self.path(self.MANIFEST)} has version {manifest.get('version')}, but only {self.VERSION} is supported")
+        manifest.setdefault('pages', {})
+        manifest.setdefault('indexes', {})
+        return manifest
+
+    def write(self, file_name, data):
+        # write to a temp file and rename, so an interrupted fetch never leaves a partial page
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path(f"{file_name}.tmp")
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, self.path(file_name))
+
+    def save_manifest(self, manifest):
+        self.write(self.MANIFEST, (json.dumps(manifest, indent=4, sort_keys=True) + '\n').encode('UTF-8'))
+
+    def fetch(self, urls, timeout=30):
+        # The only place that needs the network. Pages no longer in urls are dropped
+        manifest = self.manifest()
+        pages = {}
+        for name, url in urls.items():
+            print('Fetching', url)
+            request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = response.read()
+
+            file_name = f"{name}.html"
+            self.write(file_name, data)
+            pages[name] = {
+                'url': url,
+                'file': file_name,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'fetched': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            }
+
+        for name, page in manifest['pages'].items():
+            if name not in pages and os.path.isfile(self.path(page['file'])):
+                os.remove(self.path(page['file']))
+
+        manifest['pages'] = pages
+        self.save_manifest(manifest)
+
+    def missing(self, urls):
+        # names of the urls without a snapshot, e.g. on a checkout where data/wikipedia/ was never committed
+        pages = self.manifest()['pages']
+        return [name for name, url in urls.items() if name not in pages or pages[name]['url'] != url or not os.path.isfile(self.path(pages[name]['file']))]
+
+    def ensure(self, urls, timeout=30):
+        # Fetches all pages if any is missing. Returns whether it did
+        missing = self.missing(urls)
+        if not missing:
+            return False
+
+        print(f"No snapshots of {', '.join(missing)} in {self.directory}. Fetching them once. Commit {self.directory} so the next runs need no network.")
+        try:
+            self.fetch(urls, timeout)
+        except OSError as err: # also urllib.error.URLError
+            raise RuntimeError(f"Fetching the snapshots failed: {err}. Run data_cleaning.py once where the network is available, or copy {self.directory} from a checkout that has them.") from err
+        return True
+
+    def load(self, page):
+        with open(self.path(page['file']), 'rb') as file:
+            data = file.read()
+        if hashlib.sha256(data).hexdigest() != page['sha256']:
+            raise ValueError(f"{self.path(page['file'])} does not match its checksum in {self.MANIFEST}")
+        return data
+
+    def read(self, name):
+        page = self.manifest()['pages'].get(name)
+        if page is None:
+            raise RuntimeError(f"No snapshot of {name} in {self.directory}. Run data_cleaning.py --refresh-snapshots where the network is available.")
+        return self.load(page).decode('UTF-8')
+
+    def tables(self, name):
+        return pd.read_html(StringIO(self.read(name)))
+
+    def key(self, build):
+        sha = hashlib.sha256()
+        sha.update(pd.__version__.encode('UTF-8'))
+        sha.update(code_hash(build).encode('UTF-8'))
+        for name, page in sorted(self.manifest()['pages'].items()):
+            self.load(page) # also a stored index must not outlive a changed page
+            sha.update(f"{name}:{page['sha256']}".encode('UTF-8'))
+        return sha.hexdigest()
+
+    def index(self, name, build):
+        # build(store) parses the pages into a data frame. It is only called if the pages or its code changed
+        key = self.key(build)
+        entry = self.manifest()['indexes'].get(name)
+        file_name = f"{name}.csv"
+
+        if entry is not None and entry['key'] == key and os.path.isfile(self.path(file_name)):
+            # everything as str first, so e.g. model numbers that look like numbers stay str
+            return pd.read_csv(self.path(file_name), dtype=str).astype(entry['dtypes'])
+
+        df = build(self)
+        self.write(file_name, df.to_csv(index=False).encode('UTF-8'))
+
+        manifest = self.manifest()
+        manifest['indexes'][name] = {'key': key, 'file': file_name, 'dtypes': {column: str(dtype) for column, dtype in df.dtypes.items()}}
+        self.save_manifest(manifest)
+
+        return df
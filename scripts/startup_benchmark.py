@@ -0,0 +1,93 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+# Measures the time from starting xgb.py to its first line of output for every CLI mode,
+# plus the slowest top level imports of each mode as reported by python -X importtime.
+#
+#   python3 scripts/startup_benchmark.py --runs 10 --budget-ms 150
+#
+# Exits with 1 if a mode that has a budget (the ones serving from a precomputed curve) is slower.
+
+import os
+import sys
+import time
+import tempfile
+import statistics
+import subprocess
+
+XGB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'xgb.py')
+
+MACHINE = ['--cpu-chips=2', '--cpu-freq=3300', '--cpu-threads=48', '--cpu-cores=24', '--release-year=2019',
+    '--tdp=165', '--ram=384', '--architecture=cascadelake', '--cpu-make=intel']
+
+def modes(curve_file):
+    # name => (arguments, stdin, has budget). The batched formats need numpy for the vectorized
+    # lookup, which alone is about the whole budget, so only the line protocol and the dumps have one.
+    return {
+        'help': (['--help'], b'', False),
+        'curve': (['--curve-file', curve_file, '--silent'], b'50\n', True),
+        'curve --dump-hashmap': (['--curve-file', curve_file, '--silent', '--dump-hashmap'], b'', True),
+        'curve --input-format batch': (['--curve-file', curve_file, '--silent', '--input-format', 'batch'], b'10,50,90\n', False),
+        'model (cached)': (MACHINE + ['--silent'], b'50\n', False),
+    }
+
+def time_to_first_line(arguments, stdin):
+    start = time.perf_counter()
+    with subprocess.Popen([sys.executable, XGB] + arguments,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        process.stdin.write(stdin)
+        process.stdin.close()
+        if not process.stdout.readline():
+            raise RuntimeError(f"xgb.py {' '.join(arguments)} did not output anything")
+        elapsed = time.perf_counter() - start
+        process.stdout.read()
+    return elapsed
+
+def slowest_imports(arguments, stdin, count=5):
+    result = subprocess.run([sys.executable, '-X', 'importtime', XGB] + arguments,
+        input=stdin, capture_output=True, check=False)
+
+    imports = []
+    for line in result.stderr.decode('UTF-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('  '): # only top level imports, nested ones are part of their cumulative time
+            continue
+        imports.append((int(cumulative) / 1000, name.strip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+def main(runs, budget_ms):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        curve_file = os.path.join(tmp_dir, 'benchmark.curve')
+        # also warms the model cache for the 'model (cached)' mode
+        subprocess.run([sys.executable, XGB] + MACHINE + ['--silent', '--export-curve', curve_file], check=True)
+
+        over_budget = []
+        for name, (arguments, stdin, has_budget) in modes(curve_file).items():
+            timings = [time_to_first_line(arguments, stdin) * 1000 for _ in range(runs)]
+            median = statistics.median(timings)
+
+            budget = f" (budget {budget_ms:.0f} ms)" if has_budget else ''
+            print(f"{name:30s} median {median:8.1f} ms  min {min(timings):8.1f} ms{budget}")
+            for milliseconds, module in slowest_imports(arguments, stdin):
+                print(f"{'':30s}   {milliseconds:8.1f} ms  import {module}")
+
+            if has_budget and median > budget_ms:
+                over_budget.append(name)
+
+    if over_budget:
+        print(f"Over budget: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of xgb.py for every CLI mode.')
+    parser.add_argument('--runs', type=int, default=10, help='Runs per mode. The median is reported.')
+    parser.add_argument('--budget-ms', type=float, default=150, help='Budget to first output for the precomputed curve modes.')
+
+    args = parser.parse_args()
+
+    sys.exit(main(args.runs, args.budget_ms))
@@ -0,0 +1,65 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import struct
+
+# Input formats of the xgb.py streaming loop. The choices of its --input-format:
+#
+#   text                one utilization per line, one flushed result line per input (the classic mode)
+#   timestamped         ts_ns,utilization per line. --energy integrates over the timestamps
+#   percpu              comma separated utilization of every CPU per line
+#   timestamped-percpu  ts_ns followed by the CPUs
+#   batch               comma separated utilizations per line, one comma separated result line per input line
+#   binary32            frames of uint32 count + count float32 values, little-endian. Answered with the same framing
+#   binary64            same as binary32 with float64 values
+#
+# batch and binary are handed to PowerCurve.lookup() one whole batch at a time by the functions below.
+# numpy is only imported in them, xgb.py reads INPUT_FORMATS for --help and the curve modes as well.
+INPUT_FORMATS = ['text', 'timestamped', 'percpu', 'timestamped-percpu', 'batch', 'binary32', 'binary64']
+
+BINARY_DTYPES = {
+    'binary32': '<f4',
+    'binary64': '<f8',
+}
+
+FRAME_HEADER = struct.Struct('<I')
+
+def read_exactly(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        if data:
+            raise ValueError(f"Truncated frame: expected {size} bytes, but got {len(data)}")
+        return None
+    return data
+
+def read_batches(source, input_format):
+    import numpy as np
+
+    if input_format == 'batch':
+        for line in source:
+            line = line.strip()
+            if line:
+                yield np.array(line.split(','), dtype=np.float64)
+        return
+
+    dtype = np.dtype(BINARY_DTYPES[input_format])
+    while True:
+        header = read_exactly(source, FRAME_HEADER.size)
+        if header is None:
+            return
+
+        (count,) = FRAME_HEADER.unpack(header)
+        data = read_exactly(source, count * dtype.itemsize) if count else b''
+        if data is None:
+            raise ValueError(f"Truncated frame: expected {count} values, but the input ended")
+
+        yield np.frombuffer(data, dtype=dtype).astype(np.float64)
+
+def write_batch(output, values, input_format):
+    import numpy as np
+
+    if input_format == 'batch':
+        output.write(','.join(map(str, values.tolist())) + '\n')
+    else:
+        output.write(FRAME_HEADER.pack(len(values)))
+        output.write(np.asarray(values, dtype=BINARY_DTYPES[input_format]).tobytes())
+    output.flush()
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+fixture="fixtures/auto-detect"
+cache_dir="tmp/auto-detect-cache"
+expected="{'freq': 2500, 'threads': 8, 'cores': 4, 'tdp': 150.0, 'mem': 377, 'make': 'intel', 'chips': 2}"
+
+rm -rf "$cache_dir"
+
+# Detect from the fixture tree: 2 sockets with 2 cores and 2 threads each
+output=$(python3 ../auto_detect.py --root "$fixture" --cache-dir "$cache_dir" 2> tmp/auto-detect.log)
+if [ "$output" != "$expected" ]; then
+    echo "Validation failed: auto detect returned $output"
+    cat tmp/auto-detect.log
+    exit 1
+fi
+
+# The second run must come from the cache, and --refresh must detect again
+output=$(python3 ../auto_detect.py --root "$fixture" --cache-dir "$cache_dir" 2> tmp/auto-detect.log)
+if [ "$output" != "$expected" ] || ! grep -q 'Using auto detected data' tmp/auto-detect.log; then
+    echo "Validation failed: auto detect did not use the cache"
+    exit 1
+fi
+
+output=$(python3 ../auto_detect.py --root "$fixture" --cache-dir "$cache_dir" --refresh 2> tmp/auto-detect.log)
+if [ "$output" != "$expected" ] || grep -q 'Using auto detected data' tmp/auto-detect.log; then
+    echo "Validation failed: auto detect --refresh used the cache"
+    exit 1
+fi
+
+echo "Validation passed: auto detect matches the fixture tree."
+exit 0
@@ -0,0 +1,59 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+curve_file="tmp/curve.bin"
+header_file="tmp/cloud_energy_curve.h"
+
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --export-curve "$curve_file" --silent || exit 1
+python3 ../xgb.py --curve-file "$curve_file" --vhost-ratio 0.5 --dump-c-header --silent > "$header_file" || exit 1
+
+# The header only build, the shared object and the reporter must all match the curve
+cat > tmp/c-header-test.c << 'EOT'
+#include <stdio.h>
+#include "cloud_energy_curve.h"
+
+int main(void) {
+    double utilizations[] = {0, 0.004, 3.3, 12.34, 50, 77.777, 99.99, 100, 120};
+    for (size_t i = 0; i < sizeof(utilizations) / sizeof(utilizations[0]); i++) {
+        printf("%g %.9g %.9g\n", utilizations[i], cloud_energy_watts(utilizations[i]), cloud_energy_joules(utilizations[i], 2.5));
+    }
+    return 0;
+}
+EOT
+gcc -O2 -Wall -Werror -o tmp/c-header-test tmp/c-header-test.c || exit 1
+gcc -O2 -shared -fPIC -DCLOUD_ENERGY_SHARED -x c "$header_file" -o tmp/libcloud_energy.so || exit 1
+gcc -O2 -Wall -DCLOUD_ENERGY_CURVE="\"$(pwd)/$header_file\"" -o tmp/cpu-utilization-watts ../demo-reporter/cpu-utilization.c || exit 1
+
+tmp/c-header-test | python3 -c "
+import sys, ctypes
+sys.path.insert(0, '..')
+from power_curve import load_curve
+
+curve, _ = load_curve('$curve_file')
+library = ctypes.CDLL('tmp/libcloud_energy.so')
+library.cloud_energy_watts.restype = ctypes.c_double
+library.cloud_energy_watts.argtypes = [ctypes.c_double]
+
+for line in sys.stdin:
+    utilization, watts, joules = map(float, line.split())
+    expected = curve[min(max(utilization, 0), 100)] * 0.5
+    shared = library.cloud_energy_watts(utilization)
+    if abs(watts - expected) > 1e-4 or abs(shared - expected) > 1e-4 or abs(joules - 2.5 * expected) > 1e-3:
+        sys.exit(f'Validation failed: {utilization} % gives {watts} W (shared object {shared} W, {joules} J), expected {expected} W')
+" || exit 1
+
+# Watts straight from the reporter are within the curve
+tmp/cpu-utilization-watts -i 5 -w | head -n 10 | python3 -c "
+import sys
+sys.path.insert(0, '..')
+from power_curve import load_curve
+
+curve, _ = load_curve('$curve_file')
+for line in sys.stdin:
+    if not curve[0] * 0.5 - 1e-4 <= float(line) <= curve[100] * 0.5 + 1e-4:
+        sys.exit(f'Validation failed: the reporter gave {line.strip()} W, outside of the curve')
+" || exit 1
+
+echo "Validation passed: the C header, the shared object and the reporter match the curve."
+exit 0
@@ -0,0 +1,61 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+curve_file="tmp/curve.bin"
+zone="tmp/rapl-zone"
+calibrated_file="tmp/calibrated.bin"
+
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --export-curve "$curve_file" --silent || exit 1
+
+# A simulated powercap zone. Its counter wraps at 1000 J, so it wraps every few samples
+rm -rf "$zone"
+mkdir -p "$zone"
+echo 0 > "$zone/energy_uj"
+echo 1000000000 > "$zone/max_energy_range_uj"
+
+# The simulated machine draws 0.5 * model + 20 W. The driver advances the counter before every
+# sample and waits for the answer, so the calibration always sees the counter of its sample.
+python3 - "$curve_file" "$zone" "$calibrated_file" << 'EOT'
+import sys, subprocess
+sys.path.insert(0, '..')
+from power_curve import load_curve
+
+curve_file, zone, calibrated_file = sys.argv[1:]
+curve, _ = load_curve(curve_file)
+
+process = subprocess.Popen([sys.executable, '../xgb.py', '--curve-file', curve_file, '--input-format', 'timestamped',
+    '--calibrate', '--rapl-zone', zone, '--export-calibrated-curve', calibrated_file, '--silent'],
+    stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+energy_uj = 0
+for i in range(300):
+    utilization = round(i * 7.31 % 100, 2)
+    if i:
+        energy_uj = (energy_uj + round((0.5 * curve[utilization] + 20) * 1_000_000)) % 1_000_000_000
+    with open(f"{zone}/energy_uj", 'w', encoding='UTF-8') as file:
+        file.write(f"{energy_uj}\n")
+
+    process.stdin.write(f"{i * 1_000_000_000},{utilization}\n")
+    process.stdin.flush()
+    process.stdout.readline()
+
+process.stdin.close()
+if process.wait() != 0:
+    sys.exit('Error: xgb.py --calibrate failed')
+
+calibrated, metadata = load_curve(calibrated_file)
+for utilization in [0, 3.3, 12.34, 50, 77.7, 100]:
+    expected = 0.5 * curve[utilization] + 20
+    if abs(calibrated[utilization] - expected) > 0.01:
+        sys.exit(f"Validation failed: calibrated curve at {utilization} is {calibrated[utilization]}, expected {expected}")
+print('Calibrated samples per band:', metadata['calibration']['samples'])
+EOT
+exit_code=$?
+
+if [ $exit_code -ne 0 ]; then
+    exit $exit_code
+fi
+
+echo "Validation passed: calibrated curve matches the simulated RAPL counter."
+exit 0
@@ -0,0 +1,92 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+curve_file="tmp/curve.bin"
+root="tmp/cgroupfs"
+
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --export-curve "$curve_file" --silent || exit 1
+
+rm -rf "$root"
+cp -r fixtures/cgroupfs "$root"
+
+# The driver advances /proc/stat and the cpu.stat files in place (the collector keeps them open),
+# sends a tick and checks the joules of every cgroup against the curve
+python3 - "$curve_file" "$root" << 'EOT'
+import os, sys, subprocess
+sys.path.insert(0, '..')
+from power_curve import load_curve
+
+curve_file, root = sys.argv[1:]
+curve, _ = load_curve(curve_file)
+user_hz = os.sysconf('SC_CLK_TCK')
+
+process = subprocess.Popen([sys.executable, '../cgroups.py', '--curve-file', curve_file, '--cgroup-root', f"{root}/sys/fs/cgroup",
+    '--proc-root', root, '--ticks-from-stdin', '--rescan-seconds', '0', '--silent'],
+    stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+usage = {}
+for name in ['', 'system.slice', 'system.slice/docker-a.scope', 'system.slice/docker-b.scope', 'user.slice']:
+    with open(f"{root}/sys/fs/cgroup/{name}/cpu.stat", encoding='UTF-8') as file:
+        usage[name] = int(file.readline().split()[1])
+with open(f"{root}/proc/stat", encoding='UTF-8') as file:
+    proc_stat = file.read().split('\n')
+fields = [int(value) for value in proc_stat[0].split()[1:]]
+
+def advance(busy_seconds, idle_seconds, usage_seconds):
+    fields[0] += round(busy_seconds * user_hz)
+    fields[3] += round(idle_seconds * user_hz)
+    proc_stat[0] = 'cpu  ' + ' '.join(str(value) for value in fields)
+    with open(f"{root}/proc/stat", 'w', encoding='UTF-8') as file:
+        file.write('\n'.join(proc_stat))
+    for name, seconds in usage_seconds.items():
+        os.makedirs(f"{root}/sys/fs/cgroup/{name}", exist_ok=True)
+        usage[name] = usage.get(name, 0) + round(seconds * 1_000_000)
+        with open(f"{root}/sys/fs/cgroup/{name}/cpu.stat", 'w', encoding='UTF-8') as file:
+            file.write(f"usage_usec {usage[name]}\nuser_usec 0\nsystem_usec 0\n")
+
+def tick(timestamp):
+    process.stdin.write(f"{timestamp}\n")
+    process.stdin.flush()
+    joules = {}
+    while True:
+        ts, name, value = process.stdout.readline().strip().split(',')
+        if int(ts) != timestamp:
+            sys.exit(f"Validation failed: tick {timestamp} answered with {ts}")
+        joules[name] = float(value)
+        if name == 'host':
+            return joules
+
+def check(joules, seconds, utilization, busy_seconds, expected_seconds):
+    host = curve[utilization] * seconds
+    idle = curve[0] * seconds
+    expected = {name: (host - idle) * cgroup_seconds / busy_seconds for name, cgroup_seconds in expected_seconds.items()}
+    expected.update({'idle': idle, 'host': host})
+    if joules.keys() != expected.keys():
+        sys.exit(f"Validation failed: got cgroups {sorted(joules)}, expected {sorted(expected)}")
+    for name, value in expected.items():
+        if abs(joules[name] - value) > 1e-6 * max(abs(value), 1):
+            sys.exit(f"Validation failed: {name} has {joules[name]} J, expected {value} J")
+
+check(tick(1_000_000_000), 0, 0, 1, {}) # only sets the start
+
+# 4 CPUs for 2 seconds, 50 % busy. docker-c appears during the interval, it is picked up for the next tick
+advance(4, 4, {'': 4, 'system.slice': 3, 'system.slice/docker-a.scope': 2, 'system.slice/docker-b.scope': 1, 'system.slice/docker-c.scope': 0.5})
+check(tick(3_000_000_000), 2, 50, 4, {'/': 4, '/system.slice': 3, '/system.slice/docker-a.scope': 2, '/system.slice/docker-b.scope': 1})
+
+# 4 CPUs for 1 second, 25 % busy, user.slice and docker-c ran
+advance(1, 3, {'': 1, 'user.slice': 0.25, 'system.slice': 0.75, 'system.slice/docker-c.scope': 0.75})
+check(tick(4_000_000_000), 1, 25, 1, {'/': 1, '/user.slice': 0.25, '/system.slice': 0.75, '/system.slice/docker-c.scope': 0.75})
+
+process.stdin.close()
+if process.wait() != 0:
+    sys.exit('Error: cgroups.py failed')
+EOT
+exit_code=$?
+
+if [ $exit_code -ne 0 ]; then
+    exit $exit_code
+fi
+
+echo "Validation passed: cgroup energy matches the curve."
+exit 0
@@ -0,0 +1,57 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+raw_dir="tmp/spec-power"
+cache_file="tmp/spec_data_cache.sqlite"
+output_file="tmp/spec_data.csv"
+expected_file="fixtures/spec_data_expected.csv"
+
+rm -rf "$raw_dir" "$cache_file"
+cp -r fixtures/spec-power "$raw_dir"
+
+build() {
+    python3 -W ignore ../scripts/create_data_csv.py --raw-dir "$raw_dir" --output "$output_file" --cache "$cache_file" --jobs 2 2> tmp/create-data.log || {
+        echo "Error: create_data_csv.py failed"
+        cat tmp/create-data.log
+        exit 1
+    }
+}
+
+expect_log() {
+    if ! grep -q "$1" tmp/create-data.log; then
+        echo "Validation failed: expected '$1', but got: $(cat tmp/create-data.log)"
+        exit 1
+    fi
+}
+
+# Full build, then a rebuild that only reads the cache. Both must match the fixture CSV
+build
+expect_log "2 reports, 2 parsed, 0 from cache"
+cmp -s "$output_file" "$expected_file" || { echo "Validation failed: $output_file differs from $expected_file"; exit 1; }
+
+build
+expect_log "2 reports, 0 parsed, 2 from cache"
+cmp -s "$output_file" "$expected_file" || { echo "Validation failed: the cached $output_file differs from $expected_file"; exit 1; }
+
+# A changed report is parsed again, a removed one leaves the cache
+sed -i 's/<td>48.6<\/td>/<td>47.9<\/td>/' "$raw_dir/power_ssj2008-20190313-00001.html"
+build
+expect_log "2 reports, 1 parsed, 1 from cache, 1 removed from cache"
+if ! grep -q '|47.9|' "$output_file"; then
+    echo "Validation failed: the changed report was not parsed again"
+    exit 1
+fi
+
+rm "$raw_dir/power_ssj2008-20190313-00001.html"
+build
+expect_log "1 reports, 0 parsed, 1 from cache, 1 removed from cache"
+
+# The single pass extractor must give the same rows as the regex extractor it replaced
+python3 ../scripts/extractor_benchmark.py --reports 300 --repeats 1 || {
+    echo "Validation failed: the extractors disagree on the synthetic reports"
+    exit 1
+}
+
+echo "Validation passed: the incremental build matches the fixture CSV."
+exit 0
@@ -0,0 +1,104 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+curve_file="tmp/curve.bin"
+output_file="tmp/output.txt"
+expected_file="tmp/expected_curve.txt"
+
+# Export the power curve of a fixed machine
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --export-curve "$curve_file"
+exit_code=$?
+
+if [ $exit_code -ne 0 ]; then
+    echo "Error: xgb.py --export-curve failed with exit code $exit_code"
+    exit $exit_code
+fi
+
+# Serve from the exported curve. This path must not need numpy, pandas or xgboost
+output=$(printf "0\n12.34\n100\n" | python3 -X importtime ../xgb.py --curve-file "$curve_file" --vhost-ratio=0.5 2> tmp/importtime.txt)
+exit_code=$?
+
+if [ $exit_code -ne 0 ]; then
+    echo "Error: xgb.py --curve-file failed with exit code $exit_code"
+    cat tmp/importtime.txt
+    exit $exit_code
+fi
+
+echo "$output" > "$output_file"
+echo "Output saved to $output_file"
+
+if grep -E -q '\| (numpy|pandas|xgboost)$' tmp/importtime.txt; then
+    echo "Validation failed: --curve-file imported numpy, pandas or xgboost"
+    exit 1
+fi
+
+cat > "$expected_file" << 'EOT'
+42.86914825439453
+61.38673400878906
+202.12582397460938
+EOT
+
+if ! diff -u "$output_file" "$expected_file"; then
+    echo "Validation failed: Output does not match expected curve values."
+    exit 1
+fi
+
+# The batched and binary protocols must give the same values as the line protocol
+output=$(printf "0,12.34,100\n" | python3 ../xgb.py --curve-file "$curve_file" --vhost-ratio=0.5 --input-format batch --silent)
+if [ "$output" != "42.86914825439453,61.38673400878906,202.12582397460938" ]; then
+    echo "Validation failed: --input-format batch returned $output"
+    exit 1
+fi
+
+# Non-finite utilizations are rejected like out of range ones, also in the line protocol
+for input_format in batch text; do
+    for value in nan inf; do
+        if printf "10\n$value\n" | python3 ../xgb.py --curve-file "$curve_file" --input-format $input_format --silent > /dev/null 2> tmp/curve-error.log \
+                || ! grep -q "Utilization must be between 0 and 100\|Utilization can not be over 100" tmp/curve-error.log; then
+            echo "Validation failed: --input-format $input_format accepted $value: $(cat tmp/curve-error.log)"
+            exit 1
+        fi
+    done
+done
+
+# Energy over explicit timestamps must not depend on when the lines arrive
+output=$(printf "1000000000,50\n3000000000,100\n3500000000,0\n" | python3 ../xgb.py --curve-file "$curve_file" --input-format timestamped --energy --integration trapezoid --silent | tr '\n' ' ')
+if [ "$output" != "0.0 608.0394287109375 122.49748611450195 " ]; then
+    echo "Validation failed: --input-format timestamped --energy returned $output"
+    exit 1
+fi
+
+# Windows aggregate the samples, Joules of an interval belong to the window of the sample ending it
+output=$(printf "1000000000,50\n3000000000,100\n3500000000,0\n10500000000,20\n11000000000,20\n" | python3 ../xgb.py --curve-file "$curve_file" --input-format timestamped --window-seconds 10 --silent | tr '\n' ' ')
+if [ "$output" != "0,3,85.73829650878906,231.25924173990884,404.25164794921875,851.372444152832 10000000000,2,145.8054962158203,145.8054962158203,145.8054962158203,1093.5412216186523 " ]; then
+    echo "Validation failed: --window-seconds returned $output"
+    exit 1
+fi
+
+# Per CPU input: host first, then the groups. Idle power is split evenly, the rest by utilization
+output=$(printf "1700000000000000000,10,30,50,70\n1700000002000000000,10,30,50,70\n" | python3 ../xgb.py --curve-file "$curve_file" --input-format timestamped-percpu --energy --cpu-group a=0-1 --cpu-group b=2,3 --silent | tr '\n' ' ')
+if [ "$output" != "0.0,0.0,0.0 351.5179443359375,130.7486343383789,220.7693099975586 " ]; then
+    echo "Validation failed: --input-format timestamped-percpu returned $output"
+    exit 1
+fi
+
+output=$(printf "0\n12.34\n100\n" | python3 -c "
+import sys, struct
+values = [float(line) for line in sys.stdin]
+sys.stdout.buffer.write(struct.pack(f'<I{len(values)}d', len(values), *values))
+" | python3 ../xgb.py --curve-file "$curve_file" --vhost-ratio=0.5 --input-format binary64 --silent | python3 -c "
+import sys, struct
+data = sys.stdin.buffer.read()
+count, = struct.unpack_from('<I', data)
+print(*struct.unpack_from(f'<{count}d', data, 4), sep='\n')
+")
+echo "$output" > "$output_file"
+
+if diff -u "$output_file" "$expected_file"; then
+    echo "Validation passed: Output matches expected curve values."
+    exit 0
+else
+    echo "Validation failed: --input-format binary64 does not match expected curve values."
+    exit 1
+fi
@@ -0,0 +1,109 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+socket="$(pwd)/tmp/daemon.sock"
+output_file="tmp/output.txt"
+expected_file="tmp/expected_daemon.txt"
+
+python3 ../daemon.py --socket "$socket" --no-model-cache --max-curves 2 --silent &
+daemon_pid=$!
+trap 'kill $daemon_pid 2> /dev/null' EXIT
+
+# wait until the daemon answers. A socket file alone could still be one a killed daemon left behind
+for i in $(seq 1 50); do
+    curl -s --fail --unix-socket "$socket" http://localhost/health > /dev/null && break
+    sleep 0.1
+done
+
+if ! curl -s --fail --unix-socket "$socket" http://localhost/health > /dev/null; then
+    echo "Error: daemon.py does not answer on $socket"
+    exit 1
+fi
+
+{
+    curl -s --fail-with-body --unix-socket "$socket" http://localhost/estimate \
+        -d '{"profile": {}, "utilization": [0, 5, 10, 100]}'
+    echo
+    curl -s --fail-with-body --unix-socket "$socket" http://localhost/estimate/batch \
+        -d '{"requests": [{"profile": {"cpu-chips": 2, "cpu-freq": 3300, "cpu-threads": 48, "cpu-cores": 24, "release-year": 2019, "tdp": 165, "ram": 384, "architecture": "cascadelake", "cpu-make": "intel"}, "utilization": 10, "vhost_ratio": 0.04167}, {"profile": {}, "utilization": 5, "interval": 2}, {"utilization": 101}]}'
+    echo
+} > "$output_file"
+echo "Output saved to $output_file"
+
+# A new profile is trained in the background. Curves that are already built must not wait for it
+curl -s --fail-with-body --unix-socket "$socket" http://localhost/estimate \
+    -d '{"profile": {"cpu-chips": 1}, "utilization": 50}' > tmp/daemon_training.txt &
+training_pid=$!
+sleep 0.2
+{
+    curl -s --max-time 1 --fail-with-body --unix-socket "$socket" http://localhost/estimate \
+        -d '{"profile": {}, "utilization": 100}'
+    echo
+    wait $training_pid && echo "trained"
+    # only the two most recently used curves are kept
+    curl -s --fail-with-body --unix-socket "$socket" http://localhost/health
+    echo
+    # not a JSON object, not a profile
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '[1, 2]'
+    echo
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '{"profile": [1, 2], "utilization": 5}'
+    echo
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate/batch -d '{"requests": 5}'
+    echo
+    # a make the training data does not know
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '{"profile": {"cpu-make": "arm"}, "utilization": 5}'
+    echo
+    # utilizations and intervals that are not numbers. In a batch only their item fails
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '{"utilization": null}'
+    echo
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '{"utilization": [10, NaN]}'
+    echo
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate -d '{"utilization": 10, "interval": Infinity}'
+    echo
+    curl -s -w ' %{http_code}' --unix-socket "$socket" http://localhost/estimate/batch \
+        -d '{"requests": [{"utilization": null}, {"utilization": [NaN]}, {"utilization": 10}]}'
+    echo
+} >> "$output_file"
+
+cat > "$expected_file" << 'EOT'
+{"watts": [93.39746856689453, 93.39746856689453, 113.80100631713867, 330.0968933105469]}
+{"results": [{"watts": 4.623978795776367}, {"watts": 93.39746856689453, "joules": 186.79493713378906}, {"error": "Utilization must be between 0 and 100"}]}
+{"watts": 330.0968933105469}
+trained
+{"status": "ok", "curves": 2, "named": []}
+{"error": "A request must be a JSON object, but was [1, 2]"} 400
+{"error": "profile must be an object or the name of a curve, but was [1, 2]"} 400
+{"error": "A batch must be a JSON object with a list of requests"} 400
+{"error": "The training data does not contain any servers with ['CPUMake_arm']. Please select a different make or architecture."} 422
+{"error": "utilization must be a number or a list of numbers, but was None"} 400
+{"error": "utilization must be a number or a list of numbers, but was [10, nan]"} 400
+{"error": "interval must be a number or a list of numbers, but was inf"} 400
+{"results": [{"error": "utilization must be a number or a list of numbers, but was None"}, {"error": "utilization must be a number or a list of numbers, but was [nan]"}, {"watts": 113.80100631713867}]} 200
+EOT
+
+kill $daemon_pid
+wait $daemon_pid
+if [ -e "$socket" ]; then
+    echo "Error: daemon.py did not remove $socket when it was stopped"
+    exit 1
+fi
+
+# A --socket path that is not a socket is never removed
+echo "not a socket" > tmp/daemon-not-a-socket
+if python3 ../daemon.py --socket tmp/daemon-not-a-socket --silent 2> tmp/daemon-error.log; then
+    echo "Error: daemon.py started on a regular file"
+    exit 1
+fi
+if [ "$(cat tmp/daemon-not-a-socket)" != "not a socket" ] || ! grep -q "is not a socket" tmp/daemon-error.log; then
+    echo "Error: daemon.py replaced a regular file at --socket: $(cat tmp/daemon-error.log)"
+    exit 1
+fi
+
+if diff -u "$output_file" "$expected_file"; then
+    echo "Validation passed: Output matches expected daemon responses."
+    exit 0
+else
+    echo "Validation failed: Output does not match expected daemon responses."
+    exit 1
+fi
@@ -0,0 +1,98 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+inventory_file="tmp/fleet-inventory.csv"
+cache_dir="tmp/fleet-cache"
+rm -rf "$cache_dir" tmp/fleet-curves.*
+
+# a and b share a model (b only has another vHost ratio), d has other values but the same columns.
+# arm is not in the training data, so c is skipped and the run exits with 2
+cat > "$inventory_file" << 'EOT'
+id,cpu-chips,cpu-freq,cpu-threads,cpu-cores,release-year,tdp,ram,architecture,cpu-make,vhost-ratio
+a,2,3300,48,24,2019,165,384,cascadelake,intel,1.0
+b,2,3300,48,24,2019,165,384,cascadelake,intel,0.5
+c,1,2000,8,4,2017,80,32,,arm,1.0
+d,2,2100,32,16,2018,85,192,cascadelake,intel,1.0
+EOT
+
+for format in csv parquet feather; do
+    python3 -W ignore ../fleet.py "$inventory_file" "tmp/fleet-curves.$format" --model-cache-dir "$cache_dir" 2> tmp/fleet.log
+    exit_code=$?
+    if [ $exit_code -ne 2 ]; then
+        echo "Validation failed: fleet.py with .$format output exited with $exit_code, expected 2 for the skipped profile"
+        cat tmp/fleet.log
+        exit 1
+    fi
+done
+
+if ! grep -q "4 profiles need 2 distinct models" tmp/fleet.log; then
+    echo "Validation failed: the profiles were not grouped into 2 models: $(cat tmp/fleet.log)"
+    exit 1
+fi
+if ! grep -q "Skipping 1 profiles: .*CPUMake_arm" tmp/fleet.log; then
+    echo "Validation failed: the profile with the unknown make was not skipped: $(cat tmp/fleet.log)"
+    exit 1
+fi
+
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --no-model-cache --dump --silent > tmp/fleet-dump.txt || exit 1
+
+# Every writer gives the same curves and they are the curves of xgb.py --dump
+python3 -c "
+import sys
+import pandas as pd
+
+dump = {}
+with open('tmp/fleet-dump.txt', encoding='UTF-8') as file:
+    for line in file:
+        key, value = line.split(' : ')
+        dump[float(key)] = float(value)
+
+csv = pd.read_csv('tmp/fleet-curves.csv')
+for other in [pd.read_parquet('tmp/fleet-curves.parquet'), pd.read_feather('tmp/fleet-curves.feather')]:
+    pd.testing.assert_frame_equal(other.reset_index(drop=True), csv, check_dtype=False)
+
+if list(csv.id) != ['a', 'b', 'd']:
+    sys.exit(f'Validation failed: expected the curves of a, b and d, but got {list(csv.id)}')
+
+for profile, ratio in [('a', 1.0), ('b', 0.5)]:
+    row = csv[csv.id == profile].iloc[0]
+    for utilization in range(0, 101):
+        expected = dump[float(utilization)] * ratio
+        if abs(row[f'watts_{utilization}'] - expected) > 1e-4:
+            sys.exit(f'Validation failed: {profile} has {row[f\"watts_{utilization}\"]} W at {utilization} %, xgb.py --dump has {expected} W')
+" || exit 1
+
+# --prebuild trains every model once into the cache. The unknown make fails on its own and
+# the run exits with 2. A second run only loads from the cache
+prebuild_cache_dir="tmp/fleet-prebuild-cache"
+rm -rf "$prebuild_cache_dir"
+
+prebuild() {
+    python3 -W ignore ../fleet.py "$inventory_file" --prebuild --jobs 2 --model-cache-dir "$prebuild_cache_dir" 2> tmp/fleet-prebuild.log
+    exit_code=$?
+    if [ $exit_code -ne 2 ]; then
+        echo "Validation failed: fleet.py --prebuild exited with $exit_code, expected 2 for the failed model"
+        cat tmp/fleet-prebuild.log
+        exit 1
+    fi
+}
+
+expect_prebuild() {
+    if [ "$(grep -c "$1" tmp/fleet-prebuild.log)" -ne "$2" ]; then
+        echo "Validation failed: expected $2 lines with '$1', but got: $(cat tmp/fleet-prebuild.log)"
+        exit 1
+    fi
+}
+
+prebuild
+expect_prebuild " trained  chips: 2" 1
+expect_prebuild " failed: .*CPUMake_arm" 1
+expect_prebuild "Built 2 models .* 1 failed" 1
+
+prebuild
+expect_prebuild " cached  chips: 2" 1
+expect_prebuild " failed: .*CPUMake_arm" 1
+
+echo "Validation passed: fleet curves match xgb.py --dump."
+exit 0
@@ -0,0 +1,152 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+socket="$(pwd)/tmp/multistream.sock"
+fifo="$(pwd)/tmp/multistream.fifo"
+port=18751
+fifo_output="tmp/multistream-fifo.txt"
+cache_dir="tmp/multistream-cache"
+
+python3 ../xgb.py --dump --silent > tmp/multistream-dump.txt || exit 1
+python3 ../xgb.py --export-curve tmp/multistream.curve --silent || exit 1
+
+rm -f "$fifo"
+python3 ../multistream.py --socket "$socket" --port $port --fifo "$fifo" --curve-file default=tmp/multistream.curve \
+    --model-cache-dir "$cache_dir" --silent > "$fifo_output" &
+multistream_pid=$!
+trap 'kill $multistream_pid 2> /dev/null' EXIT
+
+# Streams over the socket and TCP: a trained profile and a --curve-file with their vHost ratios,
+# Joules since the last sample and an error answer per bad line, after which the connection goes on
+python3 - "$socket" $port "$fifo" "$fifo_output" << 'EOT' || exit 1
+import sys
+import time
+import socket
+
+socket_path, port, fifo, fifo_output = sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4]
+
+dump = {}
+with open('tmp/multistream-dump.txt', encoding='UTF-8') as file:
+    for line in file:
+        key, value = line.split(' : ')
+        dump[float(key)] = float(value)
+
+def fail(message):
+    sys.exit(f"Validation failed: {message}")
+
+def connect(family, address):
+    # a socket file left by an earlier run refuses connections until multistream.py replaced it
+    for _ in range(100):
+        try:
+            connection = socket.socket(family, socket.SOCK_STREAM)
+            connection.connect(address)
+            return connection
+        except OSError:
+            connection.close()
+            time.sleep(0.1)
+    fail(f"multistream.py does not accept connections on {address}")
+
+def check_watts(answer, stream_id, expected):
+    answer_id, _, value = answer.partition(' ')
+    if answer_id != stream_id or abs(float(value) - expected) > 1e-4:
+        fail(f"expected {stream_id} {expected}, but got {answer!r}")
+
+def check_error(answer, prefix):
+    if not answer.startswith(prefix):
+        fail(f"expected an answer starting with {prefix!r}, but got {answer!r}")
+
+def check_streams(name, connection):
+    file = connection.makefile('rw', encoding='UTF-8')
+
+    def send(line):
+        file.write(line + '\n')
+        file.flush()
+
+    def answer():
+        line = file.readline()
+        if not line:
+            fail(f"{name}: the connection was closed")
+        return line.rstrip('\n')
+
+    send('{"stream": "vm-1", "profile": {}, "vhost_ratio": 0.25}')
+    send('{"stream": "vm-2", "profile": "default", "vhost_ratio": 0.5}')
+    for stream_id, utilization, ratio in [('vm-1', 12.5, 0.25), ('vm-2', 80, 0.5), ('vm-1', 100, 0.25), ('vm-2', 0.01, 0.5)]:
+        send(f"{stream_id} {utilization}")
+        check_watts(answer(), stream_id, dump[float(utilization)] * ratio)
+
+    send('vm-9 10')
+    check_error(answer(), 'vm-9 error Unknown stream vm-9')
+    send('vm-1 101')
+    check_error(answer(), 'vm-1 error Utilization can not be over 100%')
+    send('vm-1 nan')
+    check_error(answer(), 'vm-1 error Utilization must be between 0 and 100')
+    send('vm-1 many')
+    check_error(answer(), 'vm-1 error could not convert string to float')
+    send('{"stream": "vm 3"}')
+    check_error(answer(), '- error Stream ids must not contain spaces')
+    send('{"stream": "vm-3", "profile": "unknown"}')
+    check_error(answer(), '- error')
+    send('{"stream": "vm-3", "profile": {"cpu-make": "arm"}}')
+    check_error(answer(), '- error The training data does not contain any servers')
+    send('{"stream": ')
+    check_error(answer(), '- error')
+
+    # still serving after the errors
+    send('vm-1 50')
+    check_watts(answer(), 'vm-1', dump[50.0] * 0.25)
+
+    # Joules are Watts times the seconds since the previous sample of the stream
+    send('{"stream": "vm-3", "profile": "default", "energy": true}')
+    send('vm-3 50')
+    answer()
+    time.sleep(0.5)
+    send('vm-3 50')
+    answer_id, _, value = answer().partition(' ')
+    seconds = float(value) / dump[50.0]
+    if answer_id != 'vm-3' or not 0.5 <= seconds < 1.0:
+        fail(f"{name}: expected the Joules of about 0.5 s at {dump[50.0]} W, but got {value} J ({seconds} s)")
+
+    connection.close()
+    print(f"{name} streams are as expected")
+
+check_streams('socket', connect(socket.AF_UNIX, socket_path))
+check_streams('TCP', connect(socket.AF_INET, ('127.0.0.1', port)))
+
+# Named pipes are answered on STDOUT
+with open(fifo, 'w', encoding='UTF-8') as file:
+    file.write('{"stream": "vm-4", "profile": "default", "vhost_ratio": 0.5}\nvm-4 25\nvm-5 25\n')
+
+for _ in range(100):
+    with open(fifo_output, encoding='UTF-8') as file:
+        lines = file.read().splitlines()
+    if len(lines) >= 2:
+        break
+    time.sleep(0.1)
+else:
+    fail(f"expected 2 answers to the named pipe, but got {lines}")
+
+check_watts(lines[0], 'vm-4', dump[25.0] * 0.5)
+check_error(lines[1], 'vm-5 error Unknown stream vm-5')
+print('named pipe streams are as expected')
+EOT
+
+kill $multistream_pid
+wait $multistream_pid
+if [ -e "$socket" ]; then
+    echo "Error: multistream.py did not remove $socket when it was stopped"
+    exit 1
+fi
+
+# A --socket path that is not a socket is never removed
+echo "not a socket" > tmp/multistream-not-a-socket
+if python3 ../multistream.py --socket tmp/multistream-not-a-socket --silent 2> tmp/multistream-error.log; then
+    echo "Error: multistream.py started on a regular file"
+    exit 1
+fi
+if [ "$(cat tmp/multistream-not-a-socket)" != "not a socket" ] || ! grep -q "is not a socket" tmp/multistream-error.log; then
+    echo "Error: multistream.py replaced a regular file at --socket: $(cat tmp/multistream-error.log)"
+    exit 1
+fi
+
+echo "Validation passed: multistream.py answers every stream as expected."
@@ -0,0 +1,35 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+output_file="tmp/output.txt"
+expected_file="tmp/expected_powercap.txt"
+
+# chips, TDP of one package, summed TDP and the zone tree of every fixture
+for fixture in fixtures/powercap/eight-socket fixtures/powercap/laptop-psys fixtures/auto-detect; do
+    python3 ../auto_detect.py --root "$fixture" --topology 2> tmp/powercap.log | python3 -c "
+import sys, json
+topology = json.load(sys.stdin)
+zones = ' '.join(zone['name'] + ''.join(f'/{subzone[\"name\"]}' for subzone in zone['subzones']) for zone in topology['zones'])
+print(topology['chips'], topology['package_tdp'], topology['tdp'], zones)
+"
+    if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+        echo "Error: auto_detect.py --topology failed for $fixture"
+        cat tmp/powercap.log
+        exit 1
+    fi
+done > "$output_file"
+
+cat > "$expected_file" << 'EOT'
+8 205.0 1640.0 package-0/dram package-1/dram package-2/dram package-3/dram package-4/dram package-5/dram package-6/dram package-7/dram package-0
+1 28.0 28.0 package-0/core/uncore psys
+2 150.0 300.0 package-0/dram package-1/dram
+EOT
+
+if diff -u "$output_file" "$expected_file"; then
+    echo "Validation passed: powercap topologies match the fixtures."
+    exit 0
+else
+    echo "Validation failed: powercap topologies do not match the fixtures."
+    exit 1
+fi
@@ -0,0 +1,81 @@
+#!/bin/bash
+
+mkdir -p tmp
+rm -f tmp/replay-*
+
+python3 ../xgb.py --export-curve tmp/replay.curve --silent || exit 1
+
+# Three hosts with irregular samples over three hours, split by time into three files. Every
+# host has intervals across both file boundaries. The middle file is also written as Parquet
+python3 -c "
+import numpy as np
+import pandas as pd
+
+rng = np.random.default_rng(42)
+frames = []
+for host in ['web-1', 'web-2', 'db-1']:
+    timestamps = np.sort(rng.choice(np.arange(0, 3 * 3600 * 1000), size=1500, replace=False)) * 1_000_000
+    frames.append(pd.DataFrame({'host': host, 'timestamp': timestamps, 'utilization': rng.integers(0, 10001, size=len(timestamps)) / 100}))
+
+log = pd.concat(frames).sort_values('timestamp', kind='stable') # in time order, the rows of all hosts interleaved
+log.to_csv('tmp/replay-all.csv', index=False)
+for part, (start, end) in enumerate([(0, 1), (1, 2), (2, 3)]):
+    hours = log.timestamp // (3600 * 1_000_000_000)
+    log[(hours >= start) & (hours < end)].to_csv(f'tmp/replay-part{part}.csv', index=False)
+pd.read_csv('tmp/replay-part1.csv').to_parquet('tmp/replay-part1.parquet', index=False)
+# the same log with fractional seconds, e.g. 1234.567
+log.assign(timestamp=log.timestamp / 1_000_000_000).to_csv('tmp/replay-seconds.csv', index=False)
+" || exit 1
+
+replay() {
+    name=$1
+    shift
+    python3 -W ignore ../replay.py "$@" --curve-file tmp/replay.curve --vhost-ratio 0.5 --bucket-seconds 1800 --output "tmp/replay-$name.csv" --silent || exit 1
+}
+
+for rule in step trapezoid; do
+    replay "$rule-single" tmp/replay-all.csv --integration $rule --jobs 1
+    replay "$rule-chunked" tmp/replay-all.csv --integration $rule --jobs 1 --chunk-size 97
+    replay "$rule-files" tmp/replay-part0.csv tmp/replay-part1.csv tmp/replay-part2.csv --integration $rule --jobs 1 --chunk-size 97
+    replay "$rule-jobs" tmp/replay-part0.csv tmp/replay-part1.csv tmp/replay-part2.csv --integration $rule --jobs 3
+    replay "$rule-parquet" tmp/replay-part0.csv tmp/replay-part1.parquet tmp/replay-part2.csv --integration $rule --jobs 2 --chunk-size 97
+    replay "$rule-seconds" tmp/replay-seconds.csv --integration $rule --jobs 1 --time-unit s
+done
+
+# Every way of reading the log gives the totals and buckets of one EnergyIntegrator per host
+python3 -c "
+import sys
+sys.path.insert(0, '..')
+import pandas as pd
+from energy import EnergyIntegrator
+from power_curve import load_curve
+
+curve, _ = load_curve('tmp/replay.curve')
+log = pd.read_csv('tmp/replay-all.csv').sort_values(['host', 'timestamp'])
+bucket_ns = 1800 * 1_000_000_000
+
+for rule in ['step', 'trapezoid']:
+    rows = []
+    for host, samples in log.groupby('host'):
+        integrator = EnergyIntegrator(rule)
+        for timestamp, utilization in zip(samples.timestamp, samples.utilization):
+            watts = curve[utilization] * 0.5
+            rows.append((host, timestamp // bucket_ns * bucket_ns, integrator.add(timestamp, watts), watts))
+
+    expected = pd.DataFrame(rows, columns=['host', 'bucket', 'joules', 'watts']).groupby(['host', 'bucket']).agg(
+        samples=('watts', 'size'), joules=('joules', 'sum'),
+        watts_mean=('watts', 'mean'), watts_min=('watts', 'min'), watts_max=('watts', 'max')).reset_index()
+    expected['bucket'] = pd.to_datetime(expected['bucket'], unit='ns', utc=True)
+
+    for mode in ['single', 'chunked', 'files', 'jobs', 'parquet', 'seconds']:
+        result = pd.read_csv(f'tmp/replay-{rule}-{mode}.csv')
+        result['bucket'] = pd.to_datetime(result['bucket'], utc=True)
+        result = result.sort_values(['host', 'bucket']).reset_index(drop=True)
+        try:
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+        except AssertionError as err:
+            sys.exit(f'Validation failed: replay.py {mode} with {rule} does not match EnergyIntegrator: {err}')
+        print(f'{rule} {mode}: {result.joules.sum():.3f} J in {len(result)} buckets as expected')
+" || exit 1
+
+echo "Validation passed: replay.py gives the totals and buckets of EnergyIntegrator."
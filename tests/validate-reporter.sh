@@ -0,0 +1,66 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+curve_file="tmp/curve.bin"
+# Checks the reporter compiled from source, or the binary given, e.g. ../demo-reporter/static-binary-linux-amd64
+reporter="${1:-tmp/cpu-utilization}"
+
+if [ -z "$1" ]; then
+    gcc -O2 -Wall -o "$reporter" ../demo-reporter/cpu-utilization.c || exit 1
+fi
+
+python3 ../xgb.py --cpu-chips=2 --cpu-freq=3300 --cpu-threads=48 --cpu-cores=24 --release-year=2019 --tdp=165 --ram=384 --architecture="cascadelake" --cpu-make="intel" --export-curve "$curve_file" --silent || exit 1
+
+# The reporter runs until its output is closed, so every check reads a fixed number of samples.
+# xgb.py has to accept every output format of the reporter.
+cpus=$(grep -c '^cpu[0-9]' /proc/stat)
+
+# text, timestamped, per CPU and timestamped per CPU lines
+check_lines() {
+    local format=$1
+    local columns=$2
+    shift 2
+    local output
+    output=$("$reporter" -i 5 "$@" | head -n 20 | python3 ../xgb.py --curve-file "$curve_file" --input-format "$format" --silent)
+    if [ "$(echo "$output" | wc -l)" -ne 20 ]; then
+        echo "Validation failed: reporter $* with --input-format $format did not produce 20 results"
+        exit 1
+    fi
+    if [ "$(echo "$output" | head -n 1 | awk -F, '{print NF}')" -ne "$columns" ]; then
+        echo "Validation failed: reporter $* with --input-format $format has the wrong number of columns"
+        exit 1
+    fi
+}
+
+check_lines text 1
+check_lines timestamped 1 -t
+check_lines percpu $((cpus + 1)) -p
+check_lines timestamped-percpu $((cpus + 1)) -t -p -r
+
+# the timestamps must be nanoseconds, 5 ms apart
+"$reporter" -i 5 -t | head -n 11 | python3 -c "
+import sys
+timestamps = [int(line.split(',')[0]) for line in sys.stdin]
+mean = (timestamps[-1] - timestamps[0]) / (len(timestamps) - 1)
+if not 4_000_000 < mean < 10_000_000:
+    sys.exit(f'Validation failed: timestamps are {mean} ns apart, expected 5000000')
+" || exit 1
+
+# binary frames: 4 frames of 50 samples at 1000 Hz
+for bits in 32 64; do
+    "$reporter" -i 1 -b 50 -f "$bits" | head -c $((4 * (4 + 50 * bits / 8))) | python3 ../xgb.py --curve-file "$curve_file" --input-format "binary$bits" --silent | python3 -c "
+import sys, struct
+data = sys.stdin.buffer.read()
+frames = 0
+while data:
+    (count,) = struct.unpack('<I', data[:4])
+    data = data[4 + count * $bits // 8:]
+    frames += count == 50
+if frames != 4:
+    sys.exit('Validation failed: expected 4 frames of 50 values from binary$bits')
+" || exit 1
+done
+
+echo "Validation passed: xgb.py accepts every output format of the reporter."
+exit 0
@@ -0,0 +1,114 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+checkpoint_dir="tmp/stage-checkpoints"
+stages_dir="tmp/stages"
+rm -rf "$checkpoint_dir" "$stages_dir"
+mkdir -p "$stages_dir"
+
+# Three stages in a chain, like data_cleaning.py. scale() calls a helper of its module, add_total()
+# reads a module level constant, drop_inputs() a set and a helper module imported from next to it
+write_stages() {
+    cat > "$stages_dir/toy_stages.py" << EOT
+import pandas as pd
+import toy_helper as helper
+
+OFFSETS = {'a': $2}
+KEEP = {'total', 'scaled'}
+
+def factor():
+    return $1
+
+def add_total(df_original):
+    df = df_original.copy()
+    df['total'] = df.a + df.b + sum(OFFSETS[column] for column in ['a'])
+    return df
+
+def scale(df_original):
+    df = df_original.copy()
+    df['scaled'] = df.total * factor()
+    return df
+
+def drop_inputs(df_original):
+    df = df_original[[column for column in df_original.columns if column in KEEP]].copy()
+    df['scaled'] = df.scaled + helper.bonus()
+    return df
+EOT
+    cat > "$stages_dir/toy_helper.py" << EOT
+def bonus():
+    return $3
+EOT
+}
+
+# A new hash seed every run, so e.g. the order of a set must not change the keys
+run() {
+    PYTHONHASHSEED=$RANDOM python3 -B -c "
+import sys
+import pandas as pd
+sys.path.insert(0, '$stages_dir')
+sys.path.insert(0, '../scripts')
+from include.stage_runner import StageRunner
+from toy_stages import add_total, scale, drop_inputs
+
+runner = StageRunner('$checkpoint_dir')
+df = pd.DataFrame({'a': [1, 2, 3], 'b': [$1, 5, 6]})
+df = runner.run(add_total, df)
+df = runner.run(scale, df)
+df = runner.run(drop_inputs, df)
+runner.summary()
+print(','.join(str(value) for value in df.scaled))
+" > tmp/stage-runner.log || { echo "Error: the stage runner failed"; cat tmp/stage-runner.log; exit 1; }
+}
+
+expect() {
+    if ! grep -q "$1" tmp/stage-runner.log; then
+        echo "Validation failed: expected '$1', but got: $(cat tmp/stage-runner.log)"
+        exit 1
+    fi
+}
+
+write_stages 2 0 0
+run 4
+expect "3 stages, 3 ran, 0 from checkpoints"
+expect "^10,14,18$"
+
+# Nothing changed: everything comes from the checkpoints
+run 4
+expect "3 stages, 0 ran, 3 from checkpoints"
+expect "^10,14,18$"
+
+# A changed helper re-runs the stage that calls it and every stage after it
+write_stages 3 0 0
+run 4
+expect "\[cached\] add_total"
+expect "\[   ran\] scale"
+expect "\[   ran\] drop_inputs"
+expect "^15,21,27$"
+
+# So does a changed module level constant
+write_stages 3 1 0
+run 4
+expect "3 stages, 3 ran, 0 from checkpoints"
+expect "^18,24,30$"
+
+# and a changed function of an imported helper module
+write_stages 3 1 1
+run 4
+expect "\[cached\] add_total"
+expect "\[cached\] scale"
+expect "\[   ran\] drop_inputs"
+expect "^19,25,31$"
+
+# Changed input data re-runs all stages
+run 7
+expect "3 stages, 3 ran, 0 from checkpoints"
+expect "^28,25,31$"
+
+if [ "$(ls "$checkpoint_dir" | wc -l)" -ne 3 ]; then
+    echo "Validation failed: expected one checkpoint per stage, but found: $(ls "$checkpoint_dir")"
+    exit 1
+fi
+
+echo "Validation passed: the stage runner re-runs exactly the changed stages."
+exit 0
@@ -0,0 +1,35 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+artifact_file="tmp/spec_data_cleaned.feather"
+csv_copy="tmp/spec_data_cleaned.csv"
+
+rm -f "$artifact_file"
+python3 ../training_data.py --output "$artifact_file" || exit 1
+
+# The columnar copy must give the same frames as the CSV, for every column selection the
+# training scripts use, and must be ignored once the CSV changed
+cp -p ../data/spec_data_cleaned.csv "$csv_copy"
+python3 -W ignore -c "
+import sys
+import pandas as pd
+sys.path.insert(0, '..')
+import xgb
+from training_data import load_training_data, artifact_is_current
+
+for columns in [None, xgb.TRAINING_COLUMNS, ['power', 'utilization', 'CPUThreads', 'CPUChips', 'HW_MemAmountGB', 'TDP']]:
+    expected = load_training_data(columns, artifact_path='tmp/missing.feather')
+    pd.testing.assert_frame_equal(load_training_data(columns, artifact_path='$artifact_file'), expected)
+    pd.testing.assert_frame_equal(load_training_data(columns, csv_path='tmp/missing.csv', artifact_path='$artifact_file'), expected)
+
+if not artifact_is_current('$csv_copy', '$artifact_file'):
+    sys.exit('Validation failed: the copy of the CSV was not accepted as source of the columnar file')
+with open('$csv_copy', 'a', encoding='UTF-8') as file:
+    file.write('\n')
+if artifact_is_current('$csv_copy', '$artifact_file'):
+    sys.exit('Validation failed: the columnar file was still used after the CSV changed')
+" || { echo "Validation failed: the columnar training data differs from the CSV"; exit 1; }
+
+echo "Validation passed: the columnar training data matches the CSV."
+exit 0
@@ -0,0 +1,102 @@
+#!/bin/bash
+
+mkdir -p tmp
+
+store_dir="tmp/wikipedia"
+pages_dir="tmp/wikipedia-pages"
+rm -rf "$store_dir" "$pages_dir"
+cp -r fixtures/wikipedia "$pages_dir"
+
+# The pages are served from file:// URLs, so no network is needed. The index is built in a
+# file and not with python3 -c, as it is keyed by its source code
+cat > tmp/wikipedia_index.py << EOT
+import re, sys, os
+import pandas as pd
+sys.path.insert(0, '../scripts')
+from include.wikipedia_snapshots import SnapshotStore
+
+urls = {name: 'file://' + os.path.abspath('$pages_dir/' + name + '.html') for name in ['xeon', 'epyc']}
+
+# Reads the table rows with a regex instead of pd.read_html, which needs lxml
+def build_index(store):
+    print('built')
+    rows = []
+    for name in urls:
+        for model, _, tdp in re.findall(r'<tr><td>(.*?)</td><td>(.*?)</td><td>(.*?)</td></tr>', store.read(name)):
+            rows.append({'ModelNumber': model, 'TDP': tdp, 'Architecture': name})
+    cpus = pd.DataFrame(rows)
+    cpus.ModelNumber = cpus.ModelNumber.astype(str).str.replace(r'\s*', '', regex=True).str.lower()
+    cpus.TDP = cpus.TDP.astype(str).str.replace(r'\s*W\s*', '', regex=True).astype(float)
+    return cpus
+
+store = SnapshotStore('$store_dir')
+if sys.argv[1:] == ['fetch']:
+    store.fetch(urls)
+else:
+    store.ensure(urls)
+cpus = store.index('cpu_index', build_index)
+print(';'.join(f'{row.ModelNumber}={row.TDP}/{row.Architecture}' for row in cpus.itertuples()))
+print(str(cpus.ModelNumber.dtype), str(cpus.TDP.dtype))
+EOT
+
+run() {
+    python3 -B tmp/wikipedia_index.py "$@" > tmp/wikipedia.log 2>&1
+}
+
+expect() {
+    if ! grep -q "$1" tmp/wikipedia.log; then
+        echo "Validation failed: expected '$1', but got: $(cat tmp/wikipedia.log)"
+        exit 1
+    fi
+}
+
+index="xeongold6226=125.0/xeon;xeonplatinum8380=270.0/xeon;7702=200.0/epyc;9654=360.0/epyc"
+
+# Without snapshots they are fetched once and the index is built
+run || { echo "Error: fetching the missing snapshots failed"; cat tmp/wikipedia.log; exit 1; }
+expect "^No snapshots of xeon, epyc in $store_dir. Fetching them once"
+expect "^built$"
+expect "^$index$"
+for name in xeon epyc; do
+    if ! grep -q "$(sha256sum "$pages_dir/$name.html" | cut -d ' ' -f 1)" "$store_dir/manifest.json"; then
+        echo "Validation failed: the manifest has no checksum of $name"
+        exit 1
+    fi
+done
+
+# Offline, even with the pages gone: the stored index is used, model numbers stay str
+rm -rf "$pages_dir"
+run || { echo "Error: reading the snapshots failed"; cat tmp/wikipedia.log; exit 1; }
+expect "^$index$"
+expect "^str float64$\|^object float64$"
+if grep -q "^built$\|^No snapshots" tmp/wikipedia.log; then
+    echo "Validation failed: the snapshots were fetched or the index was built again without any change"
+    exit 1
+fi
+
+# A page that does not match its checksum is refused
+sed -i 's/270 W/280 W/' "$store_dir/xeon.html"
+if run; then
+    echo "Validation failed: a changed snapshot was accepted"
+    exit 1
+fi
+expect "does not match its checksum"
+
+# Without snapshots and without the pages to fetch them from, the error says what to do
+rm -rf "$store_dir"
+if run; then
+    echo "Validation failed: the index was built without any snapshots"
+    exit 1
+fi
+expect "Fetching the snapshots failed: .*Run data_cleaning.py once where the network is available"
+
+# --refresh-snapshots fetches again even if all pages are there
+cp -r fixtures/wikipedia "$pages_dir"
+run || { echo "Error: fetching the missing snapshots failed"; cat tmp/wikipedia.log; exit 1; }
+sed -i 's/270 W/280 W/' "$pages_dir/xeon.html"
+run fetch || { echo "Error: refreshing the snapshots failed"; cat tmp/wikipedia.log; exit 1; }
+expect "^built$"
+expect "xeonplatinum8380=280.0/xeon"
+
+echo "Validation passed: the snapshot store and its index work offline."
+exit 0
@@ -0,0 +1,121 @@
+# pylint: disable=redefined-outer-name,invalid-name
+
+import os
+import json
+
+# The training scripts read data/spec_data_cleaned.csv through load_training_data(). Parsing the
+# 16 MB CSV and inferring its dtypes takes longer than the rest of a curve build, so
+# scripts/data_cleaning.py also writes a typed columnar copy next to it: Arrow IPC (Feather v2)
+# without compression, which is memory mapped and only reads the columns asked for.
+# The copy records size and mtime of the CSV it was written from. If the CSV changed since,
+# or the copy is missing, the CSV is read instead.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TRAINING_CSV = os.path.join(DATA_DIR, 'spec_data_cleaned.csv')
+TRAINING_ARTIFACT = os.path.join(DATA_DIR, 'spec_data_cleaned.feather')
+
+# Bump whenever the written columns or their encoding change. Older copies are then ignored.
+SCHEMA_VERSION = 1
+METADATA_KEY = b'cloud_energy'
+
+# Stored dictionary encoded and loaded as pandas categoricals with a fixed set of categories, so
+# get_dummies() does not have to find the distinct values again on every run.
+CATEGORICAL_COLUMNS = ['CPUMake', 'Architecture', 'HW_FormFactor', 'HW_Vendor']
+
+def source_stamp(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def encode_categoricals(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+def read_metadata(artifact_path):
+    import pyarrow as pa
+
+    with pa.memory_map(artifact_path) as source:
+        schema = pa.ipc.open_file(source).schema
+
+    if not schema.metadata or METADATA_KEY not in schema.metadata:
+        return None
+    return json.loads(schema.metadata[METADATA_KEY].decode('UTF-8'))
+
+def write_training_data(csv_path=TRAINING_CSV, artifact_path=TRAINING_ARTIFACT):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    # Written from the CSV and not from the frame in memory, so both give the same dtypes
+    df = encode_categoricals(pd.read_csv(csv_path))
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        'version': SCHEMA_VERSION,
+        'source': source_stamp(csv_path),
+        'columns': {field.name: str(field.type) for field in table.schema},
+    }
+    table = table.replace_schema_metadata({**table.schema.metadata, METADATA_KEY: json.dumps(metadata, sort_keys=True).encode('UTF-8')})
+
+    # write to a temp file and rename, so a concurrent loader never maps a partial file
+    tmp_path = f"{artifact_path}.tmp"
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, artifact_path)
+
+    return metadata
+
+def artifact_is_current(csv_path, artifact_path):
+    if not os.path.isfile(artifact_path):
+        return False
+
+    try:
+        metadata = read_metadata(artifact_path)
+    #pylint: disable=broad-except
+    except Exception:
+        return False # e.g. truncated. The CSV is still there
+
+    if metadata is None or metadata.get('version') != SCHEMA_VERSION:
+        return False
+
+    # Without the CSV (e.g. a container that only ships the copy) the copy is all we have
+    return not os.path.isfile(csv_path) or metadata.get('source') == source_stamp(csv_path)
+
+def load_training_data(columns=None, csv_path=TRAINING_CSV, artifact_path=TRAINING_ARTIFACT, logger=None):
+    import pandas as pd
+
+    if artifact_is_current(csv_path, artifact_path):
+        import pyarrow.feather as feather
+
+        df = feather.read_table(artifact_path, columns=columns, memory_map=True).to_pandas(split_blocks=True)
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].notna(), float('nan')) # Arrow nulls come back as None, the CSV gives NaN
+        return df
+
+    if logger:
+        logger.info('No current columnar copy of the training data in %s. Reading %s. Run training_data.py to write it.', artifact_path, csv_path)
+
+    df = pd.read_csv(csv_path, usecols=columns)
+    if columns is not None:
+        df = df[columns] # usecols keeps the file order
+    return encode_categoricals(df)
+
+def source_path(csv_path=TRAINING_CSV, artifact_path=TRAINING_ARTIFACT):
+    # the file the training data comes from, e.g. to hash it for the model cache
+    return csv_path if os.path.isfile(csv_path) else artifact_path
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write the columnar copy of the training data that the training scripts load.')
+
+    parser.add_argument('--csv', type=str, default=TRAINING_CSV, help='The cleaned training data CSV.')
+    parser.add_argument('--output', type=str, default=TRAINING_ARTIFACT, help='The Feather file to write.')
+
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    metadata = write_training_data(args.csv, args.output)
+    print(f"Wrote {len(metadata['columns'])} columns to {args.output} in {time.monotonic() - start:.2f} s", file=sys.stderr)
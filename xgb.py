@@ -1,22 +1,69 @@
 # pylint: disable=redefined-outer-name,invalid-name
 
 import sys
-import os
 import time
 import logging
 import platform
-import pandas as pd
-import numpy as np
 import warnings
-from xgboost import XGBRegressor
+
+from power_curve import PowerCurve, POINTS, RESOLUTION
+from stream_io import INPUT_FORMATS, read_batches, write_batch
+import training_data
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 logger.setLevel(logging.INFO)
 
-def train_model(cpu_chips, Z):
+# The columns of the training data a model can be trained on, plus the chips filter and the target
+TRAINING_COLUMNS = ['HW_CPUFreq', 'CPUThreads', 'CPUCores', 'TDP', 'Hardware_Availability_Year', 'HW_MemAmountGB',
+    'Architecture', 'CPUMake', 'utilization', 'CPUChips', 'power']
+
+# The machine parameters that select and feed a model. Same names as the argparse destinations.
+PROFILE_FIELDS = ['cpu_chips', 'cpu_freq', 'cpu_threads', 'cpu_cores', 'release_year', 'tdp', 'ram', 'architecture', 'cpu_make']
+
+# numpy, pandas and xgboost are only imported where needed. --help, the auto detection and
+# running from a precomputed power curve (--curve-file) must not pay their import time.
+# scripts/startup_benchmark.py keeps an eye on this.
+
+def make_feature_frame(profile):
+    import pandas as pd
+
+    Z = pd.DataFrame.from_dict({
+        'HW_CPUFreq' : [profile.get('cpu_freq')],
+        'CPUThreads': [profile.get('cpu_threads')],
+        'CPUCores': [profile.get('cpu_cores')],
+        'TDP': [profile.get('tdp')],
+        'Hardware_Availability_Year': [profile.get('release_year')],
+        'HW_MemAmountGB': [profile.get('ram')],
+        'Architecture': [profile.get('architecture')],
+        'CPUMake': [profile.get('cpu_make')],
+        'utilization': [0.0]
+    })
+
+    Z = pd.get_dummies(Z, columns=['CPUMake', 'Architecture'])
+
+    return Z.dropna(axis=1)
+
+def train_model(cpu_chips, Z, cache=None, n_jobs=None):
+    import pandas as pd
+    from xgboost import XGBRegressor
+
+#    params = {
+#      'max_depth': 10,
+#      'learning_rate': 0.3037182109676833,
+#      'n_estimators': 792,
+#      'min_child_weight': 1,
+#      'random_state': 762
+#    }
+    params = {} # we see no strong improvements with hyperparamters tuned by optune
+
+    if cache:
+        cache_key = cache.key(training_data.source_path(), Z.columns, cpu_chips, params)
+        model = cache.load(cache_key)
+        if model is not None:
+            return model
 
-    df = pd.read_csv(f"{os.path.dirname(os.path.abspath(__file__))}/data/spec_data_cleaned.csv")
+    df = training_data.load_training_data(TRAINING_COLUMNS, logger=logger)
 
     X = df.copy()
     X = pd.get_dummies(X, columns=['CPUMake', 'Architecture'])
@@ -29,60 +76,83 @@ def train_model(cpu_chips, Z):
     if X.empty:
         raise RuntimeError(f"The training data does not contain any servers with a chips amount ({cpu_chips}). Please select a different amount.")
 
+    # e.g. a make or architecture the training data does not know has no dummy column
+    missing = [column for column in Z.columns if column not in X.columns]
+    if missing:
+        raise RuntimeError(f"The training data does not contain any servers with {missing}. Please select a different make or architecture.")
+
     y = X.power
 
     X = X[Z.columns] # only select the supplied columns from the command line
 
     logger.info('Model will be trained on the following columns and restrictions: \n%s', Z)
 
-#    params = {
-#      'max_depth': 10,
-#      'learning_rate': 0.3037182109676833,
-#      'n_estimators': 792,
-#      'min_child_weight': 1,
-#      'random_state': 762
-#    }
-    params = {} # we see no strong improvements with hyperparamters tuned by optune
-
-    model = XGBRegressor(**params)
+    model = XGBRegressor(**params, n_jobs=n_jobs) # thread count does not change the model, so it is not in the cache key
     model.fit(X,y)
 
+    if cache:
+        cache.store(cache_key, model)
+
     return model
 
-def infer_predictions(model, Z):
+def infer_predictions(model, Z, step=5):
+    import numpy as np
+
+    # interpolate_predictions() needs the multiples of 5, so step must divide 5 if the result is interpolated
+    # If Z has more than one row (e.g. fleet.py) every value is an array with one prediction per row
+
+    utilizations = [float(i) for i in range(0, 110, step)]
 
-    predictions = {}
+    # One row per machine and utilization point, so the booster runs once instead of once per point
+    X = Z.loc[Z.index.repeat(len(utilizations))].reset_index(drop=True)
+    X['utilization'] = np.tile(utilizations, len(Z))
 
-    for i in range(0,110,5):
-        Z['utilization'] = i
-        predictions[float(i)] = model.predict(Z)[0]
-    return predictions
+    predictions = model.predict(X).reshape(len(Z), len(utilizations))
 
-def interpolate_helper(predictions, lower, upper, step=501):
+    if len(Z) == 1:
+        return dict(zip(utilizations, predictions[0]))
+    return dict(zip(utilizations, predictions.T))
+
+def interpolate_helper(values, predictions, lower, upper, step=501):
+    import numpy as np
 
     diff = int(upper-lower)
     diff_value = predictions[upper] - predictions[lower]
 
-    for i in np.linspace(0, diff, step):
-        predictions[round(lower+i, 2)] = predictions[lower]+((diff_value/diff)*i)
+    # the trailing axis is the curve, leading axes (if any) are machines
+    start = round(lower * RESOLUTION)
+    values[..., start:start+step] = np.asarray(predictions[lower])[..., np.newaxis] + \
+        np.asarray(diff_value/diff)[..., np.newaxis]*np.linspace(0, diff, step)
+
+    # the next segment starts from the interpolated value, not from the raw prediction
+    predictions[lower] = values[..., start]
+    predictions[upper] = values[..., start+step-1]
+
+    return values
+
+def interpolate_values(predictions):
+    import numpy as np
+
+    predictions = dict(predictions)
+    values = np.empty(np.shape(predictions[0.0]) + (POINTS,), dtype=np.float64)
+
+    values = interpolate_helper(values, predictions, 0.0, 5.0, 501)
+    values = interpolate_helper(values, predictions, 5.0, 15.0, 1001)
+    values = interpolate_helper(values, predictions, 15.0, 25.0, 1001)
+    values = interpolate_helper(values, predictions, 25.0, 35.0, 1001)
+    values = interpolate_helper(values, predictions, 35.0, 45.0, 1001)
+    values = interpolate_helper(values, predictions, 45.0, 55.0, 1001)
+    values = interpolate_helper(values, predictions, 55.0, 65.0, 1001)
+    values = interpolate_helper(values, predictions, 65.0, 75.0, 1001)
+    values = interpolate_helper(values, predictions, 75.0, 85.0, 1001)
+    values = interpolate_helper(values, predictions, 85.0, 95.0, 1001)
+    # Question: between 95 and 100 is no difference. How do we extrapolate?
+    values = interpolate_helper(values, predictions, 95.0, 100.0, 501)
 
-    return predictions
+    return values
 
 def interpolate_predictions(predictions):
-    predictions = interpolate_helper(predictions, 0.0, 5.0, 501)
-    predictions = interpolate_helper(predictions, 5.0, 15.0, 1001)
-    predictions = interpolate_helper(predictions, 15.0, 25.0, 1001)
-    predictions = interpolate_helper(predictions, 25.0, 35.0, 1001)
-    predictions = interpolate_helper(predictions, 35.0, 45.0, 1001)
-    predictions = interpolate_helper(predictions, 45.0, 55.0, 1001)
-    predictions = interpolate_helper(predictions, 55.0, 65.0, 1001)
-    predictions = interpolate_helper(predictions, 65.0, 75.0, 1001)
-    predictions = interpolate_helper(predictions, 75.0, 85.0, 1001)
-    predictions = interpolate_helper(predictions, 85.0, 95.0, 1001)
-    # Question: between 95 and 100 is no difference. How do we extrapolate?
-    predictions = interpolate_helper(predictions, 95.0, 100.0, 501)
-
-    return predictions
+    return PowerCurve(interpolate_values(predictions), predictions)
 
 def set_silent():
     # sadly some libs have future warnings we need to suppress for
@@ -106,6 +176,10 @@ if __name__ == '__main__':
     parser.add_argument('--architecture', type=str, help='The architecture of the CPU. lowercase. ex.: haswell')
     parser.add_argument('--cpu-make', type=str, help='The make of the CPU (intel or amd)')
     parser.add_argument('--auto', action='store_true', help='Force auto detect. Will overwrite supplied arguments')
+    parser.add_argument('--refresh-auto-detect',
+        action='store_true',
+        help='Ignore the auto detected values cached for this boot in the model cache directory and detect again.'
+    )
 
     parser.add_argument('--vhost-ratio',
         type=float,
@@ -125,8 +199,66 @@ if __name__ == '__main__':
 
     parser.add_argument('--autoinput', action='store_true', help='Will get the CPU utilization through psutil.')
     parser.add_argument('--interval', type=float, help='Interval in seconds if autoinput is used.', default=1.0)
+    parser.add_argument('--input-format',
+        choices=INPUT_FORMATS,
+        default='text',
+        help='text: one utilization per line. timestamped: ts_ns,utilization per line, --energy integrates over the timestamps. \
+        percpu: comma separated utilization of every CPU per line. timestamped-percpu: ts_ns followed by the CPUs. \
+        batch: comma separated utilizations per line, answered with one line. \
+        binary32 / binary64: frames of a little-endian uint32 count followed by that many floats, answered with the same framing.'
+    )
+    parser.add_argument('--integration',
+        choices=['step', 'trapezoid'],
+        default='step',
+        help='How --energy integrates with --input-format timestamped. step: a sample holds for the interval before it. \
+        trapezoid: mean of both ends of the interval.'
+    )
+    parser.add_argument('--cpu-group',
+        action='append',
+        default=[],
+        help='NAME=CPULIST (e.g. web=0-3,8) to sum the per CPU values of the percpu formats into, like the cpuset of a cgroup. \
+        Can be repeated. Without groups every CPU is written.'
+    )
+    parser.add_argument('--window-seconds',
+        type=float,
+        help='Instead of every sample output start_ns,samples,min,mean,max Watts,Joules once per window of this many seconds.'
+    )
+    parser.add_argument('--window-samples', type=int, help='Like --window-seconds, but with windows of this many samples.')
+    parser.add_argument('--calibrate',
+        action='store_true',
+        help='Correct the curve online against the RAPL energy counters of this machine. Outputs the calibrated values.'
+    )
+    parser.add_argument('--rapl-zone',
+        action='append',
+        default=[],
+        help='Powercap zone directory (with energy_uj and max_energy_range_uj) to calibrate against. \
+        Can be repeated. Defaults to all packages and their DRAM zones.'
+    )
+    parser.add_argument('--calibration-band', type=float, default=10.0, help='Width of the utilization bands that are calibrated separately.')
+    parser.add_argument('--export-calibrated-curve', type=str, help='Write the calibrated curve to this file when the input ends.')
     parser.add_argument('--dump', action='store_true', help='Dump all predicitions to STDOUT.')
     parser.add_argument('--dump-hashmap', action='store_true', help='Dump all predicitions to STDOUT as bash hashmap.')
+    parser.add_argument('--dump-c-header',
+        action='store_true',
+        help='Dump the power curve to STDOUT as C header with a static lookup table and inline watts / joules functions.'
+    )
+
+    parser.add_argument('--export-curve',
+        type=str,
+        help='Write the interpolated power curve of the given machine to this file and exit.'
+    )
+    parser.add_argument('--curve-file',
+        type=str,
+        help='Serve from a power curve written by --export-curve. No model is trained and machine arguments are ignored.'
+    )
+
+    parser.add_argument('--model-cache-dir',
+        type=str,
+        help='Directory for the trained model cache. Can be a shared volume. \
+        Defaults to $CLOUD_ENERGY_CACHE_DIR or ~/.cache/cloud-energy'
+    )
+    parser.add_argument('--model-cache-size', type=int, help='Maximum size of the model cache in MB.', default=256)
+    parser.add_argument('--no-model-cache', action='store_true', help='Always retrain the model and do not touch the cache.')
 
     args = parser.parse_args()
 
@@ -136,15 +268,33 @@ if __name__ == '__main__':
     args_dict = args.__dict__.copy()
     del args_dict['silent']
     del args_dict['auto']
+    del args_dict['refresh_auto_detect']
     del args_dict['energy']
+    del args_dict['model_cache_dir']
+    del args_dict['model_cache_size']
+    del args_dict['no_model_cache']
+    del args_dict['curve_file']
+    del args_dict['export_curve']
+    del args_dict['input_format']
+    del args_dict['integration']
+    del args_dict['cpu_group']
+    del args_dict['window_seconds']
+    del args_dict['window_samples']
+    del args_dict['calibrate']
+    del args_dict['rapl_zone']
+    del args_dict['calibration_band']
+    del args_dict['export_calibrated_curve']
 
     # did the user supply any of the auto detectable arguments?
-    if not any(args_dict.values()) or args.auto:
+    if not args.curve_file and (not any(args_dict.values()) or args.auto):
         logger.info('No arguments where supplied, or auto mode was forced. Running auto detect on the sytem.')
 
         import auto_detect
+        from model_cache import default_cache_dir
 
-        data = auto_detect.get_cpu_info(logger)
+        data = auto_detect.get_cpu_info(logger,
+            cache_dir=None if args.no_model_cache else args.model_cache_dir or default_cache_dir(),
+            refresh=args.refresh_auto_detect)
 
         logger.info('The following data was auto detected: %s', data)
 
@@ -171,39 +321,71 @@ if __name__ == '__main__':
               ''')
         sys.exit(1)
 
-    Z = pd.DataFrame.from_dict({
-        'HW_CPUFreq' : [args.cpu_freq],
-        'CPUThreads': [args.cpu_threads],
-        'CPUCores': [args.cpu_cores],
-        'TDP': [args.tdp],
-        'Hardware_Availability_Year': [args.release_year],
-        'HW_MemAmountGB': [args.ram],
-        'Architecture': [args.architecture],
-        'CPUMake': [args.cpu_make],
-        'utilization': [0.0]
-    })
+    if args.window_seconds and args.window_samples:
+        parser.error('--window-seconds and --window-samples cannot be used together')
+    if (args.window_seconds or args.window_samples) and args.input_format not in ['text', 'timestamped']:
+        parser.error('windows can only be used with --input-format text or timestamped')
 
-    Z = pd.get_dummies(Z, columns=['CPUMake', 'Architecture'])
+    percpu = args.input_format in ['percpu', 'timestamped-percpu']
+    if percpu and (args.window_seconds or args.window_samples):
+        parser.error('windows cannot be used with the percpu formats')
+    if args.cpu_group and not percpu:
+        parser.error('--cpu-group needs --input-format percpu or timestamped-percpu')
 
-    Z = Z.dropna(axis=1)
+    if args.calibrate and (args.window_seconds or args.window_samples or args.input_format not in ['text', 'timestamped']):
+        parser.error('--calibrate can only be used with --input-format text or timestamped and without windows')
+    if args.export_calibrated_curve and not args.calibrate:
+        parser.error('--export-calibrated-curve needs --calibrate')
 
+    if args.autoinput and args.input_format not in ['text', 'timestamped', 'percpu', 'timestamped-percpu']:
+        parser.error('--autoinput can only be used with --input-format text, timestamped, percpu or timestamped-percpu')
 
     logger.info('vHost ratio is set to %s', args.vhost_ratio)
 
-    trained_model = train_model(args.cpu_chips, Z)
+    if args.curve_file:
+        from power_curve import load_curve
+
+        interpolated_predictions, curve_metadata = load_curve(args.curve_file)
+        logger.info('Loaded power curve from %s. It was built for: %s', args.curve_file, curve_metadata['profile'])
+    else:
+        Z = make_feature_frame(vars(args))
+
+        model_cache = None
+        if not args.no_model_cache:
+            from model_cache import ModelCache, default_cache_dir
+            model_cache = ModelCache(args.model_cache_dir or default_cache_dir(), logger, max_bytes=args.model_cache_size*1024*1024)
+
+        trained_model = train_model(args.cpu_chips, Z, model_cache)
 
-    logger.info('Infering all predictions to dictionary')
+        logger.info('Infering all predictions to power curve')
 
-    inferred_predictions = infer_predictions(trained_model, Z)
-    interpolated_predictions = interpolate_predictions(inferred_predictions)
+        inferred_predictions = infer_predictions(trained_model, Z)
+        interpolated_predictions = interpolate_predictions(inferred_predictions)
+
+        if args.export_curve:
+            from power_curve import save_curve
+
+            save_curve(args.export_curve, interpolated_predictions, {
+                'profile': {field: getattr(args, field) for field in PROFILE_FIELDS},
+                'columns': list(Z.columns),
+                'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            })
+            logger.info('Power curve written to %s', args.export_curve)
+            sys.exit(0)
 
     input_source = sys.stdin
     if args.autoinput:
         import psutil
         def cpu_utilization():
             while True:
-                cpu_util = psutil.cpu_percent(args.interval)
-                yield str(cpu_util)
+                if percpu:
+                    cpu_util = ','.join(map(str, psutil.cpu_percent(args.interval, percpu=True)))
+                else:
+                    cpu_util = psutil.cpu_percent(args.interval)
+                if args.input_format.startswith('timestamped'):
+                    yield f"{time.monotonic_ns()},{cpu_util}"
+                else:
+                    yield str(cpu_util)
 
         input_source = cpu_utilization()
 
@@ -221,7 +403,171 @@ if __name__ == '__main__':
             print(f'cloud_energy_hashmap[{key:.2f}]={val*args.vhost_ratio}', flush=True)
         sys.exit(0)
 
-    current_time = time.time_ns()
+    if args.dump_c_header:
+        from power_curve import write_c_header
+
+        profile = curve_metadata['profile'] if args.curve_file else {field: getattr(args, field) for field in PROFILE_FIELDS}
+        write_c_header(sys.stdout, interpolated_predictions, args.vhost_ratio, profile)
+        sys.exit(0)
+
+    if percpu:
+        import numpy as np
+        from energy import EnergyIntegrator, attribute_power
+        from auto_detect import parse_cpu_list
+
+        timestamped = args.input_format == 'timestamped-percpu'
+        groups = []
+        for cpu_group in args.cpu_group:
+            name, _, cpu_list = cpu_group.partition('=')
+            if not cpu_list:
+                parser.error(f"--cpu-group must be NAME=CPULIST, but was {cpu_group}")
+            groups.append((name, parse_cpu_list(cpu_list)))
+
+        idle_watts = interpolated_predictions[0] * args.vhost_ratio
+        integrator = EnergyIntegrator(args.integration) if timestamped else EnergyIntegrator('step', time.monotonic_ns())
+        membership = None
+
+        # one line per tick: the host, then every group (or every CPU)
+        for line in input_source:
+            if timestamped: # parsed on its own, ns timestamps do not fit into a float64
+                timestamp, _, line = line.strip().partition(',')
+                timestamp = int(timestamp)
+            else:
+                timestamp = time.monotonic_ns()
+            utilizations = np.array(line.strip().split(','), dtype=np.float64)
+            if utilizations.size == 0 or utilizations.min() < 0 or utilizations.max() > 100:
+                raise ValueError("Utilization of every CPU must be between 0 and 100.")
+
+            if membership is None and groups:
+                membership = np.zeros((len(groups), utilizations.size))
+                for row, (name, cpus) in enumerate(groups):
+                    if max(cpus) >= utilizations.size:
+                        raise ValueError(f"CPU group {name} has CPU {max(cpus)}, but only {utilizations.size} CPUs are in the input")
+                    membership[row, cpus] = 1
+
+            # the host power comes from the mean utilization, exactly as in the single value formats
+            host_watts = interpolated_predictions[utilizations.mean()] * args.vhost_ratio
+            cpu_watts = attribute_power(host_watts, idle_watts, utilizations)
+
+            result = np.concatenate([[host_watts], membership @ cpu_watts if groups else cpu_watts])
+            if args.energy:
+                result = integrator.add(timestamp, result)
+            print(','.join(map(str, result.tolist())), flush=True)
+        sys.exit(0)
+
+    if args.calibrate:
+        from calibration import RaplCounters, BandCalibration
+        from energy import EnergyIntegrator
+
+        zones = args.rapl_zone
+        if not zones:
+            import auto_detect
+            zones = [zone.path for zone in auto_detect.read_powercap_topology('/', logger).energy_zones()]
+
+        counters = RaplCounters(zones)
+        calibration = BandCalibration(args.calibration_band)
+        logger.info('Calibrating against the RAPL zones %s', zones)
+
+        timestamped = args.input_format == 'timestamped'
+        # without timestamps the first interval starts now, like in --energy mode
+        last_time = None if timestamped else time.monotonic_ns()
+        integrator = EnergyIntegrator(args.integration) if timestamped else EnergyIntegrator('step', last_time)
+
+        try:
+            for line in input_source:
+                if timestamped:
+                    timestamp, _, utilization = line.strip().partition(',')
+                    timestamp, utilization = int(timestamp), float(utilization)
+                else:
+                    timestamp, utilization = time.monotonic_ns(), float(line.strip())
+                if utilization < 0 or utilization > 100:
+                    raise ValueError("Utilization can not be over 100%. If you have multiple CPU cores please divide by cpu count.")
+
+                measured_joules = counters.read()
+                model_watts = interpolated_predictions[utilization]
+                if last_time is not None and timestamp > last_time:
+                    calibration.add(utilization, model_watts, measured_joules * 1_000_000_000 / (timestamp - last_time))
+                last_time = timestamp
+
+                watts = calibration.apply(utilization, model_watts) * args.vhost_ratio
+                print(integrator.add(timestamp, watts) if args.energy else watts, flush=True)
+        finally:
+            counters.close()
+            logger.info('Calibration: %s', calibration.as_dict())
+
+            if args.export_calibrated_curve:
+                from power_curve import save_curve
+
+                save_curve(args.export_calibrated_curve, calibration.calibrate(interpolated_predictions), {
+                    'profile': curve_metadata['profile'] if args.curve_file else {field: getattr(args, field) for field in PROFILE_FIELDS},
+                    'calibration': calibration.as_dict(),
+                    'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                })
+                logger.info('Calibrated power curve written to %s', args.export_calibrated_curve)
+        sys.exit(0)
+
+    if args.window_seconds or args.window_samples:
+        from energy import EnergyIntegrator, WindowAggregator
+
+        timestamped = args.input_format == 'timestamped'
+        window = WindowAggregator(args.window_seconds, args.window_samples)
+        # Without timestamps the intervals are measured like in --energy, from the arrival of the lines
+        integrator = EnergyIntegrator(args.integration) if timestamped else EnergyIntegrator('step', time.monotonic_ns())
+
+        for line in input_source:
+            if timestamped:
+                timestamp, _, utilization = line.strip().partition(',')
+                timestamp, utilization = int(timestamp), float(utilization)
+            else:
+                timestamp, utilization = time.monotonic_ns(), float(line.strip())
+            if utilization < 0 or utilization > 100:
+                raise ValueError("Utilization can not be over 100%. If you have multiple CPU cores please divide by cpu count.")
+
+            watts = interpolated_predictions[utilization] * args.vhost_ratio
+            finished = window.add(timestamp, watts, integrator.add(timestamp, watts))
+            if finished:
+                print(','.join(map(str, finished)), flush=True)
+
+        finished = window.flush()
+        if finished:
+            print(','.join(map(str, finished)), flush=True)
+        sys.exit(0)
+
+    if args.input_format == 'timestamped':
+        from energy import EnergyIntegrator
+
+        integrator = EnergyIntegrator(args.integration)
+        for line in input_source:
+            timestamp, _, utilization = line.strip().partition(',')
+            utilization = float(utilization)
+            if utilization < 0 or utilization > 100:
+                raise ValueError("Utilization can not be over 100%. If you have multiple CPU cores please divide by cpu count.")
+
+            watts = interpolated_predictions[utilization] * args.vhost_ratio
+            print(integrator.add(int(timestamp), watts) if args.energy else watts, flush=True)
+        sys.exit(0)
+
+    if args.input_format != 'text':
+        binary = args.input_format.startswith('binary')
+        output = sys.stdout.buffer if binary else sys.stdout
+
+        current_time = time.monotonic_ns()
+        for utilizations in read_batches(sys.stdin.buffer if binary else input_source, args.input_format):
+            if utilizations.size and (utilizations.min() < 0 or utilizations.max() > 100):
+                raise ValueError("Utilization can not be over 100%. If you have multiple CPU cores please divide by cpu count.")
+
+            result = interpolated_predictions.lookup(utilizations) * args.vhost_ratio
+            if args.energy:
+                # the samples of one batch share the time since the previous batch evenly
+                now = time.monotonic_ns()
+                result = result * (now - current_time) / 1_000_000_000 / max(len(utilizations), 1)
+                current_time = now
+
+            write_batch(output, result, args.input_format)
+        sys.exit(0)
+
+    # monotonic, so NTP steps or a changed system time do not produce negative or huge intervals
+    current_time = time.monotonic_ns()
     for line in input_source:
         utilization = float(line.strip())
         if utilization < 0 or utilization > 100:
@@ -229,7 +575,7 @@ if __name__ == '__main__':
 
         if args.energy:
             print(interpolated_predictions[utilization] * args.vhost_ratio * \
-                (time.time_ns() - current_time) / 1_000_000_000, flush=True)
-            current_time = time.time_ns()
+                (time.monotonic_ns() - current_time) / 1_000_000_000, flush=True)
+            current_time = time.monotonic_ns()
         else:
             print(interpolated_predictions[utilization] * args.vhost_ratio, flush=True)